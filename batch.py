@@ -0,0 +1,227 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Produce rankings without the dashboard, e.g. from cron. Every combination of the given years, params, weights and
+# filters is one job; jobs run in a process pool and each one writes its ranking to its own CSV in the output
+# directory as soon as it is done. index.csv in the same directory lists every file written, one line per job, in
+# the order they finished. Run from the project directory, e.g.:
+#     python batch.py --years 2009-2018 --degrees 0-4 --methods single,weighted,combination
+#     python batch.py --methods weighted --weights NPT41_PUB=1,NPT45_PUB=0.2 --weights NPT43_PUB=1 --top 50
+#     python batch.py --methods kscore --profiles normal,controversial
+
+import argparse
+import concurrent.futures
+import csv
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import lib
+
+methods = ["single", "weighted", "combination", "kscore"]
+kscorepath = "./tyresedata/rankings.csv"
+
+# Columns written for each method, after "Our Ranking". Anything not in a ranking is skipped.
+outputColumns = {
+    "single":["US News Ranking", "INSTNM", "UNITID", "HIGHDEG"],
+    "weighted":["US News Ranking", "INSTNM", "UNITID", "aggregateScore"],
+    "combination":["INSTNM", "UNITID", "Combination Count"],
+    "kscore":["INSTNM", "UNITID", "K_SCORE", "Academics", "Affordability", "Diversity", "High-Paying Degrees",
+              "SAT Scores", "Completion Rate (4 Years)"]
+}
+
+# "2009-2011,2015" -> [2009, 2010, 2011, 2015]
+def parseints(text: str) -> list:
+    values = []
+    for part in text.split(","):
+        if "-" in part:
+            lo, hi = part.split("-")
+            values.extend(range(int(lo), int(hi) + 1))
+        elif part:
+            values.append(int(part))
+    return values
+
+# "NPT41_PUB=1,NPT45_PUB=0.2" -> {"NPT41_PUB":1.0, "NPT45_PUB":0.2}
+def parseweights(text: str) -> dict:
+    weights = {}
+    for part in text.split(","):
+        param, weight = part.split("=")
+        if param not in lib.paramsColumns:
+            raise ValueError("Unknown param " + param + ", expected one of " + ", ".join(lib.paramsColumns))
+        weights[param] = float(weight)
+    return weights
+
+# Every job of the grid, each a dict with its method, settings and the name of the file it writes.
+def buildjobs(args) -> list:
+    jobs = []
+    for method in args.methods:
+        if method == "kscore":
+            for profile in args.profiles:
+                jobs.append({"method":method, "profile":profile, "data":args.kscore_data, "top":args.top,
+                             "file":"kscore_" + profile + ".csv"})
+            continue
+
+        for year in args.years:
+            if method == "single":
+                for param in args.params:
+                    for maxDeg in args.degrees:
+                        jobs.append({"method":method, "year":year, "param":param, "maxDeg":maxDeg, "hide":args.hide_outsiders,
+                                     "top":args.top, "file":"single_%d_%s_deg%d.csv" % (year, param, maxDeg)})
+            elif method == "weighted":
+                for i, weights in enumerate(args.weights):
+                    for maxDeg in args.degrees:
+                        jobs.append({"method":method, "year":year, "weights":weights, "maxDeg":maxDeg, "hide":args.hide_outsiders,
+                                     "top":args.top, "file":"weighted_%d_w%d_deg%d.csv" % (year, i, maxDeg)})
+            elif method == "combination":
+                for k in args.k:
+                    jobs.append({"method":method, "year":year, "k":k, "weights":args.combination_weights, "top":args.top,
+                                 "file":"combination_%d_k%d.csv" % (year, k)})
+    return jobs
+
+# The ranking a job asks for.
+def ranking(job: dict) -> pd.DataFrame:
+    if job["method"] == "single":
+        df = lib.getTopNDF(job["top"], job["param"], job["year"], job["maxDeg"], job["hide"])
+        df = lib.joinUSNews(df, job["year"])
+        return df[["Our Ranking"] + [column for column in outputColumns["single"] + [job["param"]] if column in df.columns]]
+    if job["method"] == "weighted":
+        df = lib.getWeightedTopNDF(job["top"], job["weights"], job["year"], job["maxDeg"], job["hide"])
+        df = lib.joinUSNews(df, job["year"])
+        return df[["Our Ranking"] + [column for column in outputColumns["weighted"] + list(job["weights"].keys()) if column in df.columns]]
+    if job["method"] == "combination":
+        df = lib.combinationRanking(job["year"], job["k"], job["weights"])
+    else:
+        full = lib.getdataset("kscore " + job["data"], lambda: pd.read_csv(job["data"], low_memory=False))
+        df = lib.kscore(lib.kscoreCandidates(full), job["profile"])
+        df = df.sort_values(by="K_SCORE", ascending=False, kind="stable")
+        df["Our Ranking"] = np.arange(start=1, stop=len(df.index) + 1, dtype=int)
+    if job["top"] != 0:
+        df = df.head(job["top"])
+    return df[["Our Ranking"] + [column for column in outputColumns[job["method"]] if column in df.columns]]
+
+# Run one job and write its ranking to out. The file is written under a temporary name and moved into place, so a
+# file in out is always complete. Runs in a worker process; the data is loaded once per process.
+def runjob(job: dict, out: str) -> dict:
+    start = time.perf_counter()
+    lib.loadschema()
+    df = ranking(job)
+    path = os.path.join(out, job["file"])
+    tmpfile = lib.tempname(path)
+    df.to_csv(tmpfile, index=False)
+    os.replace(tmpfile, path)
+    return {"rows":len(df.index), "seconds":time.perf_counter() - start}
+
+# A job as a line of index.csv.
+def indexrow(job: dict, result: dict) -> dict:
+    settings = {key:job[key] for key in job.keys() if key not in ["method", "file", "data"]}
+    if "weights" in settings:
+        settings["weights"] = ",".join(str(weight) for weight in settings["weights"]) if isinstance(settings["weights"], list) \
+            else ",".join(key + "=" + str(settings["weights"][key]) for key in settings["weights"].keys())
+    return {"file":job["file"], "method":job["method"], "settings":" ".join(key + "=" + str(settings[key]) for key in settings.keys()),
+            "rows":result["rows"], "seconds":"%.3f" % result["seconds"]}
+
+# Run every job, workers at a time, and record each one in index.csv as it finishes. Returns the number of jobs that
+# failed.
+def runjobs(jobs: list, out: str, workers: int) -> int:
+    failed = 0
+    start = time.perf_counter()
+    with open(os.path.join(out, "index.csv"), "w", newline="") as f:
+        index = csv.DictWriter(f, fieldnames=["file", "method", "settings", "rows", "seconds"])
+        index.writeheader()
+
+        done = 0
+        def finished(job, result):
+            nonlocal done, failed
+            done += 1
+            try:
+                result = result()
+            except Exception as e:
+                failed += 1
+                print("[batch] %4d/%d  %-40s failed: %r" % (done, len(jobs), job["file"], e), file=sys.stderr)
+                return
+            index.writerow(indexrow(job, result))
+            f.flush()
+            print("[batch] %4d/%d  %-40s %7d rows  %6.2f s" % (done, len(jobs), job["file"], result["rows"], result["seconds"]))
+
+        if workers == 1:
+            for job in jobs:
+                finished(job, lambda: runjob(job, out))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(runjob, job, out):job for job in jobs}
+                for future in concurrent.futures.as_completed(futures):
+                    finished(futures[future], future.result)
+    print("[batch] %d jobs, %d failed, in %.2f s" % (len(jobs), failed, time.perf_counter() - start))
+    return failed
+
+def parseargs(argv: list = None):
+    parser = argparse.ArgumentParser(description="Write College Scorecard rankings to CSV files without starting the dashboard.")
+    parser.add_argument("--methods", type=lambda text: text.split(","), default=["single", "weighted"],
+                        help="comma separated, from " + ", ".join(methods) + " (default single,weighted)")
+    parser.add_argument("--years", type=parseints, default=list(range(lib.yearStart, lib.yearEnd + 1)),
+                        help="e.g. 2009-2018 or 2015,2018 (default every year)")
+    parser.add_argument("--params", type=lambda text: text.split(","), default=lib.paramsColumns,
+                        help="params to rank by one at a time (default all)")
+    parser.add_argument("--weights", type=parseweights, action="append",
+                        help="a weight set for the weighted ranking, e.g. NPT41_PUB=1,NPT45_PUB=0.2; repeat for more "
+                             "(default every param at 0.5)")
+    parser.add_argument("--degrees", type=parseints, default=[0],
+                        help="highest degree filters, " + ", ".join("%d %s" % (lib.highestDegNice[key], key) for key in lib.highestDegNice.keys()) + " (default 0)")
+    parser.add_argument("--hide-outsiders", action="store_true", help="leave out schools US News did not rank")
+    parser.add_argument("--top", type=int, default=0, help="keep the top N of each ranking (default 0, all)")
+    parser.add_argument("--k", type=parseints, default=[10], help="top-k values for the combination count (default 10)")
+    parser.add_argument("--combination-weights", type=lambda text: [float(weight) for weight in text.split(",")],
+                        help="one weight per combination feature, in order (default 1 each)")
+    parser.add_argument("--profiles", type=lambda text: text.split(","), default=["normal"],
+                        help="K-score profiles, from " + ", ".join(lib.kscoreProfiles.keys()) + " (default normal)")
+    parser.add_argument("--kscore-data", default=kscorepath, help="data for the K-score (default " + kscorepath + ")")
+    parser.add_argument("--out", default="./rankings/", help="output directory (default ./rankings/)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default one per CPU)")
+    args = parser.parse_args(argv)
+
+    for method in args.methods:
+        if method not in methods:
+            parser.error("unknown method " + method)
+    for param in args.params:
+        if param not in lib.paramsColumns:
+            parser.error("unknown param " + param)
+    for profile in args.profiles:
+        if profile not in lib.kscoreProfiles:
+            parser.error("unknown K-score profile " + profile)
+    for year in args.years:
+        if year < lib.yearStart or year > lib.yearEnd:
+            parser.error("no data for %d" % year)
+    for maxDeg in args.degrees:
+        if maxDeg not in lib.highestDegNice.values():
+            parser.error("bad highest degree %d, expected one of %s" % (maxDeg, ", ".join(str(value) for value in lib.highestDegNice.values())))
+    if args.top < 0:
+        parser.error("bad value for --top: %d, expected 0 (all) or more" % args.top)
+    for k in args.k:
+        if k < 1:
+            parser.error("bad value for --k: %d, expected 1 or more" % k)
+    if args.weights is None:
+        args.weights = [{column:0.5 for column in lib.paramsColumns}]
+    features = len(lib.combinationColumns) - 2 # Everything but UNITID and INSTNM.
+    if args.combination_weights is None:
+        args.combination_weights = [1.0] * features
+    elif len(args.combination_weights) != features:
+        parser.error("--combination-weights needs %d weights" % features)
+    return args
+
+def main(argv: list = None) -> int:
+    args = parseargs(argv)
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+
+    # Load (and if needed rebuild) the cache once, before the workers start reading it.
+    lib.loadschema()
+    jobs = buildjobs(args)
+    workers = args.workers if args.workers is not None else (os.cpu_count() or 1)
+    workers = max(1, min(workers, len(jobs)))
+    return 1 if runjobs(jobs, args.out, workers) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
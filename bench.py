@@ -0,0 +1,394 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Benchmarks for the hot paths in lib. Every benchmark runs on generated College Scorecard, US News and K-score data
+# with the real column layout, at 1x, 10x and 100x the ~1,500 schools a year of the real data. Each function is
+# timed, and its peak memory is measured with tracemalloc in a separate run. The results are written as JSON so runs
+# can be compared between commits. Run from the project directory:
+#     python bench.py --scales 1,10,100 --out bench_results.json
+#     python bench.py --scales 1 --compare bench_results.json
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import lib
+
+# Schools per year in the generated data at 1x.
+baseRows = 1500
+# Share of the schools US News ranks.
+usnewsShare = 0.13
+
+# Columns of the generated raw Scorecard files, in the order of the real files. Besides the columns lib reads, a few
+# others are included so the files have to be filtered like the real ones.
+rawColumns = ["UNITID", "OPEID", "OPEID6", "INSTNM", "CITY", "STABBR", "HIGHDEG", "CONTROL", "ADM_RATE", "ACTCM25",
+              "SAT_AVG", "UGDS", "NPT41_PUB", "NPT42_PUB", "NPT43_PUB", "NPT44_PUB", "NPT45_PUB", "COSTT4_A", "PFTFAC",
+              "RET_FT4", "PCTFLOAN", "TRANS_4"]
+
+results = []
+
+# Time fn() over a number of repeats and return the best run in milliseconds.
+def timeit(fn, repeat: int = 5) -> float:
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000.0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+# Time fn and measure its peak memory, record the result and print it. setup, if given, runs before every call and is
+# not timed (e.g. to clear a cache). Repeats are halved at 100x.
+def measure(name: str, scale: int, rows: int, fn, repeat: int = 5, setup = None):
+    if scale >= 100:
+        repeat = max(1, repeat // 2)
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        times.append(timeit(fn, 1))
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {"name":name, "scale":scale, "rows":rows, "repeat":repeat, "best_ms":min(times),
+              "median_ms":statistics.median(times), "peak_kib":peak / 1024.0}
+    results.append(result)
+    print("%-28s x%-4d %8d rows  %10.2f ms  %10.2f ms median  %10.0f KiB peak"
+          % (name, scale, rows, result["best_ms"], result["median_ms"], result["peak_kib"]))
+
+
+# Write a raw Scorecard file per year, the US News workbook and the K-score data for scale x baseRows schools into
+# directory, laid out like the real data. Returns the paths, for useData.
+def makeData(directory: str, scale: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    n = baseRows * scale
+    unitids = np.sort(rng.choice(np.arange(100000, 100000 + 40 * n), size=n, replace=False))
+    names = np.array(["Synthetic College %d" % unitid for unitid in unitids], dtype=object)
+
+    paths = {"scard":{}, "usnews":os.path.join(directory, "usnews.xlsx"), "kscore":os.path.join(directory, "kscore.csv")}
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        # Each school's params follow a quality score that changes a little from year to year.
+        quality = rng.normal(0.0, 1.0, n)
+        net = 9000 + 4000 * quality
+        data = {
+            "UNITID":unitids,
+            "OPEID":["%08d" % (unitid * 7 % 10**8) for unitid in unitids],
+            "OPEID6":["%06d" % (unitid * 7 % 10**6) for unitid in unitids],
+            "INSTNM":names,
+            "CITY":rng.choice(["Springfield", "Fairview", "Franklin", "Riverside"], n),
+            "STABBR":rng.choice(["AL", "CA", "NY", "TX", "WA"], n),
+            "HIGHDEG":rng.choice(5, n, p=[0.05, 0.25, 0.25, 0.2, 0.25]),
+            "CONTROL":rng.integers(1, 4, n),
+            "ADM_RATE":np.clip(0.7 - 0.2 * quality + rng.normal(0, 0.1, n), 0.03, 1.0),
+            "ACTCM25":np.round(np.clip(20 + 4 * quality, 12, 35)),
+            "SAT_AVG":np.round(np.clip(1050 + 150 * quality, 700, 1580)),
+            "UGDS":rng.integers(100, 40000, n),
+            "COSTT4_A":np.round(np.clip(25000 + 15000 * quality + rng.normal(0, 3000, n), 5000, 80000)),
+            "PFTFAC":np.clip(0.6 + 0.1 * quality, 0.0, 1.0),
+            "RET_FT4":np.clip(0.75 + 0.1 * quality, 0.0, 1.0),
+            "PCTFLOAN":np.clip(0.45 - 0.1 * quality, 0.0, 1.0),
+            "TRANS_4":np.clip(0.15 - 0.05 * quality, 0.0, 1.0)
+        }
+        for i, column in enumerate(["NPT41_PUB", "NPT42_PUB", "NPT43_PUB", "NPT44_PUB", "NPT45_PUB"]):
+            data[column] = np.round(net + 2500 * i + rng.normal(0, 1500, n))
+        df = pd.DataFrame(data)[rawColumns]
+
+        # Blank and suppressed values, as in the real files.
+        for column in rawColumns[rawColumns.index("ADM_RATE"):]:
+            blank = rng.random(n) < (0.35 if column in ["ADM_RATE", "ACTCM25", "SAT_AVG"] else 0.1)
+            df[column] = df[column].astype(object)
+            df.loc[blank, column] = rng.choice(["", "NULL", "PrivacySuppressed"], int(blank.sum()))
+        paths["scard"][year] = os.path.join(directory, "MERGED%d_%02d_PP.csv" % (year, (year + 1) % 100))
+        df.to_csv(paths["scard"][year], index=False)
+
+    # US News ranks about usnewsShare of the schools, though not every one of them every year.
+    ranked = rng.choice(n, int(n * usnewsShare), replace=False)
+    workbook = pd.DataFrame({"University Name":names[ranked], "UNITID":unitids[ranked]})
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        ranks = np.arange(1, len(ranked) + 1, dtype=float)
+        rng.shuffle(ranks)
+        ranks[rng.random(len(ranked)) < 0.1] = np.nan
+        workbook[year] = ranks
+    workbook.to_excel(paths["usnews"], index=False)
+
+    # The K-score data: one row per school with the columns lib.kscore reads.
+    kscore = {"INSTNM":names, "UNITID":unitids}
+    for column in lib.kscoreColumns["degrees"] + lib.kscoreColumns["diversity"] + [lib.kscoreColumns["hispanic"]]:
+        kscore[column] = rng.uniform(0.0, 0.3, n)
+    for column in lib.kscoreColumns["offers"]:
+        kscore[column] = rng.integers(0, 3, n)
+    kscore[lib.kscoreColumns["admissionRate"]] = rng.uniform(0.03, 0.3, n)
+    kscore[lib.kscoreColumns["satAvg"]] = rng.uniform(1000, 1580, n)
+    kscore[lib.kscoreColumns["satMath"]] = rng.uniform(500, 800, n)
+    kscore[lib.kscoreColumns["satRead"]] = rng.uniform(500, 800, n)
+    kscore[lib.kscoreColumns["cost"]] = rng.uniform(15000, 80000, n)
+    completion = rng.uniform(0.3, 0.95, n).astype(str).astype(object)
+    completion[rng.random(n) < 0.1] = "PrivacySuppressed"
+    kscore[lib.kscoreColumns["completion"]] = completion
+    pd.DataFrame(kscore).to_csv(paths["kscore"], index=False)
+    return paths
+
+# Point lib at the data written by makeData, with its cache in directory, and load it. Returns what restoreData
+# needs to put the real data back.
+def useData(paths: dict, directory: str) -> dict:
+    saved = {"datastore":lib.datastore, "cachepath":lib.cachepath}
+    lib.datastore = {"scard":paths["scard"], "usnews":paths["usnews"]}
+    lib.cachepath = os.path.join(directory, "cache") + os.sep
+    lib.datasets.clear()
+    lib.dataloaders.clear()
+    lib.loadschema(reload=True)
+    return saved
+
+def restoreData(saved: dict):
+    lib.datastore = saved["datastore"]
+    lib.cachepath = saved["cachepath"]
+    lib.datasets.clear()
+    lib.dataloaders.clear()
+    lib.loadschema(reload=True)
+
+
+# loadschema building every cache entry from the raw data, and checking them all against the cache; then reading one
+# year's tables, and every table, from the cache (with and without the shared dataset file, see lib.sharedDataset).
+def benchLoad(scale: int, directory: str):
+    def clear():
+        for name in os.listdir(lib.cachepath):
+            os.remove(os.path.join(lib.cachepath, name))
+    def loadall():
+        for key in lib.dframes.keys():
+            lib.dframes[key]
+    rows = baseRows * scale
+    measure("loadschema cold", scale, rows, lambda: lib.loadschema(reload=True), 1, clear)
+    measure("loadschema warm", scale, rows, lambda: lib.loadschema(reload=True), 3)
+    measure("load one year", scale, rows, lambda: lib.getTopNDF(10, lib.paramsColumns[0], lib.yearEnd, 0, True), 3,
+            lambda: lib.loadschema(reload=True))
+    measure("load every year", scale, rows, loadall, 3, lambda: lib.loadschema(reload=True))
+    # The same, with each year read from its own cache file instead of the shared dataset file.
+    shared = lib.sharedDataset
+    def unshared():
+        lib.sharedDataset = False
+        lib.loadschema(reload=True)
+    measure("load every year unshared", scale, rows, loadall, 3, unshared)
+    lib.sharedDataset = shared
+    lib.loadschema(reload=True)
+
+# Reading every cached table back with each cache backend.
+def benchCacheFormats(scale: int, directory: str):
+    tables = dict(lib.dframes)
+    for fmt in lib.cacheext.keys():
+        files = {}
+        for key in tables.keys():
+            files[key] = os.path.join(directory, "format" + str(key) + lib.cacheext[fmt])
+            lib.writecache(tables[key], files[key], fmt)
+
+        def loadall():
+            for key in files.keys():
+                lib.readcache(files[key], fmt)
+
+        measure("read cache " + fmt, scale, sum(len(table.index) for table in tables.values()), loadall)
+
+# Page 1's single param ranking: the full list, a top 50, a top 50 of the schools US News ranks, and a top 50 of a
+# column with no prebuilt order (argpartition).
+def benchTopN(scale: int, directory: str):
+    param = lib.paramsColumns[0]
+    rows = len(lib.dframes[lib.yearEnd].index)
+    measure("getTopNDF all", scale, rows, lambda: lib.getTopNDF(0, param, lib.yearEnd, 0, False))
+    measure("getTopNDF top 50", scale, rows, lambda: lib.getTopNDF(50, param, lib.yearEnd, 0, False))
+    measure("getTopNDF top 50 hidden", scale, rows, lambda: lib.getTopNDF(50, param, lib.yearEnd, 0, True))
+    measure("getTopNDF top 50 ad hoc", scale, rows, lambda: lib.getTopNDF(50, param, lib.yearEnd, 0, False, not lib.lowerIsBetter[param]))
+
+# The per-school loop page 2 used before lib.weightedRankDF, kept to compare against.
+def legacyWeightedRankDF(df: pd.DataFrame, param: dict, maxDeg: int) -> pd.DataFrame:
+    weightsTotal = 0.000001
+    for key in param.keys():
+        weightsTotal += param[key]
+
+    df = df[ (df["HIGHDEG"] >= maxDeg) ].copy()
+    for column in lib.paramsColumns:
+        df[column] = (df[column] - df[column].min()) / (df[column].max() - df[column].min())
+    for column in param.keys():
+        if not lib.lowerIsBetter[column]:
+            df[column] = 1.0 - df[column]
+
+    ourRankDF = pd.DataFrame({
+        "INSTNM":df["INSTNM"],
+        "UNITID":df["UNITID"],
+        "aggregateScore":[0.0]*df["INSTNM"].count()
+    })
+    for column in param.keys():
+        ourRankDF[column] = df[column]
+
+    for school in df["UNITID"]:
+        aggScoreNum = 0.0
+        for key in param.keys():
+            aggScoreNum += param[key] * df.query("UNITID==" + str(school))[key]
+        ourRankDF.loc[ourRankDF.eval("UNITID==" + str(school)), "aggregateScore"] = aggScoreNum / weightsTotal
+
+    ourRankDF = ourRankDF.sort_values("aggregateScore", ascending=True)
+    ourRankDF["Our Ranking"] = np.arange(start=1, stop=df["INSTNM"].count() + 1, step=1).tolist()
+    return ourRankDF
+
+# Page 2's weighted ranking (its getTopNDF), with the normalized params computed from scratch and from the cache. The
+# old loop is only timed at 1x, where it is also checked to give the same result.
+def benchWeightedRank(scale: int, directory: str):
+    weights = {column:0.5 for column in lib.paramsColumns}
+    base = lib.dframes[lib.yearEnd]
+    rows = len(base.index)
+    if scale == 1:
+        pd.testing.assert_frame_equal(legacyWeightedRankDF(base, weights, 0), lib.weightedRankDF(base, weights, 0), check_dtype=False)
+        measure("weighted legacy loop", scale, rows, lambda: legacyWeightedRankDF(base, weights, 0), 1)
+
+    def clear():
+        with lib.normalizedlock:
+            lib.normalizedcache.clear()
+    measure("getWeightedTopNDF cold", scale, rows, lambda: lib.getWeightedTopNDF(0, weights, lib.yearEnd, 0, False), 5, clear)
+    lib.getWeightedTopNDF(0, weights, lib.yearEnd, 0, False)
+    measure("getWeightedTopNDF cached", scale, rows, lambda: lib.getWeightedTopNDF(0, weights, lib.yearEnd, 0, False))
+
+# The weight sensitivity engine on 1000 perturbed weight vectors. Its rank histograms grow with the square of the
+# number of schools, so it is only run at 1x.
+def benchSensitivity(scale: int, directory: str):
+    if scale != 1:
+        return
+    weights = {column:0.5 for column in lib.paramsColumns}
+    rows = len(lib.dframes[lib.yearEnd].index)
+    measure("weightSensitivity", scale, rows, lambda: lib.weightSensitivity(weights, lib.yearEnd, 0, 1000, workers=1), 1)
+    measure("weightSensitivity bootstrap", scale, rows,
+            lambda: lib.weightSensitivity(weights, lib.yearEnd, 0, 1000, bootstrap=True, workers=1), 1)
+
+# Attaching US News rankings to every school, for one year and for all years at once; compiling the workbook, and
+# looking up one school at a time.
+def benchUSNewsJoin(scale: int, directory: str):
+    table = lib.getTopNDF(0, lib.paramsColumns[0], lib.yearEnd, 0, False)[["Our Ranking", "INSTNM", "UNITID"]]
+    years = range(lib.yearStart, lib.yearEnd + 1)
+    measure("joinUSNews 1 year", scale, len(table.index), lambda: lib.joinUSNews(table, lib.yearEnd))
+    measure("joinUSNews all years", scale, len(table.index), lambda: lib.joinUSNews(table, years))
+    unitids = table["UNITID"].tolist()
+    measure("compile US News", scale, len(lib.getUSNews()["unitids"]), lambda: lib.compileusnews(lib.datastore["usnews"]), 1)
+    measure("usnewsRank per school", scale, len(unitids), lambda: [lib.usnewsRank(unitid, lib.yearEnd) for unitid in unitids])
+
+# Pages 1 and 2's dumbbell plot of every school (WebGL at this size), drawn as SVG to compare, and a memoized rerun.
+def benchCharts(scale: int, directory: str):
+    table = lib.getTopNDF(0, lib.paramsColumns[0], lib.yearEnd, 0, False)[["Our Ranking", "INSTNM", "UNITID"]]
+    table = lib.joinUSNews(table.rename(columns={"INSTNM":"University Name"}), lib.yearEnd)
+    rows = len(table.index)
+    measure("dumbbellFigure", scale, rows, lambda: lib.dumbbellFigure(table))
+    threshold = lib.webglThreshold
+    lib.webglThreshold = rows + 1
+    try:
+        measure("dumbbellFigure svg", scale, rows, lambda: lib.dumbbellFigure(table))
+    finally:
+        lib.webglThreshold = threshold
+    lib.chartFigure("bench dumbbell", (scale,), lambda: lib.dumbbellFigure(table))
+    measure("chartFigure memoized", scale, rows, lambda: lib.chartFigure("bench dumbbell", (scale,), lambda: lib.dumbbellFigure(table)))
+
+# The cross-year panel: building it, and each kind of query. Its rank layer holds every year, param and degree
+# filter, so it is only run up to 10x.
+def benchPanel(scale: int, directory: str):
+    if scale > 10:
+        return
+    param = lib.paramsColumns[0]
+    rows = len(lib.getPanel()["unitids"])
+    measure("buildpanel", scale, rows, lib.buildpanel, 1)
+    measure("rankTrajectories", scale, rows, lambda: lib.rankTrajectories(param))
+    measure("rankDeltas", scale, rows, lambda: lib.rankDeltas("usnews"))
+    measure("aggregateRanking", scale, rows, lambda: lib.aggregateRanking(param))
+
+# Page 3: the top-k positions, one Combination Count ranking (calcCombinationCount), a sweep of k = 10..100, and the
+# heatmap normalization (normalize), labels and colors.
+def benchCombinationCount(scale: int, directory: str):
+    df = lib.getColumnSet(lib.yearEnd, "combination")
+    features = [column for column in df.columns if column not in ["UNITID", "INSTNM"]]
+    weights = [1.0] * len(features)
+    positions = lib.topKPositions(df, features)
+    rows = len(df.index)
+    measure("topKPositions", scale, rows, lambda: lib.topKPositions(df, features))
+    ranking = lib.combinationRanking(lib.yearEnd, 10, weights)
+    measure("combinationRanking", scale, rows, lambda: lib.combinationRanking(lib.yearEnd, 10, weights))
+    measure("combinationCountSweep", scale, rows, lambda: lib.combinationCountSweep(positions, weights))
+    ranking = ranking.drop(columns=["Our Ranking"])
+    measure("normalizeCombination", scale, rows, lambda: lib.normalizeCombination(ranking))
+    heatmap = lib.normalizeCombination(ranking)
+    measure("heatmapLabels", scale, rows, lambda: lib.heatmapLabels(heatmap))
+    measure("heatmapColors", scale, rows, lambda: lib.heatmapColors(heatmap))
+
+# Page 4's K-score (rank_normal and rank_controversial), and picking the schools it scores.
+def benchKScore(scale: int, directory: str):
+    full = pd.read_csv(os.path.join(directory, "kscore.csv"), low_memory=False)
+    workSet = lib.kscoreCandidates(full)
+    measure("kscoreCandidates", scale, len(full.index), lambda: lib.kscoreCandidates(full))
+    measure("kscore normal", scale, len(workSet.index), lambda: lib.kscore(workSet, "normal"))
+    measure("kscore controversial", scale, len(workSet.index), lambda: lib.kscore(workSet, "controversial"))
+
+benchmarks = [benchLoad, benchCacheFormats, benchTopN, benchWeightedRank, benchSensitivity, benchUSNewsJoin, benchCharts,
+              benchPanel, benchCombinationCount, benchKScore]
+
+
+# Run every benchmark on data generated at the given scale. The real data is loaded again afterwards.
+def runscale(scale: int, seed: int = 0):
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        paths = makeData(directory, scale, seed)
+        print("[bench] Generated x%d data in %.2f s" % (scale, time.perf_counter() - start))
+        saved = useData(paths, directory)
+        try:
+            for benchmark in benchmarks:
+                benchmark(scale, directory)
+        finally:
+            restoreData(saved)
+
+# Where the results came from, so runs can be told apart.
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit":commit, "python":platform.python_version(), "numpy":np.__version__, "pandas":pd.__version__,
+            "machine":platform.machine(), "cpus":os.cpu_count(), "time":time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+# Print how every result compares with the same benchmark in an earlier results file.
+def compare(path: str):
+    with open(path) as f:
+        before = {(result["name"], result["scale"]):result for result in json.load(f)["results"]}
+    print("%-28s %-5s %12s %12s %8s %10s" % ("benchmark", "scale", "before ms", "after ms", "time", "peak"))
+    for result in results:
+        old = before.get((result["name"], result["scale"]))
+        if old is None:
+            continue
+        print("%-28s x%-4d %12.2f %12.2f %7.2fx %9.2fx" % (result["name"], result["scale"], old["best_ms"], result["best_ms"],
+              result["best_ms"] / old["best_ms"] if old["best_ms"] else np.nan,
+              result["peak_kib"] / old["peak_kib"] if old["peak_kib"] else np.nan))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lib on generated data.")
+    parser.add_argument("--scales", default="1,10,100", help="comma separated multiples of %d schools a year (default 1,10,100)" % baseRows)
+    parser.add_argument("--out", default="bench_results.json", help="where to write the results (default bench_results.json)")
+    parser.add_argument("--compare", help="an earlier results file to compare with")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated data (default 0)")
+    args = parser.parse_args()
+
+    for scale in [int(scale) for scale in args.scales.split(",")]:
+        runscale(scale, args.seed)
+
+    with open(args.out, "w") as f:
+        json.dump({"environment":environment(), "results":results}, f, indent=1)
+    print("[bench] Wrote %d results to %s" % (len(results), args.out))
+    if args.compare:
+        compare(args.compare)
+
+if __name__ == "__main__":
+    main()
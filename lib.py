@@ -1,5 +1,17 @@
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
+import mmap
 import numpy as np
 import os
+import sys
+import threading
+import time
+import tracemalloc
 from pandas import DataFrame
 import pandas as pd
 
@@ -22,14 +34,244 @@ datastore = {
         2017:scardpath+"MERGED2017_18_PP.csv",
         2018:scardpath+"MERGED2018_19_PP.csv"
     },
-    "usnews":usnewspath+"USnews_ranking_1984_2023.xlsx"
+    "usnews":usnewspath+"USnews_ranking_1984_2023.xlsx",
+    # Ranks by school name only, no UNITID; used to fill in ranks the main workbook is missing. See compileusnews.
+    "usnewsExtra":usnewspath+"US_News_ranking_2013_2023.xlsx"
     }
 
 yearStart = 2009
 yearEnd = 2018
 
-# Stores the data loaded from disk:
-dframes = {}
+# How much memory (in bytes) the tables loaded into dframes may take before the least recently used ones are dropped.
+# Set with RANKING_MEMORY_BUDGET, in MiB.
+tableBudget = int(float(os.environ.get("RANKING_MEMORY_BUDGET", "512")) * 2**20)
+
+# The tables of dframes: every year's College Scorecard table, keyed by the year, and every year's US News table, keyed
+# by "usnews" and the year. A table is read from the cache the first time it is asked for, and kept until the loaded
+# tables take more than tableBudget, at which point the least recently used are dropped (to be read again when next
+# asked for). Everything worked out from a table, like its rank orders, goes with it. The key of every table that can
+# be loaded is known up front, so "in" and iterating over the keys don't load anything.
+class YearTables(collections.abc.Mapping):
+    def __init__(self):
+        self.loaders = {}
+        self.tables = collections.OrderedDict()
+        self.counters = {"hits":0, "misses":0, "evictions":0}
+
+    # Start over with the given loaders (key -> function returning the table), dropping every loaded table.
+    def reset(self, loaders: dict):
+        with loadlock:
+            for key in list(self.tables.keys()):
+                self.drop(key)
+            self.loaders = dict(loaders)
+
+    def __getitem__(self, key):
+        with loadlock:
+            if key in self.tables:
+                self.counters["hits"] += 1
+                self.tables.move_to_end(key)
+                return self.tables[key]
+            if key not in self.loaders:
+                raise KeyError(key)
+
+            self.counters["misses"] += 1
+            with span("load " + str(key)):
+                self.tables[key] = self.loaders[key]()
+            self.evict(key)
+            if not isinstance(key, str):
+                printmemoryreport(memoryReport())
+            return self.tables[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.loaders
+
+    def __iter__(self):
+        return iter(list(self.loaders.keys()))
+
+    def __len__(self) -> int:
+        return len(self.loaders)
+
+    # Bytes taken by a loaded table and everything kept for it.
+    def size(self, key) -> int:
+        if isinstance(key, str):
+            return tablebytes(self.tables[key])
+        total = tablebytes(scorecard[key]) if key in scorecard else 0
+        total += sum(tablebytes(projections[other]) for other in list(projections.keys()) if other[0] == key)
+        total += sum(rankindex[other].nbytes for other in list(rankindex.keys()) if other[0] == key)
+        total += topkindex[key].nbytes if key in topkindex else 0
+        return total
+
+    # Drop least recently used tables until the rest fit in tableBudget. keep (the table just loaded) always stays.
+    def evict(self, keep):
+        sizes = {key:self.size(key) for key in self.tables.keys()}
+        total = sum(sizes.values())
+        for key in list(self.tables.keys()):
+            if total <= tableBudget:
+                break
+            if key != keep:
+                total -= sizes[key]
+                self.drop(key)
+                self.counters["evictions"] += 1
+
+    def drop(self, key):
+        del self.tables[key]
+        if isinstance(key, str):
+            usnewsindex.pop(int(key[len("usnews"):]), None)
+            return
+        scorecard.pop(key, None)
+        for other in [other for other in projections.keys() if other[0] == key]:
+            del projections[other]
+        for other in [other for other in rankindex.keys() if other[0] == key]:
+            del rankindex[other]
+        topkindex.pop(key, None)
+        with normalizedlock:
+            for other in [other for other in normalizedcache.keys() if other[0] == key]:
+                del normalizedcache[other]
+
+    # Hit, miss and eviction counts, with what is loaded now and how much memory it takes. "memory" has the totals of
+    # memoryReport: what the loaded Scorecard tables take as stored and as read.
+    def stats(self) -> dict:
+        with loadlock:
+            keys = list(self.tables.keys())
+            size = sum(self.size(key) for key in keys)
+            report = memoryReport()
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return dict(self.counters, hit_rate=self.counters["hits"] / lookups if lookups else 0.0,
+                    loaded=[str(key) for key in keys], bytes=size, budget=tableBudget,
+                    memory={"bytes":int(report["After"].sum()), "as_read":int(report["Before"].sum())})
+
+# Stores the data loaded from disk, see YearTables. These are loaded once per server process and shared by every
+# session and page, so they must be treated as read-only. Copy a frame before modifying it.
+dframes = YearTables()
+
+# Other data sets shared in the same way, by name, along with the functions that load them. See getdataset.
+datasets = {}
+dataloaders = {}
+
+# Held while anything is being loaded so that concurrent sessions never load the same data twice.
+loadlock = threading.RLock()
+loaded = False
+
+# Span timing. With RANKING_PROFILE=1 in the environment, every stage wrapped in span() (or a function decorated with
+# timed()) is timed; with RANKING_PROFILE=memory, its tracemalloc peak above what was allocated when it started is
+# recorded too. Spans nest. Each finished span is appended as a JSON line to RANKING_PROFILE_LOG (default
+# ./profile.jsonl). A page marks a rerun with startrun() and endrun(), and profilePanel() shows that rerun's spans
+# in the sidebar. Spans are kept per thread, so concurrent sessions don't mix, although tracemalloc's peak is shared
+# by the whole process. When profiling is off, a span costs one check.
+profileMode = os.environ.get("RANKING_PROFILE", "").lower()
+profiling = profileMode not in ["", "0", "false", "no"]
+profileMemory = profileMode == "memory"
+profileLog = os.environ.get("RANKING_PROFILE_LOG", "./profile.jsonl")
+
+spanlocal = threading.local()
+spanloglock = threading.Lock()
+
+def spanstate():
+    if not hasattr(spanlocal, "stack"):
+        spanlocal.stack = []
+        spanlocal.records = []
+        spanlocal.run = None
+        spanlocal.page = None
+    return spanlocal
+
+def writespans(records: list):
+    if not records:
+        return
+    with spanloglock:
+        with open(profileLog, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+@contextlib.contextmanager
+def span(name: str):
+    if not profiling:
+        yield
+        return
+
+    state = spanstate()
+    if profileMemory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    entry = {"name":name, "peak":0, "base":0}
+    if profileMemory:
+        entry["base"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    state.stack.append(entry)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000.0
+        state.stack.pop()
+        record = {"time":time.time(), "pid":os.getpid(), "run":state.run, "page":state.page, "span":name,
+                  "path":"/".join([parent["name"] for parent in state.stack] + [name]), "depth":len(state.stack), "ms":elapsed}
+        if profileMemory:
+            # A nested span resets the peak, so the highest peak seen by any child counts as well.
+            peak = max(entry["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak_kib"] = max(0, peak - entry["base"]) / 1024.0
+            if state.stack:
+                state.stack[-1]["peak"] = max(state.stack[-1]["peak"], peak)
+        state.records.append(record)
+        if state.run is None and not state.stack:
+            # Not part of a page rerun, e.g. loading from a script: log it straight away.
+            writespans(state.records)
+            state.records = []
+
+# Decorator form of span, named after the function unless a name is given.
+def timed(name: str = None):
+    def decorate(fn):
+        label = name if name is not None else fn.__name__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiling:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Start timing a rerun of a page. Spans until endrun() belong to it.
+def startrun(page: str):
+    if not profiling:
+        return
+    state = spanstate()
+    state.run = "%d-%d-%d" % (os.getpid(), threading.get_ident(), time.time_ns())
+    state.page = page
+    state.records = []
+
+# Finish the rerun: log its spans and return them, in the order they finished.
+def endrun() -> list:
+    if not profiling:
+        return []
+    state = spanstate()
+    records = state.records
+    writespans(records)
+    state.run = None
+    state.page = None
+    state.records = []
+    return records
+
+# The spans of the rerun so far, as a table with the nested ones indented under their parent.
+def spanTable(records: list = None) -> DataFrame:
+    if records is None:
+        records = spanstate().records if profiling else []
+    # Children finish before their parent, so put each span before the ones it contains: order by start time.
+    rows = sorted(records, key=lambda record: record["time"] - record["ms"] / 1000.0)
+    table = pd.DataFrame({
+        "Stage":["\u00a0\u00a0" * record["depth"] + record["span"] for record in rows],
+        "ms":[round(record["ms"], 2) for record in rows]
+    })
+    if profileMemory:
+        table["Peak KiB"] = [round(record.get("peak_kib", 0.0), 1) for record in rows]
+    return table
+
+# Finish the rerun and show where its time went in a collapsible sidebar panel. Does nothing unless profiling.
+def profilePanel():
+    if not profiling:
+        return
+    import streamlit as st
+    records = endrun()
+    with st.sidebar.expander("Timing (%.0f ms)" % sum(record["ms"] for record in records if record["depth"] == 0)):
+        st.dataframe(spanTable(records), use_container_width=True)
+        st.caption("Logged to " + profileLog)
 
 # Lowest maximum degree nice names:
 highestDegNice = {
@@ -65,80 +307,1683 @@ keyColumns = ["INSTNM", "HIGHDEG", "UNITID"]
 # List of every column we will use.
 usecols = paramsColumns + keyColumns
 
-# Remove entries (schools) which don't have the required data. This is done on a per-CSV basis.
-def stripbad(df: DataFrame) -> DataFrame:
-    # Remove institutions where HIGHDEG is empty.
-    df = df[ (df["HIGHDEG"].notnull()) ]
+# Columns used by page 3's Combination Count.
+combinationColumns = ["UNITID", "INSTNM", "NPT42_PUB", "SAT_AVG", "ADM_RATE", "COSTT4_A", "PFTFAC", "TRANS_4", "ACTCM25", "RET_FT4", "PCTFLOAN"]
+
+# Every set of College Scorecard columns the pages use. A single cache per year holds the union of these columns, and
+# each set is served from it with its own filter: "required" lists the columns a school must have data in to be
+# included in that set. Register new sets before the data is loaded, see registerColumns.
+columnSets = {
+    "mobility":{"columns":usecols, "required":["HIGHDEG"] + paramsColumns},
+    "combination":{"columns":combinationColumns, "required":combinationColumns}
+}
+
+# Columns that are read as floats whenever they have blanks, but are whole numbers in every set that requires them,
+# with the narrowest type that holds every value (HIGHDEG is 0 to 4, UNITIDs have six or seven digits).
+integerColumns = {"UNITID":np.int32, "HIGHDEG":np.int8}
+
+# Store the loaded College Scorecard tables in the narrow types of compactframe. Off, they keep the types the cache
+# is read with (float64 numbers, object names), e.g. to compare against.
+compactTables = True
 
-    # Remove institutions where the params we are interested in are blank.
-    for param in paramsColumns:
-        df = df[ (df[param].notnull()) ]
+# The union of every registered column set, which is what gets cached.
+def cachedcolumns() -> list:
+    columns = []
+    for name in columnSets.keys():
+        for column in columnSets[name]["columns"]:
+            if column not in columns:
+                columns.append(column)
+    return columns
 
+# The "required" list of every column set.
+def requiredsets() -> list:
+    return [columnSets[name]["required"] for name in columnSets.keys()]
+
+# Remove entries (schools) which don't have the required data for any of the column sets. The test for every set is
+# combined into a single mask, so the table is only copied once. required defaults to requiredsets().
+def stripbad(df: DataFrame, required: list = None) -> DataFrame:
+    if required is None:
+        required = requiredsets()
+    keep = np.zeros(len(df.index), dtype=bool)
+    for columns in required:
+        keep |= df[columns].notnull().all(axis=1).to_numpy()
+    return df[keep]
+
+# Cache file format. "feather" (Arrow IPC) is read straight into typed columns with no text parsing. "csv" is kept
+# so the cache can still be exported in a human-readable form.
+cacheformat = "feather"
+cacheext = {"feather":".feather", "csv":".csv"}
+
+# Bump this whenever stripbad or the way a cached table is built changes. Every cache entry built by an older version
+# is rebuilt on the next load.
+filterVersion = 3
+
+# Records what every cache entry was built from. Lives in the cache directory.
+manifestname = "manifest.json"
+
+# The last cache report produced by loadschema.
+cachereport = []
+
+# The cached College Scorecard table for each year, holding every registered column set.
+scorecard = {}
+
+# Column sets already pulled out of scorecard, keyed by (year, columns, required). See getColumns.
+projections = {}
+
+# Ranked order of every param for every year and degree filter, see buildrankindex.
+rankindex = {}
+
+# Top-k positions of every year's "combination" set, keyed by year, see yearTopKPositions.
+topkindex = {}
+
+# US News rankings for each year as a Series indexed by UNITID. Built from the compiled matrix on first use, see
+# usnewsRanks.
+usnewsindex = {}
+
+def cachefilename(name: str, fmt: str = None, path: str = None) -> str:
+    if fmt is None:
+        fmt = cacheformat
+    if path is None:
+        path = cachepath
+    return path + name + cacheext[fmt]
+
+# A name to write path under before moving it into place with os.replace. It is unique to the process and thread, so
+# two writers of the same file (batch workers, dashboard processes) never write into each other's temporary file, and a
+# reader only ever sees the old file or the new one, whole.
+def tempname(path: str) -> str:
+    return path + ".%d-%d.tmp" % (os.getpid(), threading.get_ident())
+
+# Write a cached table. The index is never written, so it does not come back as a stray "Unnamed: 0" column. The table
+# is written under a temporary name and moved into place, see tempname.
+def writecache(df: DataFrame, cachefile: str, fmt: str = None):
+    if fmt is None:
+        fmt = cacheformat
+    df = df.reset_index(drop=True)
+    tmpfile = tempname(cachefile)
+    if fmt == "feather":
+        df.to_feather(tmpfile)
+    else:
+        df.to_csv(tmpfile, index=False)
+    os.replace(tmpfile, cachefile)
+
+def readcache(cachefile: str, fmt: str = None, columns: list = None) -> DataFrame:
+    if fmt is None:
+        fmt = cacheformat
+    if fmt == "feather":
+        return pd.read_feather(cachefile, columns=columns)
+    df = pd.read_csv(cachefile, usecols=columns)
+    # Older CSV caches were written with their index.
+    if "Unnamed: 0" in df.columns:
+        df = df.drop(columns=["Unnamed: 0"])
     return df
 
+# Keep only the given columns, in the order they appear in df. Missing columns are an error.
+def selectcolumns(df: DataFrame, columns: list) -> DataFrame:
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise KeyError("Missing columns: " + ", ".join(missing))
+    return df[[column for column in df.columns if column in columns]]
+
+# Size, modification time and SHA-256 of a source file. Hashing a raw Scorecard file takes a few seconds, so the
+# previous hash is reused when the size and mtime have not changed.
+def fingerprint(sourcefile: str, previous: dict = None) -> dict:
+    stat = os.stat(sourcefile)
+    entry = {"path":sourcefile, "size":stat.st_size, "mtime":stat.st_mtime}
+    if previous and previous["path"] == sourcefile and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+        entry["sha256"] = previous["sha256"]
+    else:
+        sha = hashlib.sha256()
+        with open(sourcefile, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        entry["sha256"] = sha.hexdigest()
+    return entry
+
+def loadmanifest(path: str = None) -> dict:
+    if path is None:
+        path = cachepath
+    if not os.path.exists(path + manifestname):
+        return {}
+    with open(path + manifestname) as f:
+        return json.load(f)
+
+# The manifest is written to a temporary file and moved into place so a crash never leaves it half written, and
+# processes saving it at once don't write into the same temporary file, see tempname.
+def savemanifest(manifest: dict, path: str = None):
+    if path is None:
+        path = cachepath
+    tmpfile = tempname(path + manifestname)
+    with open(tmpfile, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmpfile, path + manifestname)
+
+# Work out whether the cache entry called name is up to date. sources lists (source file, build function) pairs in
+# order of preference. The first source file that exists is used, and its build function is called with the file
+# name to produce the table. The entry needs rebuilding if the cache file is missing, or if the source file, the
+# column list or filterVersion differ from what the manifest recorded; "reason" in the returned status says why.
+def cachestatus(name: str, sources: list, columns: list, manifest: dict, path: str = None) -> dict:
+    cachefile = cachefilename(name, path=path)
+    previous = manifest.get(name, {})
+    status = {"name":name, "action":"cached", "reason":"", "source":"", "seconds":0.0,
+              "cachefile":cachefile, "build":None, "entry":None}
+
+    available = [source for source in sources if os.path.exists(source[0])]
+    if not available:
+        if os.path.exists(cachefile):
+            # Nothing to rebuild from, use what we have.
+            status["action"] = "kept"
+            status["reason"] = "no source available"
+            return status
+        raise FileNotFoundError("No source for " + cachefile + ": " + ", ".join(source[0] for source in sources))
+    sourcefile, status["build"] = available[0]
+    status["source"] = sourcefile
+
+    entry = {"source":fingerprint(sourcefile, previous.get("source")), "columns":list(columns), "version":filterVersion}
+    status["entry"] = entry
+    if not os.path.exists(cachefile):
+        status["reason"] = "cache file missing"
+    elif not previous:
+        status["reason"] = "not in manifest"
+    elif previous["version"] != filterVersion:
+        status["reason"] = "filter version changed"
+    elif previous["columns"] != entry["columns"]:
+        status["reason"] = "columns changed"
+    elif previous["source"]["path"] != sourcefile or previous["source"]["sha256"] != entry["source"]["sha256"]:
+        status["reason"] = "source changed"
+    return status
+
+# Rebuild the entry described by status if it needs it (and has not been rebuilt already), record it in the manifest
+# and return the report of what was done.
+def finishcache(status: dict, manifest: dict) -> dict:
+    if status["action"] == "cached" and status["reason"]:
+        start = time.perf_counter()
+        writecache(status["build"](status["source"]), status["cachefile"])
+        status["action"] = "rebuilt"
+        status["seconds"] = time.perf_counter() - start
+    if status["entry"] is not None:
+        manifest[status["name"]] = status["entry"]
+    return {key:status[key] for key in status.keys() if key not in ["cachefile", "build", "entry"]}
+
+def printcachereport(report: list):
+    rebuilt = [entry for entry in report if entry["action"] == "rebuilt"]
+    seconds = sum(entry["seconds"] for entry in rebuilt)
+    print("[cache] Rebuilt %d of %d entries in %.2f s" % (len(rebuilt), len(report), seconds))
+    for entry in rebuilt:
+        print("[cache]     %-12s %-24s %6.2f s  %s" % (entry["name"], entry["reason"], entry["seconds"], entry["source"]))
+    for entry in report:
+        if entry["action"] == "failed":
+            print("[cache]     %-12s failed, not used: %s" % (entry["name"], entry["reason"]))
+
+# True if every value of a float column survives the trip through float32, blanks aside. Prices, SAT and ACT scores
+# are whole numbers well below 2**24 and do; rates and shares with four decimal places don't.
+def exactfloat32(values: pd.Series) -> bool:
+    values = values.to_numpy(dtype=np.float64)
+    return bool(np.all((values.astype(np.float32).astype(np.float64) == values) | np.isnan(values)))
+
+# One categorical type for INSTNM across the given tables, so that every year stores its names as small integer codes
+# into a single shared (sorted) table of names instead of one Python string per row.
+def namesdtype(tables: dict) -> pd.CategoricalDtype:
+    names = pd.concat([tables[key]["INSTNM"] for key in tables.keys()], ignore_index=True)
+    return pd.CategoricalDtype(np.sort(names.dropna().unique()))
+
+# A cached College Scorecard table in narrower types: UNITID (and any other integerColumns without blanks) as its
+# integer type, every float column that exactfloat32 allows as float32, and INSTNM as names. Values, and so every
+# ranking made from them, are unchanged; anything that does arithmetic on a float32 column casts it to float64 first.
+def compactframe(df: DataFrame, names: pd.CategoricalDtype) -> DataFrame:
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column == "INSTNM":
+            values = values.astype(names)
+        elif column in integerColumns and values.notnull().all():
+            values = values.astype(integerColumns[column])
+        elif values.dtype == np.float64 and exactfloat32(values):
+            values = values.astype(np.float32)
+        columns[column] = values
+    return DataFrame(columns)
+
+# Bytes a table takes in memory, strings included. A categorical column counts only its codes, its names being shared
+# (see memoryReport). With wide=True, what it would take in the types it is read with instead: 8 bytes per number,
+# and an object pointer plus a Python string per name.
+def tablebytes(df: DataFrame, wide: bool = False) -> int:
+    total = 0
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            if not wide:
+                total += codes.nbytes
+                continue
+            sizes = np.array([sys.getsizeof(name) for name in values.cat.categories], dtype=np.int64)
+            total += 8 * len(values) + int(sizes[codes[codes >= 0]].sum())
+        elif not wide or values.dtype == object:
+            total += int(values.memory_usage(index=False, deep=True))
+        else:
+            total += 8 * len(values)
+    return total
+
+# Memory taken by the loaded College Scorecard tables, as read ("Before") and as stored ("After"), in bytes. One row
+# per loaded year and one per column set pulled out of it so far, plus the shared name table once.
+def memoryReport() -> DataFrame:
+    rows = []
+    for year in sorted(scorecard.keys()):
+        rows.append({"Table":str(year), "Rows":len(scorecard[year].index), "Before":tablebytes(scorecard[year], True),
+                     "After":tablebytes(scorecard[year])})
+    for key, df in list(projections.items()):
+        name = [setname for setname in columnSets.keys() if (columnSets[setname]["columns"], columnSets[setname]["required"]) == (list(key[1]), list(key[2]))]
+        rows.append({"Table":str(key[0]) + " " + (name[0] if name else "columns"), "Rows":len(df.index),
+                     "Before":tablebytes(df, True), "After":tablebytes(df)})
+    if namestype is not None:
+        rows.append({"Table":"names", "Rows":len(namestype.categories), "Before":0,
+                     "After":int(namestype.categories.memory_usage(deep=True))})
+    return DataFrame(rows, columns=["Table", "Rows", "Before", "After"])
+
+def printmemoryreport(report: DataFrame):
+    before = report["Before"].sum()
+    after = report["After"].sum()
+    print("[memory] Scorecard tables take %.1f MiB, %.1f MiB as read (%.0f%%)" % (after / 2**20, before / 2**20,
+          100.0 * after / before if before else 100.0))
+
+# The US News workbooks are compiled once into a rank matrix, kept in the cache directory as an uncompressed .npz:
+#     years     every year from the first to the last the workbook covers (years it skips are all blank)
+#     unitids   int32, one per school, in workbook order (schools without a UNITID are left out)
+#     names     the school names, as in the workbook
+#     ranks     float32 (schools x years), NaN where US News did not rank the school; stored column by column, so a
+#               year is one contiguous block
+# Bump usnewsVersion whenever the way it is built changes.
+usnewsmatrixname = "usnews.npz"
+usnewsVersion = 1
+
+# The compiled matrix, loaded on first use after each load, see getUSNews.
+usnewsmatrix = None
+
+# Build the rank matrix from the main workbook and, if given, the extra one. The extra workbook has no UNITIDs, so its
+# schools are matched to the main workbook's by name (ignoring surrounding spaces); its ranks only fill in blanks, and
+# schools it has that the main workbook doesn't are left out.
+def compileusnews(workbookfile: str, extrafile: str = None) -> dict:
+    workbook = pd.read_excel(workbookfile)
+    workbook = workbook[ (workbook["UNITID"].notnull()) ].reset_index(drop=True)
+    yearcolumns = [column for column in workbook.columns if isinstance(column, (int, np.integer))]
+    years = np.arange(min(yearcolumns), max(yearcolumns) + 1)
+    ranks = np.full((len(workbook.index), len(years)), np.nan, dtype=np.float32, order="F")
+    for year in yearcolumns:
+        ranks[:, year - years[0]] = workbook[year].to_numpy(dtype=np.float32)
+
+    unmatched = 0
+    if extrafile is not None:
+        extra = pd.read_excel(extrafile)
+        names = workbook["University Name"].astype(str).str.strip()
+        # The extra workbook's name column is whichever text column matches the most names.
+        textcolumns = [column for column in extra.columns if extra[column].dtype == object]
+        namecolumn = max(textcolumns, key=lambda column: extra[column].astype(str).str.strip().isin(names).sum())
+        rows = pd.Series(np.arange(len(names.index)), index=names.to_numpy()).groupby(level=0).first()
+        found = rows.reindex(extra[namecolumn].astype(str).str.strip().to_numpy()).to_numpy()
+        matched = ~np.isnan(found)
+        unmatched = int((~matched).sum())
+        for year in [column for column in extra.columns if isinstance(column, (int, np.integer)) and years[0] <= column <= years[-1]]:
+            column = ranks[:, year - years[0]]
+            values = extra[year].to_numpy(dtype=np.float32)[matched]
+            targets = found[matched].astype(np.int64)
+            blank = np.isnan(column[targets])
+            column[targets[blank]] = values[blank]
+
+    return {
+        "years":years,
+        "unitids":workbook["UNITID"].to_numpy(dtype=np.int32),
+        "names":workbook["University Name"].astype(str).to_numpy(dtype=str),
+        "ranks":ranks,
+        "unmatched":unmatched
+    }
+
+# Write the compiled matrix under a temporary name and move it into place, see tempname.
+def writeusnews(matrix: dict, cachefile: str):
+    tmpfile = tempname(cachefile)
+    with open(tmpfile, "wb") as f:
+        np.savez(f, years=matrix["years"], unitids=matrix["unitids"], names=matrix["names"], ranks=matrix["ranks"])
+    os.replace(tmpfile, cachefile)
+
+# Compile the US News workbooks into the cache if they changed since they were last compiled (or the matrix is missing
+# or was built by another usnewsVersion). Records the workbooks in the manifest under "usnews" and returns a cache
+# report entry like finishcache.
+def buildusnews(manifest: dict) -> dict:
+    cachefile = cachepath + usnewsmatrixname
+    previous = manifest.get("usnews", {})
+    status = {"name":"usnews", "action":"cached", "reason":"", "source":datastore["usnews"], "seconds":0.0}
+    if not os.path.exists(datastore["usnews"]):
+        if os.path.exists(cachefile):
+            status["action"] = "kept"
+            status["reason"] = "no source available"
+            return status
+        raise FileNotFoundError("No source for " + cachefile + ": " + datastore["usnews"])
+
+    files = [datastore["usnews"]]
+    if datastore.get("usnewsExtra") and os.path.exists(datastore["usnewsExtra"]):
+        files.append(datastore["usnewsExtra"])
+    sources = [fingerprint(f, ([entry for entry in previous.get("sources", []) if entry["path"] == f] or [None])[0]) for f in files]
+    entry = {"sources":sources, "version":usnewsVersion}
+    if not os.path.exists(cachefile):
+        status["reason"] = "cache file missing"
+    elif not previous:
+        status["reason"] = "not in manifest"
+    elif previous.get("version") != usnewsVersion:
+        status["reason"] = "version changed"
+    elif [(source["path"], source["sha256"]) for source in previous["sources"]] != [(source["path"], source["sha256"]) for source in sources]:
+        status["reason"] = "source changed"
+
+    if status["reason"]:
+        start = time.perf_counter()
+        matrix = compileusnews(files[0], files[1] if len(files) > 1 else None)
+        writeusnews(matrix, cachefile)
+        status["action"] = "rebuilt"
+        status["seconds"] = time.perf_counter() - start
+        if matrix["unmatched"]:
+            print("[cache] %d schools of %s not found in %s, left out" % (matrix["unmatched"], files[1], files[0]))
+    manifest["usnews"] = entry
+    return status
+
+# The compiled US News rankings: the arrays described above usnewsmatrixname, read-only, plus "rows", which maps each
+# UNITID to its row (the first, should a UNITID appear twice).
+def getUSNews() -> dict:
+    global usnewsmatrix
+    matrix = usnewsmatrix
+    if matrix is not None:
+        return matrix
+
+    loadschema()
+    with loadlock:
+        if usnewsmatrix is None:
+            with np.load(cachepath + usnewsmatrixname, allow_pickle=False) as data:
+                matrix = {key:data[key] for key in ["years", "unitids", "names", "ranks"]}
+            for key in matrix.keys():
+                matrix[key].flags.writeable = False
+            unitids = matrix["unitids"].tolist()
+            matrix["rows"] = dict(zip(reversed(unitids), range(len(unitids) - 1, -1, -1)))
+            usnewsmatrix = matrix
+    return usnewsmatrix
+
+# A whole year of US News ranks, one per school in the order of getUSNews()["unitids"], NaN where unranked. This is a
+# read-only view into the matrix, not a copy.
+def usnewsYear(year: int) -> np.ndarray:
+    matrix = getUSNews()
+    if year < matrix["years"][0] or year > matrix["years"][-1]:
+        raise KeyError(year)
+    return matrix["ranks"][:, year - matrix["years"][0]]
+
+# US News' rank of one school in one year, NaN if it wasn't ranked (or isn't in the workbook, or the year isn't).
+def usnewsRank(unitid: int, year: int) -> float:
+    matrix = getUSNews()
+    row = matrix["rows"].get(unitid)
+    column = year - matrix["years"][0]
+    if row is None or column < 0 or column >= len(matrix["years"]):
+        return np.nan
+    return float(matrix["ranks"][row, column])
+
+# One year of US News rankings as a table of every school in the workbook, ranked that year or not. This is the loader
+# dframes uses for "usnews" and the year.
+def usnewstable(year: int) -> DataFrame:
+    matrix = getUSNews()
+    return pd.DataFrame({
+        "University Name":matrix["names"].astype(object),
+        "US News Ranking":usnewsYear(year).astype(np.float64),
+        "UNITID":matrix["unitids"].astype(np.int64)
+    })
+
+# Several dashboard processes can share one copy of the College Scorecard tables. Every year's table and every
+# registered column set of it, as compactframe stores them, are written to one file in the cache directory, which each
+# process maps into memory read-only. The tables are then made straight from the mapping with no copy, and the
+# operating system keeps the one copy of the file in its page cache for every process that maps it. The file is:
+#     datasetMagic, then the offset and length of the header (little-endian 64-bit integers)
+#     the columns, each a raw little-endian array starting on a multiple of datasetAlign bytes
+#     the header, JSON: what the file was built from ("inputs"), the names INSTNM is coded into, the key column
+#     (UNITID), and for each table ("2018", "2018 mobility", ...) its rows and each column's name, type and offset
+# It is rebuilt whenever a year's cache file or the column sets change, under a temporary name and moved into place,
+# so a process never sees half a file, and one that still has the old file mapped goes on reading it. Where the old
+# file can't be replaced while it is mapped (Windows), loading carries on without it, see loadtables. Off (or with
+# compactTables off), each process reads its own tables from the cache. Set with RANKING_SHARED_DATASET.
+sharedDataset = os.environ.get("RANKING_SHARED_DATASET", "1").lower() not in ["", "0", "false", "no"]
+datasetname = "dataset.bin"
+datasetMagic = b"RANKDS1\n"
+datasetAlign = 64
+# Bump this whenever the way the file is built changes.
+datasetVersion = 1
+
+# The open dataset file: its "header", the "mmap" and the "names" type. None when it is not in use.
+dataset = None
+
+# What the dataset file is built from: the size and modification time of every year's cache file, the column sets and
+# datasetVersion.
+def datasetinputs() -> dict:
+    files = {}
+    year = yearStart
+    while year <= yearEnd:
+        stat = os.stat(cachefilename(str(year)))
+        files[str(year)] = {"size":stat.st_size, "mtime":stat.st_mtime}
+        year += 1
+    return {"files":files, "sets":columnSets, "version":datasetVersion}
+
+# The header of an open dataset file, or None if it isn't one.
+def readdatasetheader(f) -> dict:
+    if f.read(len(datasetMagic)) != datasetMagic:
+        return None
+    offset = int.from_bytes(f.read(8), "little")
+    length = int.from_bytes(f.read(8), "little")
+    f.seek(offset)
+    return json.loads(f.read(length))
+
+# Write the tables given by tables (an iterable of (name, table) pairs, so only one has to be in memory at a time)
+# to a dataset file under a temporary name, and move it into place.
+def writedataset(tables, names: pd.CategoricalDtype, inputs: dict, cachefile: str):
+    header = {"inputs":inputs, "names":names.categories.tolist(), "key":"UNITID", "tables":{}}
+    tmpfile = tempname(cachefile)
+    with open(tmpfile, "wb") as f:
+        f.write(datasetMagic + bytes(16))
+        for name, df in tables:
+            entry = {"rows":len(df.index), "columns":[]}
+            for column in df.columns:
+                values = df[column]
+                coded = isinstance(values.dtype, pd.CategoricalDtype)
+                values = (values.cat.codes if coded else values).to_numpy()
+                values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+                f.write(bytes(-f.tell() % datasetAlign))
+                entry["columns"].append({"name":column, "dtype":values.dtype.str, "offset":f.tell(), "names":coded})
+                f.write(values.tobytes())
+            header["tables"][name] = entry
+        offset = f.tell()
+        text = json.dumps(header).encode()
+        f.write(text)
+        f.seek(len(datasetMagic))
+        f.write(offset.to_bytes(8, "little") + len(text).to_bytes(8, "little"))
+    try:
+        os.replace(tmpfile, cachefile)
+    except OSError:
+        os.remove(tmpfile)
+        raise
+
+# Build the dataset file from the year caches if they changed since it was built (or it is missing, or was built with
+# other column sets or another datasetVersion). Returns a cache report entry like finishcache.
+def builddataset() -> dict:
+    cachefile = cachepath + datasetname
+    status = {"name":"dataset", "action":"cached", "reason":"", "source":cachefile, "seconds":0.0}
+    inputs = datasetinputs()
+    header = None
+    if os.path.exists(cachefile):
+        with open(cachefile, "rb") as f:
+            header = readdatasetheader(f)
+    if not os.path.exists(cachefile):
+        status["reason"] = "cache file missing"
+    elif header is None:
+        status["reason"] = "not a dataset file"
+    elif header["inputs"]["version"] != datasetVersion:
+        status["reason"] = "version changed"
+    elif header["inputs"]["sets"] != inputs["sets"]:
+        status["reason"] = "columns changed"
+    elif header["inputs"]["files"] != inputs["files"]:
+        status["reason"] = "source changed"
+    if not status["reason"]:
+        return status
+
+    start = time.perf_counter()
+    years = [int(year) for year in inputs["files"].keys()]
+    names = namesdtype({year:readcache(cachefilename(str(year)), columns=["INSTNM"]) for year in years})
+    def tables():
+        for year in years:
+            df = compactframe(readcache(cachefilename(str(year))), names)
+            yield str(year), df
+            for name in columnSets.keys():
+                yield str(year) + " " + name, projectcolumns(df, columnSets[name]["columns"], columnSets[name]["required"])
+    writedataset(tables(), names, inputs, cachefile)
+    status["action"] = "rebuilt"
+    status["seconds"] = time.perf_counter() - start
+    return status
+
+# Map a dataset file into memory, read-only. The mapping stays open for as long as any table made from it is in use.
+def opendataset(cachefile: str) -> dict:
+    with open(cachefile, "rb") as f:
+        header = readdatasetheader(f)
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return {"header":header, "mmap":data, "names":pd.CategoricalDtype(header["names"])}
+
+# One table of the open dataset file. Its columns are read-only views into the mapping, not copies.
+def datasettable(name: str) -> DataFrame:
+    entry = dataset["header"]["tables"][name]
+    columns = {}
+    for column in entry["columns"]:
+        values = np.frombuffer(dataset["mmap"], dtype=np.dtype(column["dtype"]), count=entry["rows"], offset=column["offset"])
+        if column["names"]:
+            values = pd.Categorical.from_codes(values, dtype=dataset["names"])
+        columns[column["name"]] = values
+    return DataFrame(columns, copy=False)
+
+# The raw College Scorecard files mark suppressed data with these instead of leaving it blank.
+nullValues = ["PrivacySuppressed", "NULL"]
+
+# Types the raw College Scorecard columns are read as. Any column not listed here is numeric and read as float64.
+rawDtypes = {"UNITID":np.int64, "INSTNM":object, "OPEID":object, "OPEID6":object, "CITY":object, "STABBR":object}
+
+# How many raw rows are read and filtered at a time, and how many processes ingest years in parallel (None means one
+# per CPU).
+ingestChunkRows = 2000
+ingestWorkers = None
+
+def rawdtypes(columns: list) -> dict:
+    return {column:rawDtypes.get(column, np.float64) for column in columns}
+
+# Read one raw College Scorecard file in chunks with explicit types, drop the schools stripbad would drop as each
+# chunk arrives, and write the result to cachefile. Runs in a worker process, so everything it needs is passed in.
+# Returns the rows read and kept and how long it took.
+def ingestyear(year: int, sourcefile: str, cachefile: str, columns: list, required: list) -> dict:
+    start = time.perf_counter()
+    rowsIn = 0
+    parts = []
+    reader = pd.read_csv(filepath_or_buffer=sourcefile, usecols=columns, dtype=rawdtypes(columns),
+                         na_values=nullValues, chunksize=ingestChunkRows)
+    for chunk in reader:
+        rowsIn += len(chunk.index)
+        parts.append(stripbad(chunk, required))
+    df = pd.concat(parts) if parts else pd.DataFrame(columns=columns)
+    writecache(df, cachefile)
+
+    seconds = time.perf_counter() - start
+    size = os.path.getsize(sourcefile)
+    return {"year":year, "rows_in":rowsIn, "rows_out":len(df.index), "bytes":size, "seconds":seconds,
+            "rows_per_s":rowsIn / seconds if seconds > 0 else 0.0, "mb_per_s":size / 1e6 / seconds if seconds > 0 else 0.0}
+
+# Ingest several years of raw College Scorecard data at once, one year per worker process. jobs maps each year to
+# (source file, cache file). Returns the statistics from ingestyear for each year.
+@timed("ingest")
+def ingest(jobs: dict, columns: list, workers: int = None) -> dict:
+    if workers is None:
+        workers = ingestWorkers if ingestWorkers is not None else (os.cpu_count() or 1)
+    workers = max(1, min(workers, len(jobs)))
+    required = requiredsets()
+
+    stats = {}
+    if workers == 1:
+        for year in jobs.keys():
+            stats[year] = ingestyear(year, jobs[year][0], jobs[year][1], columns, required)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {year:pool.submit(ingestyear, year, jobs[year][0], jobs[year][1], columns, required) for year in jobs.keys()}
+            for year in futures.keys():
+                stats[year] = futures[year].result()
+    printingestreport(stats)
+    return stats
+
+def printingestreport(stats: dict):
+    for year in sorted(stats.keys()):
+        entry = stats[year]
+        print("[ingest] %d  %8d rows in  %6d rows out  %7.2f s  %9.0f rows/s  %6.1f MB/s"
+              % (year, entry["rows_in"], entry["rows_out"], entry["seconds"], entry["rows_per_s"], entry["mb_per_s"]))
+
+# Write every table out as CSV, e.g. for inspecting the cache by hand: each year's whole cached College Scorecard
+# table (every column set, so the CSVs can seed a cache, see loadtables) and each year's US News table. The US News
+# CSVs are for export only; nothing reads them back, every US News table comes from the compiled matrix (see
+# buildusnews). path defaults to the cache directory.
+def exportcsv(path: str = None):
+    if path is None:
+        path = cachepath
+    if not os.path.isdir(path):
+        os.mkdir(path)
+    for key in dframes.keys():
+        cachefile = cachefilename(str(key), "csv", path)
+        if isinstance(key, str):
+            writecache(dframes[key], cachefile, "csv")
+        else:
+            writecache(readcache(cachefilename(str(key))), cachefile, "csv")
+        print("Exported " + cachefile)
 
 # Load the data from disk. Initially the entire files are loaded, the required data is pulled out and written to 
-# much smaller "cache" CSVs on disk. The long read only needs to happen once unless the program is modified or the 
-# dataset is updated.
-def loadschema():
+# much smaller "cache" files on disk. The long read only needs to happen once unless the program is modified or the 
+# dataset is updated. The manifest in the cache directory decides which entries are out of date, so only those are
+# rebuilt. When the raw data is not available, a CSV cache of the same name is used as the source instead.
+# The tables are then read from the cache one at a time as they are asked for, see YearTables.
+# The cache is only checked on the first call in a process. Later calls return straight away unless reload is set.
+@timed("loadschema")
+def loadschema(reload: bool = False) -> list:
+    global cachereport
+    global loaded
+
+    if loaded and not reload:
+        return cachereport
+
+    with loadlock:
+        if loaded and not reload:
+            return cachereport
+        report = loadtables()
+        loaded = True
+    return report
+
+def loadtables() -> list:
+    global cachereport
     print("Loading data.")
 
     # Make the cache directory if it does not exist.
     if not os.path.isdir(cachepath):
         os.mkdir(cachepath)
 
-    # Load College Scorecard data for each year.
+    manifest = loadmanifest()
+    report = []
+    # Only the cache is brought up to date here. The tables themselves are read from it when first asked for, see
+    # YearTables.
+    loaders = {}
+
+    # Load College Scorecard data for each year. Years that have to be rebuilt from the raw data are ingested in
+    # parallel first.
+    columns = cachedcolumns()
+    statuses = {}
     year = yearStart
     while year <= yearEnd:
-        cachefile = cachepath + str(year) + ".csv"
-
-        if not os.path.exists(cachefile):
-            # Data is not cached, build our custom stripped tables from scratch.
-            df = pd.read_csv(filepath_or_buffer=datastore["scard"][year], usecols=usecols)
-            df = stripbad(df)
-            df.to_csv(cachefile)
-            print("Loaded " + datastore["scard"][year])
-        # The data is cached, or we just created it. Load it now.
-        dframes[year] = pd.read_csv(cachefile)
-        print("[cache] Loaded " + cachefile)
+        sources = [(datastore["scard"][year], None)]
+        if cacheformat != "csv":
+            sources.append((cachefilename(str(year), "csv"), lambda f: stripbad(selectcolumns(readcache(f, "csv"), columns))))
+        statuses[year] = cachestatus(str(year), sources, columns, manifest)
         year += 1
 
-    # Load US News rankings data.
+    jobs = {}
+    for year in statuses.keys():
+        if statuses[year]["reason"] and statuses[year]["source"] == datastore["scard"][year]:
+            jobs[year] = (datastore["scard"][year], statuses[year]["cachefile"])
+    if jobs:
+        stats = ingest(jobs, columns)
+        for year in stats.keys():
+            statuses[year]["action"] = "rebuilt"
+            statuses[year]["seconds"] = stats[year]["seconds"]
+
+    for year in statuses.keys():
+        report.append(finishcache(statuses[year], manifest))
+        loaders[year] = lambda year=year: loadyear(year)
+
+    # US News rankings data. The workbooks are slow to read, so they are only read to compile them when they change;
+    # every year's table comes from the compiled matrix.
+    report.append(buildusnews(manifest))
     year = yearStart
-    df = pd.read_excel(datastore["usnews"])
     while year <= yearEnd:
-        cachefile = cachepath + "usnews" + str(year) + ".csv"
-        if not os.path.exists(cachefile):
-            # The ranking data has not been cached for the year in question.
-            newDF = pd.DataFrame({
-                "University Name":df["University Name"].to_list(),
-                "US News Ranking":df[year].to_list(),
-                "UNITID":df["UNITID"].to_list()
-            })
-            newDF.to_csv(cachefile)
-            print("Loaded " + datastore["usnews"] + " for " + str(year))
-        # The ranking data is cached, or we just created it. Load it now.
-        dframes["usnews" + str(year)] = pd.read_csv(cachefile)
-        print("[cache] Loaded " + cachefile)
+        loaders["usnews" + str(year)] = lambda year=year: usnewstable(year)
         year += 1
 
-# If n = 0, do not truncate the list.
-def getTopNDF(n: int, param: str, year: int, maxDeg: int, hideOutsiders: bool) -> DataFrame:
+    # The tables every process shares, see sharedDataset.
+    global dataset
+    dataset = None
+    if sharedDataset and compactTables:
+        try:
+            report.append(builddataset())
+            dataset = opendataset(cachepath + datasetname)
+        except OSError as e:
+            # Most likely on Windows, where a file another process has mapped can't be replaced. This process reads
+            # its own tables from the cache instead.
+            report.append({"name":"dataset", "action":"failed", "reason":str(e), "source":cachepath + datasetname, "seconds":0.0})
+
+    savemanifest(manifest)
+    printcachereport(report)
+    global namestype
+    global usnewsmatrix
+    namestype = dataset["names"] if dataset is not None else None
+    usnewsmatrix = None
+    dframes.reset(loaders)
+    scorecard.clear()
+    projections.clear()
+    rankindex.clear()
+    topkindex.clear()
+    usnewsindex.clear()
+    with normalizedlock:
+        normalizedcache.clear()
+    with figurelock:
+        figurecache.clear()
+    cachereport = report
+    return report
+
+# The INSTNM type shared by every year's table (see namesdtype), made from the names in every cached year the first time
+# a year is loaded (or read from the shared dataset file, see sharedDataset).
+namestype = None
+
+# Read a year's College Scorecard table from the cache (or the shared dataset file) into scorecard, and return its
+# "mobility" column set with its rank orders worked out. This is the loader dframes uses for the year.
+def loadyear(year: int) -> DataFrame:
+    global namestype
+    if dataset is not None:
+        # The table and its column sets are all in the shared dataset file.
+        scorecard[year] = datasettable(str(year))
+        for name in columnSets.keys():
+            key = (year, tuple(columnSets[name]["columns"]), tuple(columnSets[name]["required"]))
+            projections[key] = datasettable(str(year) + " " + name)
+    else:
+        df = readcache(cachefilename(str(year)))
+        if compactTables:
+            if namestype is None:
+                namestype = namesdtype({key:readcache(cachefilename(str(key)), columns=["INSTNM"]) for key in dframes.keys() if not isinstance(key, str)})
+            df = compactframe(df, namestype)
+        scorecard[year] = df
+    table = getColumnSet(year, "mobility")
+    rankindex.update(buildrankindex({year:table}))
+    return table
+
+# Serve a set of columns for one year from the cached table, keeping only the schools that have data in every
+# required column (all of columns, if required is not given). Columns keep the order of the cache, which is the order
+# of the raw data. The result is cached per (year, columns, required) and shared, so treat it as read-only.
+def getColumns(year: int, columns: list, required: list = None) -> DataFrame:
+    if required is None:
+        required = columns
+    key = (year, tuple(columns), tuple(required))
+    df = projections.get(key)
+    if df is not None:
+        return df
+    # Built and kept under the lock, so the year can't be evicted in between and leave the result behind uncounted.
+    with loadlock:
+        if key in projections:
+            return projections[key]
+        if year not in scorecard:
+            dframes[year]
+        df = projectcolumns(scorecard[year], columns, required)
+        if year in scorecard:
+            projections[key] = df
+    return df
+
+# The schools of a cached table with data in every required column, and only the given columns. Columns of
+# integerColumns that no longer have blanks get their integer type back.
+def projectcolumns(df: DataFrame, columns: list, required: list) -> DataFrame:
+    df = selectcolumns(df[ (df[required].notnull().all(axis=1)) ], columns).reset_index(drop=True)
+    for column in integerColumns.keys():
+        if column in df.columns and df[column].dtype.kind == "f" and df[column].notnull().all():
+            df[column] = df[column].astype(integerColumns[column] if compactTables else np.int64)
+    return df
+
+# Serve a registered column set for one year, see columnSets.
+def getColumnSet(year: int, name: str) -> DataFrame:
+    return getColumns(year, columnSets[name]["columns"], columnSets[name]["required"])
+
+# Register another set of columns to be served by getColumns. Changing the cached columns means rebuilding the cache
+# from the raw data, so if the data is already loaded it is reloaded.
+def registerColumns(name: str, columns: list, required: list = None):
+    if required is None:
+        required = columns
+    with loadlock:
+        columnSets[name] = {"columns":list(columns), "required":list(required)}
+        if loaded:
+            loadschema(reload=True)
+
+# Return the shared data set called name, calling loader() to load it the first time it is asked for in this process.
+def getdataset(name: str, loader):
+    if name in datasets:
+        return datasets[name]
+
+    with loadlock:
+        if name not in datasets:
+            dataloaders[name] = loader
+            datasets[name] = loader()
+    return datasets[name]
+
+# Reload everything from disk: the College Scorecard and US News tables, and every data set loaded by getdataset.
+def reload() -> list:
+    with loadlock:
+        report = loadschema(reload=True)
+        for name in list(dataloaders.keys()):
+            datasets[name] = dataloaders[name]()
+    return report
+
+# Row positions of a year's schools that pass the HIGHDEG filter, in ranked order of param (best first). This is the
+# same order sort_values has always produced here, ties included.
+def rankOrder(df: DataFrame, param: str, maxDeg: int, lowerBetter: bool) -> np.ndarray:
+    rows = np.flatnonzero(df["HIGHDEG"].to_numpy() >= maxDeg)
+    values = pd.Series(df[param].to_numpy(dtype=np.float64)[rows])
+    return rows[values.sort_values(ascending=lowerBetter, kind="quicksort").index.to_numpy()]
+
+# The ranked order of every param for every degree filter in the given tables, keyed by (year, param, maxDeg).
+def buildrankindex(tables: dict) -> dict:
+    index = {}
+    for year in tables.keys():
+        for param in paramsColumns:
+            for maxDeg in highestDegNice.values():
+                index[(year, param, maxDeg)] = rankOrder(tables[year], param, maxDeg, lowerIsBetter[param])
+    return index
+
+# Rank the schools of a year by a single param and return the top n, with the rank of each in "Our Ranking". If n = 0,
+# do not truncate the list. The order for every param and degree filter is worked out when the data is loaded, so
+# this is just a slice. Any other cached column can be ranked too, over the schools that have it (see getColumns);
+# lowerBetter gives its direction (default lowerIsBetter[param], or lower first if it has none). Without a prebuilt
+# order only the top n are selected, with argpartition, although schools tied with the n-th may then come out in a
+# different order.
+@timed("getTopNDF")
+def getTopNDF(n: int, param: str, year: int, maxDeg: int, hideOutsiders: bool, lowerBetter: bool = None) -> DataFrame:
     df = dframes[year]
+    if param not in df.columns:
+        df = getColumns(year, usecols + [param], ["HIGHDEG", param])
+    if lowerBetter is None:
+        lowerBetter = lowerIsBetter.get(param, True)
+
+    order = None
+    if lowerBetter == lowerIsBetter.get(param):
+        order = rankindex.get((year, param, maxDeg))
+    if order is None:
+        if n != 0 and not hideOutsiders:
+            order = topOrder(df, param, maxDeg, lowerBetter, n)
+        else:
+            order = rankOrder(df, param, maxDeg, lowerBetter)
+    ourRankings = np.arange(start=1, stop=len(order) + 1, dtype=int)
+
+    if hideOutsiders:
+        USNewsDF = dframes["usnews" + str(year)]
+        keep = np.isin(df["UNITID"].to_numpy()[order], USNewsDF["UNITID"].to_numpy())
+        order = order[keep]
+        ourRankings = ourRankings[keep]
+
+    if n != 0:
+        order = order[:n]
+        ourRankings = ourRankings[:n]
+    df = df.iloc[order].copy()
+    df["Our Ranking"] = ourRankings
+    return df
+
+# The top n of an unindexed column: argpartition picks them out in linear time, and only those n are sorted.
+def topOrder(df: DataFrame, param: str, maxDeg: int, lowerBetter: bool, n: int) -> np.ndarray:
+    rows = np.flatnonzero(df["HIGHDEG"].to_numpy() >= maxDeg)
+    values = df[param].to_numpy(dtype=float)[rows]
+    if not lowerBetter:
+        values = -values
+    values = np.where(np.isnan(values), np.inf, values) # Blanks go last.
+    if n < len(values):
+        top = np.argpartition(values, n - 1)[:n]
+    else:
+        top = np.arange(len(values))
+    return rows[top[np.argsort(values[top], kind="stable")]]
+
+# Min-max normalize the given params (paramsColumns by default) over the schools left after the HIGHDEG filter, and
+# flip the ones direction says are better when higher, so that lower is always better. Returns the normalized
+# (schools x params) matrix with the per-param min and max, and the INSTNM and UNITID of each school.
+def normalizedFeatures(df: DataFrame, maxDeg: int, direction: dict = None, columns: list = None) -> dict:
+    if direction is None:
+        direction = lowerIsBetter
+    if columns is None:
+        columns = paramsColumns
+
     df = df[ (df["HIGHDEG"] >= maxDeg) ]
+    values = df[columns].to_numpy(dtype=float)
+    lo = np.nanmin(values, axis=0) if len(values) else np.full(len(columns), np.nan)
+    hi = np.nanmax(values, axis=0) if len(values) else np.full(len(columns), np.nan)
+    normalized = (values - lo) / (hi - lo)
+    flip = np.array([not direction[column] for column in columns], dtype=bool)
+    normalized[:, flip] = 1.0 - normalized[:, flip]
+
+    return {
+        "columns":list(columns),
+        "normalized":normalized,
+        "min":lo,
+        "max":hi,
+        "schools":df[["INSTNM", "UNITID"]]
+    }
+
+# How many (year, maxDeg) normalized matrices getNormalizedFeatures keeps, least recently used first out.
+normalizedCacheSize = 16
+normalizedcache = collections.OrderedDict()
+normalizedlock = threading.Lock()
+
+# normalizedFeatures for a loaded year, cached per (year, maxDeg, direction).
+@timed("normalize params")
+def getNormalizedFeatures(year: int, maxDeg: int, direction: dict = None) -> dict:
+    if direction is None:
+        direction = lowerIsBetter
+    key = (year, maxDeg, tuple(direction[column] for column in paramsColumns))
+
+    with normalizedlock:
+        if key in normalizedcache:
+            normalizedcache.move_to_end(key)
+            return normalizedcache[key]
+
+    features = normalizedFeatures(dframes[year], maxDeg, direction)
+    with normalizedlock:
+        normalizedcache[key] = features
+        while len(normalizedcache) > normalizedCacheSize:
+            normalizedcache.popitem(last=False)
+    return features
+
+# Multi-variable ranking from normalized features. weights maps each param to its weight; a lower aggregate score is
+# better. Returns INSTNM, UNITID, aggregateScore, the normalized weighted params and "Our Ranking", sorted by rank.
+@timed("weighted score")
+def rankNormalized(features: dict, weights: dict) -> DataFrame:
+    columns = list(weights.keys())
+    normalized = features["normalized"][:, [features["columns"].index(column) for column in columns]]
+
+    weightsTotal = 0.000001 # Don't divide by 0 when nothing is selected.
+    for column in columns:
+        weightsTotal += weights[column]
+
+    # The weighted sum is accumulated one param at a time, in the order given, so the scores (and so the order of
+    # tied schools) are exactly what the old per-school loop produced.
+    aggregateScore = np.zeros(normalized.shape[0])
+    for i, column in enumerate(columns):
+        aggregateScore += weights[column] * normalized[:, i]
+    aggregateScore /= weightsTotal
+
+    schools = features["schools"]
+    ourRankDF = pd.DataFrame({
+        "INSTNM":schools["INSTNM"],
+        "UNITID":schools["UNITID"],
+        "aggregateScore":aggregateScore
+    }, index=schools.index)
+    for i, column in enumerate(columns):
+        ourRankDF[column] = normalized[:, i]
+
+    ourRankDF = ourRankDF.sort_values("aggregateScore", ascending=True, kind="quicksort")
+    ourRankDF["Our Ranking"] = np.arange(start=1, stop=len(ourRankDF.index) + 1, dtype=int)
+    return ourRankDF
+
+# Multi-variable ranking of the schools in df, see normalizedFeatures and rankNormalized.
+def weightedRankDF(df: DataFrame, weights: dict, maxDeg: int, direction: dict = None) -> DataFrame:
+    return rankNormalized(normalizedFeatures(df, maxDeg, direction, list(weights.keys())), weights)
+
+# Multi-variable ranking for a loaded year. The normalized params are cached, so changing only the weights just redoes
+# the weighted sum and the sort.
+def getWeightedRankDF(weights: dict, year: int, maxDeg: int, direction: dict = None) -> DataFrame:
+    return rankNormalized(getNormalizedFeatures(year, maxDeg, direction), weights)
+
+# Weight sensitivity: how stable each school's multi-variable rank is when the weights are perturbed, and optionally
+# when the schools are bootstrap resampled. Scenarios are scored in chunks of sensitivityChunkSize as one matrix
+# product each, spread over sensitivityWorkers processes (default one per CPU). Each chunk only returns a histogram of
+# the ranks every school got, so no per-scenario table is ever built. Ranks are counted in bins of
+# ceil(schools / sensitivityBins), which is exact for a real year's schools.
+sensitivityChunkSize = 500
+sensitivityWorkers = None
+sensitivityBins = 2048
 
-    if lowerIsBetter[param]: 
-        df = df.sort_values(param, 0)
+# count weight vectors around weights, each weight scaled by a random factor in [1 - spread, 1 + spread]. Returns a
+# (count x params) matrix with the params in the order of weights.
+def perturbedWeights(weights: dict, count: int, spread: float = 0.25, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    base = np.array(list(weights.values()), dtype=float)
+    return base * rng.uniform(1.0 - spread, 1.0 + spread, (count, len(base)))
+
+# Score the schools under every weight vector of a chunk at once and count the ranks they got. normalized is the
+# (schools x params) matrix from normalizedFeatures, weights a (scenarios x params) matrix. With a bootstrap seed,
+# each scenario also draws the schools with replacement, and a school's rank is 1 + the number of drawn schools
+# that scored better; a school that was not drawn gets no rank in that scenario. Ties go to the school that comes
+# first. Returns the rank histogram (schools x bins), the number of times each school made the top topN, and the
+# number of scenarios each school was ranked in.
+def rankhistogram(normalized: np.ndarray, weights: np.ndarray, binWidth: int, topN: int, bootstrap: int = None) -> tuple:
+    n = normalized.shape[0]
+    scores = (normalized @ weights.T) / (0.000001 + weights.sum(axis=1))
+    order = np.argsort(scores, axis=0, kind="stable") # NaN scores go last, as they do in rankNormalized.
+
+    if bootstrap is None:
+        ranks = np.empty(scores.shape, dtype=np.int64)
+        np.put_along_axis(ranks, order, np.arange(1, n + 1)[:, None], axis=0)
+        drawn = np.ones(scores.shape, dtype=bool)
     else:
-        df = df.sort_values(by=param, axis=0, ascending=False)
+        rng = np.random.default_rng(bootstrap)
+        counts = rng.multinomial(n, np.full(n, 1.0 / n), size=weights.shape[0]).T
+        sortedcounts = np.take_along_axis(counts, order, axis=0)
+        ranks = np.empty(scores.shape, dtype=np.int64)
+        np.put_along_axis(ranks, order, np.cumsum(sortedcounts, axis=0) - sortedcounts + 1, axis=0)
+        drawn = counts > 0
 
-    ourRankings = np.arange(start=1, stop = df["INSTNM"].count() + 1, dtype=int).tolist()
-    df["Our Ranking"] = ourRankings
+    bins = -(-n // binWidth)
+    school = np.broadcast_to(np.arange(n)[:, None], ranks.shape)[drawn]
+    histogram = np.bincount(school * bins + (ranks[drawn] - 1) // binWidth, minlength=n * bins).reshape(n, bins)
+    top = ((ranks <= topN) & drawn).sum(axis=1)
+    return histogram, top, drawn.sum(axis=1)
+
+# The rank a school reaches in fraction q of its scenarios (nearest rank), read from its rank histogram.
+def histogrampercentile(histogram: np.ndarray, q: float, binWidth: int) -> np.ndarray:
+    cumulative = np.cumsum(histogram, axis=1)
+    total = cumulative[:, -1]
+    reached = cumulative >= np.maximum(np.ceil(q * total), 1)[:, None]
+    result = (reached.argmax(axis=1) * binWidth + 1).astype(float)
+    result[total == 0] = np.nan
+    return result
+
+# Rank distributions for the schools of a loaded year under many weight vectors. weights are page 2's weights; unless
+# weightMatrix gives the vectors to try (one row per scenario, params in the order of weights), scenarios vectors
+# are drawn with perturbedWeights. With bootstrap, each scenario also resamples the schools. The params stay
+# normalized over the whole year, as page 2 does. Returns one row per school, in the order of its rank under
+# weights: "Our Ranking", the median and 5th/95th percentile rank, and the share of scenarios it made the top topN.
+def weightSensitivity(weights: dict, year: int, maxDeg: int, scenarios: int = 1000, spread: float = 0.25,
+                      bootstrap: bool = False, topN: int = 10, seed: int = 0, weightMatrix: np.ndarray = None,
+                      direction: dict = None, workers: int = None) -> DataFrame:
+    features = getNormalizedFeatures(year, maxDeg, direction)
+    normalized = features["normalized"][:, [features["columns"].index(column) for column in weights.keys()]]
+    if weightMatrix is None:
+        weightMatrix = perturbedWeights(weights, scenarios, spread, seed)
+    weightMatrix = np.asarray(weightMatrix, dtype=float)
+    binWidth = max(1, -(-normalized.shape[0] // sensitivityBins))
+
+    chunks = [weightMatrix[i:i + sensitivityChunkSize] for i in range(0, len(weightMatrix), sensitivityChunkSize)]
+    seeds = [None] * len(chunks)
+    if bootstrap:
+        seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(len(chunks))]
+
+    if workers is None:
+        workers = sensitivityWorkers if sensitivityWorkers is not None else (os.cpu_count() or 1)
+    workers = max(1, min(workers, len(chunks)))
+    if workers == 1:
+        results = [rankhistogram(normalized, chunks[i], binWidth, topN, seeds[i]) for i in range(len(chunks))]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(rankhistogram, normalized, chunks[i], binWidth, topN, seeds[i]) for i in range(len(chunks))]
+            results = [future.result() for future in futures]
 
+    histogram = sum(result[0] for result in results)
+    top = sum(result[1] for result in results)
+    ranked = sum(result[2] for result in results)
+
+    df = rankNormalized(features, weights)[["INSTNM", "UNITID", "Our Ranking"]]
+    rows = features["schools"].index.get_indexer(df.index)
+    df["Median Rank"] = histogrampercentile(histogram, 0.5, binWidth)[rows]
+    df["5th Percentile Rank"] = histogrampercentile(histogram, 0.05, binWidth)[rows]
+    df["95th Percentile Rank"] = histogrampercentile(histogram, 0.95, binWidth)[rows]
+    df["Top " + str(topN) + " Share"] = (top / np.maximum(ranked, 1))[rows]
+    df["Scenarios"] = ranked[rows]
+    return df
+
+# Page 2's ranking: every school ranked by the weighted params, then (optionally) only the ones US News ranked, then
+# the top n. If n = 0, do not truncate the list.
+def getWeightedTopNDF(n: int, weights: dict, year: int, maxDeg: int, hideOutsiders: bool) -> DataFrame:
+    ourRankDF = getWeightedRankDF(weights, year, maxDeg)
     if hideOutsiders:
         USNewsDF = dframes["usnews" + str(year)]
-        df = df[ (df["UNITID"].isin(USNewsDF["UNITID"])) ]
-
+        ourRankDF = ourRankDF[ (ourRankDF["UNITID"].isin(USNewsDF["UNITID"])) ]
     if n != 0:
-        df = df.head(n)
-    return df
\ No newline at end of file
+        ourRankDF = ourRankDF.head(n)
+    return ourRankDF
+
+# US News' ranking of every school they ranked in the given year, as a nullable integer Series indexed by UNITID.
+# When a UNITID appears more than once, the first entry wins. Built once per year and shared between threads.
+def usnewsRanks(year: int) -> pd.Series:
+    if year in usnewsindex:
+        return usnewsindex[year]
+
+    with loadlock:
+        if year not in usnewsindex:
+            unitids = getUSNews()["unitids"].astype(np.int64)
+            ranks = pd.Series(np.trunc(usnewsYear(year).astype(np.float64)), index=unitids)
+            ranks = ranks[ (~ranks.index.duplicated(keep="first")) ].astype("Int64")
+            # pandas builds an index's hash table on first use, and two threads doing that at once can break it. Build
+            # it here, before the Series is shared.
+            ranks.index.is_unique
+            usnewsindex[year] = ranks
+    return usnewsindex[year]
+
+# Attach US News rankings to a table with a UNITID column, looking every school up in one pass. years is either a
+# single year, which fills "US News Ranking", or a list of years, which fills one "US News Ranking <year>" column per
+# year. An existing column of the same name is overwritten in place. Schools US News did not rank are left as <NA>.
+@timed("US News join")
+def joinUSNews(df: DataFrame, years) -> DataFrame:
+    df = df.copy()
+    if isinstance(years, (list, tuple, range)):
+        for year in years:
+            df["US News Ranking " + str(year)] = df["UNITID"].map(usnewsRanks(year)).astype("Int64")
+    else:
+        df["US News Ranking"] = df["UNITID"].map(usnewsRanks(years)).astype("Int64")
+    return df
+
+# Number of pairs i < j with values[i] > values[j]. Bottom-up merge sort in numpy: at each level, every element of a
+# right run counts the elements of its left run that are bigger, then the runs are merged by a stable sort, which
+# only has to merge two sorted runs per block. O(n log n).
+def countinversions(values: np.ndarray) -> int:
+    n = len(values)
+    v = np.unique(values, return_inverse=True)[1].astype(np.int64)
+    positions = np.arange(n)
+    inversions = 0
+    width = 1
+    while width < n:
+        offset = (positions // (2 * width)) * n # Keeps every block's values apart, so one searchsorted does them all.
+        left = (positions % (2 * width)) < width
+        keyed = v + offset
+        lefts = keyed[left]
+        rights = keyed[~left]
+        leftend = np.searchsorted(lefts, offset[~left] + n, side="left")
+        inversions += int((leftend - np.searchsorted(lefts, rights, side="right")).sum())
+        v = np.sort(keyed, kind="stable") - offset
+        width *= 2
+    return inversions
+
+# Pairs of tied values in each of the given arrays taken together, e.g. ties in x, or ties in both x and y.
+def tiedpairs(*arrays) -> int:
+    counts = np.unique(np.stack(arrays, axis=1), axis=0, return_counts=True)[1].astype(np.int64)
+    return int((counts * (counts - 1) // 2).sum())
+
+# Kendall's tau-b between two rankings, in O(n log n) (Knight's algorithm).
+def kendalltau(x: np.ndarray, y: np.ndarray) -> float:
+    n = len(x)
+    order = np.lexsort((y, x))
+    pairs = n * (n - 1) // 2
+    xties = tiedpairs(x)
+    yties = tiedpairs(y)
+    denominator = np.sqrt(float(pairs - xties) * float(pairs - yties))
+    if denominator == 0:
+        return np.nan
+    return (pairs - xties - yties + tiedpairs(x, y) - 2 * countinversions(y[order])) / denominator
+
+# How well two rankings of the same schools agree, over the schools both of them ranked (NaN where one did not). Both
+# are first renumbered 1..n over those schools, ties sharing their mean rank, so that rankings of different lengths
+# compare. Returns the number of schools, Spearman's rho, Kendall's tau-b, the share of the top topN that both have
+# in their top topN, and the mean absolute difference between the two ranks of a school.
+def rankAgreement(ours: np.ndarray, theirs: np.ndarray, topN: int = 10) -> dict:
+    both = ~(np.isnan(ours) | np.isnan(theirs))
+    ours = pd.Series(ours[both]).rank(method="average").to_numpy()
+    theirs = pd.Series(theirs[both]).rank(method="average").to_numpy()
+    n = len(ours)
+
+    result = {"Schools":n, "Spearman":np.nan, "Kendall":np.nan, "Top " + str(topN) + " Overlap":np.nan, "Mean Displacement":np.nan}
+    if n == 0:
+        return result
+    if n > 1 and ours.std() > 0 and theirs.std() > 0:
+        result["Spearman"] = float(np.corrcoef(ours, theirs)[0, 1])
+        result["Kendall"] = float(kendalltau(ours, theirs))
+    top = min(topN, n)
+    result["Top " + str(topN) + " Overlap"] = ((ours <= top) & (theirs <= top)).sum() / top
+    result["Mean Displacement"] = float(np.abs(ours - theirs).mean())
+    return result
+
+# Weights of the multi-variable ranking in the agreement table: every param at page 2's default weight.
+agreementWeights = {column:0.5 for column in paramsColumns}
+agreementTopN = 10
+# Bump when the agreement table changes, so the cached one is rebuilt.
+agreementVersion = 1
+
+# Agreement between our rankings and US News for every year, param and degree filter, plus the multi-variable
+# ranking with agreementWeights (Param "weighted"). One row per (Year, Param, Max Degree), see rankAgreement.
+def agreementTable() -> DataFrame:
+    loadschema()
+    rows = []
+    for year in range(yearStart, yearEnd + 1):
+        usnews = usnewsRanks(year)
+        for maxDeg in sorted(highestDegNice.values()):
+            rankings = {param:getTopNDF(0, param, year, maxDeg, False) for param in paramsColumns}
+            rankings["weighted"] = getWeightedRankDF(agreementWeights, year, maxDeg)
+            for param in rankings.keys():
+                df = rankings[param]
+                theirs = pd.array(df["UNITID"].map(usnews), dtype="Float64").to_numpy(dtype=float, na_value=np.nan)
+                row = {"Year":year, "Param":param, "Max Degree":maxDeg}
+                row.update(rankAgreement(df["Our Ranking"].to_numpy(dtype=float), theirs, agreementTopN))
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+# What the agreement table is computed from: the sources of every cached table and the settings above.
+def agreementinputs(manifest: dict) -> dict:
+    names = [str(year) for year in range(yearStart, yearEnd + 1)]
+    sources = {name:manifest.get(name, {}).get("source", {}).get("sha256") for name in names}
+    sources["usnews"] = [source["sha256"] for source in manifest.get("usnews", {}).get("sources", [])]
+    return {
+        "sources":sources,
+        "version":[agreementVersion, filterVersion],
+        "weights":agreementWeights,
+        "topN":agreementTopN
+    }
+
+# The agreement table from the cache if it is up to date, None if it is missing or what it is computed from has
+# changed. Nothing is computed, so no year is loaded.
+def storedagreement() -> DataFrame:
+    loadschema()
+    manifest = loadmanifest()
+    cachefile = cachefilename("agreement")
+    if os.path.exists(cachefile) and manifest.get("agreement", {}).get("inputs") == agreementinputs(manifest):
+        return readcache(cachefile)
+    return None
+
+# The agreement table from the cache, recomputed and cached again only when what it is computed from has changed
+# (or with rebuild).
+def loadagreement(rebuild: bool = False) -> DataFrame:
+    loadschema()
+    with loadlock:
+        df = None if rebuild else storedagreement()
+        if df is not None:
+            return df
+
+        start = time.perf_counter()
+        df = agreementTable()
+        writecache(df, cachefilename("agreement"))
+        manifest = loadmanifest()
+        manifest["agreement"] = {"inputs":agreementinputs(manifest)}
+        savemanifest(manifest)
+        print("[cache] Rebuilt agreement in %.2f s" % (time.perf_counter() - start))
+    return df
+
+# The shared agreement table, for the dashboard. With compute=False it is only served if it is already loaded or
+# stored up to date in the cache, and None otherwise, since computing it loads every year.
+def getAgreement(compute: bool = True) -> DataFrame:
+    if compute or "agreement" in datasets or storedagreement() is not None:
+        return getdataset("agreement", loadagreement)
+    return None
+
+# Arrays for the rank disparity (dumbbell) plot, built straight from the rank columns of a table with "Our Ranking",
+# "US News Ranking", "University Name" and "UNITID". Each school gets its own row on the y axis keyed by its UNITID,
+# so schools that share a name are kept apart; "labels" holds the names to show on that axis. The connecting lines
+# are one trace, with a gap (NaN/None) after each school.
+@timed("dumbbell build")
+def dumbbellTraces(table: DataFrame) -> dict:
+    ours = table["Our Ranking"].to_numpy(dtype=float)
+    theirs = pd.array(table["US News Ranking"], dtype="Float64").to_numpy(dtype=float, na_value=np.nan)
+    keys = table["UNITID"].astype(str).to_numpy(dtype=object)
+    n = len(keys)
+
+    line_x = np.full(3 * n, np.nan)
+    line_x[0::3] = ours
+    line_x[1::3] = theirs
+    line_y = np.full(3 * n, None, dtype=object)
+    line_y[0::3] = keys
+    line_y[1::3] = keys
+
+    return {
+        "line_x":line_x,
+        "line_y":line_y,
+        "Our Ranking":ours,
+        "US News Ranking":theirs,
+        "schools":keys,
+        "labels":table["University Name"].to_numpy(dtype=object)
+    }
+
+# Scatter traces with more points than this are drawn with WebGL (Scattergl) rather than SVG, see scatterTrace.
+webglThreshold = 1000
+
+# If set, scatterTrace keeps at most this many points of a marker trace, evenly spaced. None keeps every point.
+chartMaxPoints = None
+
+# A go.Scatter, or a go.Scattergl above webglThreshold points, with the given x, y and trace settings. Marker traces
+# (decimate=True) are thinned out to chartMaxPoints when it is set; line traces with gaps in them must keep every
+# point. Per-point settings given in kwargs as arrays are thinned out with them.
+def scatterTrace(x, y, decimate: bool = True, **kwargs):
+    import plotly.graph_objects as go
+    if decimate and chartMaxPoints and len(x) > chartMaxPoints:
+        n = len(x)
+        keep = np.unique(np.linspace(0, n - 1, chartMaxPoints).round().astype(np.int64))
+        thin = lambda value: np.asarray(value)[keep] if isinstance(value, (np.ndarray, pd.Series, list)) and len(value) == n else value
+        x = thin(x)
+        y = thin(y)
+        kwargs = {key:thin(kwargs[key]) for key in kwargs.keys()}
+    trace = go.Scattergl if len(x) > webglThreshold else go.Scatter
+    return trace(x=x, y=y, **kwargs)
+
+# Built figures, keyed by chart and everything the chart is drawn from, least recently used first out. A figure is
+# shared by every session that asks for the same key, so it must not be changed once built. Cleared on reload.
+figureCacheSize = 64
+figurecache = collections.OrderedDict()
+figurelock = threading.Lock()
+figurestats = {"hits":0, "misses":0}
+
+# The figure for chart with the given key (a tuple of the year, params, filters and anything else it is drawn from),
+# calling build() to make it only if it isn't memoized.
+def chartFigure(chart: str, key: tuple, build):
+    key = (chart,) + tuple(key)
+    with figurelock:
+        if key in figurecache:
+            figurestats["hits"] += 1
+            figurecache.move_to_end(key)
+            return figurecache[key]
+        figurestats["misses"] += 1
+
+    with span("build " + chart):
+        figure = build()
+    with figurelock:
+        figurecache[key] = figure
+        while len(figurecache) > figureCacheSize:
+            figurecache.popitem(last=False)
+    return figure
+
+# Pages 1 and 2's rank disparity (dumbbell) plot of a table with "Our Ranking", "US News Ranking", "University Name"
+# and "UNITID", see dumbbellTraces.
+def dumbbellFigure(table: DataFrame):
+    import plotly.graph_objects as go
+    dumbbell_data = dumbbellTraces(table)
+    dumbbell_fig = go.Figure(
+        data=[
+            scatterTrace(dumbbell_data["line_x"], dumbbell_data["line_y"], decimate=False, mode="lines",
+                         showlegend=False, hoverinfo="skip", marker=dict(color="black")),
+            scatterTrace(dumbbell_data["Our Ranking"], dumbbell_data["schools"], text=dumbbell_data["labels"],
+                         hovertemplate="%{text}: %{x}", mode="markers", name="Our Ranking",
+                         marker=dict(color="blue", size=10)),
+            scatterTrace(dumbbell_data["US News Ranking"], dumbbell_data["schools"], text=dumbbell_data["labels"],
+                         hovertemplate="%{text}: %{x}", mode="markers", name="US News Ranking",
+                         marker=dict(color="goldenrod", size=10))
+        ]
+    )
+
+    # One row per UNITID, labelled with the school's name.
+    dumbbell_fig.update_yaxes(
+        type="category",
+        tickmode="array",
+        tickvals=dumbbell_data["schools"],
+        ticktext=dumbbell_data["labels"]
+    )
+
+    dumbbell_fig.update_layout(
+        title="Rankings Disparity",
+        height=1000,
+        legend_itemclick=False
+    )
+    return dumbbell_fig
+
+# Every year in one panel, so questions across years are answered with array operations instead of loops and joins.
+# Institutions are the union of the years' schools, sorted by UNITID, and the layers are arrays over them:
+#     values   year x institution x metric, the raw params
+#     highdeg  year x institution
+#     ranks    degree filter x year x institution x metric, the rank page 1 gives each school ("Our Ranking")
+#     usnews   year x institution, the US News rank
+# A school that is missing from a year, or filtered out by the degree filter, is NaN there.
+def buildpanel() -> dict:
+    loadschema()
+    years = np.arange(yearStart, yearEnd + 1)
+    degrees = sorted(highestDegNice.values())
+    unitids = np.unique(np.concatenate([dframes[year]["UNITID"].to_numpy(dtype=np.int64) for year in years]))
+
+    names = np.full(len(unitids), None, dtype=object)
+    values = np.full((len(years), len(unitids), len(paramsColumns)), np.nan)
+    highdeg = np.full((len(years), len(unitids)), np.nan)
+    ranks = np.full((len(degrees), len(years), len(unitids), len(paramsColumns)), np.nan)
+    usnews = np.full((len(years), len(unitids)), np.nan)
+    for y, year in enumerate(years):
+        df = dframes[year]
+        cols = np.searchsorted(unitids, df["UNITID"].to_numpy(dtype=np.int64))
+        names[cols] = df["INSTNM"].to_numpy(dtype=object) # The latest name wins.
+        values[y, cols, :] = df[paramsColumns].to_numpy(dtype=float)
+        highdeg[y, cols] = df["HIGHDEG"].to_numpy(dtype=float)
+        for d, maxDeg in enumerate(degrees):
+            for m, param in enumerate(paramsColumns):
+                order = rankindex.get((year, param, maxDeg))
+                if order is None:
+                    order = rankOrder(df, param, maxDeg, lowerIsBetter[param])
+                ranks[d, y, cols[order], m] = np.arange(1, len(order) + 1)
+
+        usnewsranks = usnewsRanks(year)
+        keys = usnewsranks.index.to_numpy(dtype=np.int64)
+        found = np.isin(keys, unitids)
+        usnews[y, np.searchsorted(unitids, keys[found])] = usnewsranks.to_numpy(dtype=float, na_value=np.nan)[found]
+
+    return {
+        "years":years,
+        "degrees":degrees,
+        "metrics":list(paramsColumns),
+        "unitids":unitids,
+        "names":names,
+        "values":values,
+        "highdeg":highdeg,
+        "ranks":ranks,
+        "usnews":usnews
+    }
+
+# The shared panel, rebuilt with everything else on reload.
+def getPanel() -> dict:
+    return getdataset("panel", buildpanel)
+
+# One rank layer of the panel as a year x institution array. metric is a param, or "usnews" for the US News ranks.
+def panelRanks(metric: str, maxDeg: int = 0, panel: dict = None) -> np.ndarray:
+    if panel is None:
+        panel = getPanel()
+    if metric == "usnews":
+        return panel["usnews"]
+    return panel["ranks"][panel["degrees"].index(maxDeg), :, :, panel["metrics"].index(metric)]
+
+# A table of the institutions with the given columns (one per year), leaving out institutions that are blank in all.
+def panelTable(panel: dict, columns: dict) -> DataFrame:
+    layers = np.stack(list(columns.values()), axis=1)
+    keep = ~np.all(np.isnan(layers), axis=1)
+    df = DataFrame({"INSTNM":panel["names"][keep], "UNITID":panel["unitids"][keep]})
+    for key in columns.keys():
+        values = columns[key][keep]
+        blank = np.isnan(values)
+        df[key] = pd.arrays.IntegerArray(np.where(blank, 0, np.round(values)).astype(np.int64), blank)
+    return df
+
+# Every institution's rank in each year, one column per year, for a param (or "usnews").
+def rankTrajectories(metric: str, maxDeg: int = 0) -> DataFrame:
+    panel = getPanel()
+    layer = panelRanks(metric, maxDeg, panel)
+    return panelTable(panel, {year:layer[y] for y, year in enumerate(panel["years"])})
+
+# How far every institution moved from one year to the next, one column per year from the second on. Positive means
+# it moved up (its rank number went down). Blank if it was not ranked in either year.
+def rankDeltas(metric: str, maxDeg: int = 0) -> DataFrame:
+    panel = getPanel()
+    layer = panelRanks(metric, maxDeg, panel)
+    deltas = layer[:-1] - layer[1:]
+    return panelTable(panel, {year:deltas[y] for y, year in enumerate(panel["years"][1:])})
+
+# Rank every institution by its mean rank over the given years (default all of them), counting only the years it was
+# ranked in and leaving out institutions ranked in fewer than minYears. Ties go to the lower UNITID.
+def aggregateRanking(metric: str, maxDeg: int = 0, years: list = None, minYears: int = 1) -> DataFrame:
+    panel = getPanel()
+    layer = panelRanks(metric, maxDeg, panel)
+    if years is not None:
+        layer = layer[np.isin(panel["years"], years)]
+
+    ranked = ~np.isnan(layer)
+    count = ranked.sum(axis=0)
+    keep = (count >= max(minYears, 1))
+    layer = layer[:, keep]
+    ranked = ranked[:, keep]
+    count = count[keep]
+
+    df = DataFrame({
+        "INSTNM":panel["names"][keep],
+        "UNITID":panel["unitids"][keep],
+        "Years Ranked":count,
+        "Mean Rank":np.where(ranked, layer, 0.0).sum(axis=0) / count,
+        "Best Rank":np.where(ranked, layer, np.inf).min(axis=0).astype(int),
+        "Worst Rank":np.where(ranked, layer, -np.inf).max(axis=0).astype(int)
+    })
+    df = df.iloc[np.lexsort((df["UNITID"].to_numpy(), df["Mean Rank"].to_numpy()))].reset_index(drop=True)
+    df["Our Ranking"] = np.arange(start=1, stop=len(df.index) + 1, dtype=int)
+    return df
+
+# Position of every school in the descending sort of each feature, as a (schools x features) matrix in the row order
+# of df. The sorts are chained, each one starting from the order the previous one left, as page 3's Combination Count
+# has always done, so tied values fall in the same order. School i is in the top k of feature j when
+# positions[i, j] < k.
+@timed("top-k positions")
+def topKPositions(df: DataFrame, features: list) -> np.ndarray:
+    current = df[features].astype(np.float64).reset_index(drop=True)
+    positions = np.empty((len(current.index), len(features)), dtype=np.int32)
+    for j, feature in enumerate(features):
+        current = current.sort_values(by=[feature], ascending=False)
+        positions[current.index.to_numpy(), j] = np.arange(len(current.index), dtype=np.int32)
+    return positions
+
+# Combination Count of every school for one k: the weighted number of features the school is in the top k of, i.e.
+# (positions < k) @ weights. The sum is taken one feature at a time, in feature order, so the floating point result
+# is identical to adding the weights up school by school.
+@timed("combination count")
+def combinationCount(positions: np.ndarray, k: int, weights: list) -> np.ndarray:
+    counts = np.zeros(positions.shape[0])
+    for j in range(positions.shape[1]):
+        counts += (positions[:, j] < k) * weights[j]
+    return counts
+
+# Combination Count for every k from kmin to kmax at once, as a (schools x ks) matrix. Column i is k = kmin + i.
+def combinationCountSweep(positions: np.ndarray, weights: list, kmin: int = 10, kmax: int = 100) -> np.ndarray:
+    ks = np.arange(kmin, kmax + 1)
+    counts = np.zeros((positions.shape[0], len(ks)))
+    for j in range(positions.shape[1]):
+        counts += (positions[:, j, None] < ks[None, :]) * weights[j]
+    return counts
+
+# The top-k positions (see topKPositions) of a year's "combination" set, every column but UNITID and INSTNM being a
+# feature. Worked out the first time they are asked for and kept with the year's table: they count against
+# tableBudget and are dropped when the year is, see YearTables.
+def yearTopKPositions(year: int) -> np.ndarray:
+    with loadlock:
+        if year not in topkindex:
+            df = getColumnSet(year, "combination")
+            topkindex[year] = topKPositions(df, [column for column in df.columns if column not in ["UNITID", "INSTNM"]])
+        return topkindex[year]
+
+# Page 3's ranking for a year: every school with its Combination Count for k and weights (one per feature, in column
+# order) and "Our Ranking", best first, in the order page 3 shows them (see sortCombination). The counts are left as
+# they are, not normalized. The top-k positions are shared with page 3, see yearTopKPositions.
+def combinationRanking(year: int, k: int, weights: list) -> DataFrame:
+    positions = yearTopKPositions(year)
+    df = getColumnSet(year, "combination").copy()
+    df.insert(2, "Combination Count", combinationCount(positions, k, weights))
+    df = df.iloc[np.argsort(positions[:, -1], kind="stable")]
+    df = df.loc[sortCombination(df).index]
+    df["Our Ranking"] = np.arange(start=1, stop=len(df.index) + 1, dtype=int)
+    return df
+
+# Columns page 3 treats as better when lower (tuition, admission rate, cost and transfer rate).
+combinationLowerIsBetter = ["NPT42_PUB", "ADM_RATE", "COSTT4_A", "TRANS_4"]
+
+# Page 3's heatmap values: every column but UNITID and INSTNM min-max normalized over df and rounded to two decimal
+# places, flipped for the combinationLowerIsBetter columns so that 1 is always best.
+@timed("heatmap normalize")
+def normalizeCombination(df: DataFrame) -> DataFrame:
+    result = df.copy()
+    for feature_name in df.columns:
+        if feature_name not in ["UNITID", "INSTNM"]:
+            values = df[feature_name].astype(np.float64)
+            max_value = values.max()
+            min_value = values.min()
+            normRound = round((values - min_value) / (max_value - min_value), 2)
+            if feature_name in combinationLowerIsBetter:
+                result[feature_name] = round(1 - normRound, 2)
+            else:
+                result[feature_name] = normRound
+    return result
+
+# Page 3's order: df (with its Combination Count) normalized by normalizeCombination, which rounds the counts to two
+# places so that counts rounding the same are tied, then sorted by the rounded count, best first. Returns the
+# normalized table in that order, with the index of df. combinationRanking uses the same order, so a batch ranking
+# matches the dashboard row for row.
+def sortCombination(df: DataFrame) -> DataFrame:
+    return normalizeCombination(df).sort_values(by=["Combination Count"], ascending=False)
+
+# Page 3's heatmap labels: a value in [0, 1] is labelled with the eighth it falls in, going up from the first bound
+# (below .125 is "Very Poor", .125 up to .25 is "Poor" and so on, 1 is "Excellent").
+heatmapBounds = [.125, .25, .375, .5, .625, .75, .875]
+heatmapNames = ["Very Poor", "Poor", "Subpar", "Neutral", "Neutral", "Good", "Great", "Excellent"]
+
+# Every cell of df as text, numbers at most 1 followed by their heatmap label, in one binning pass per column.
+@timed("heatmap labels")
+def heatmapLabels(df: DataFrame) -> DataFrame:
+    names = np.array(heatmapNames, dtype=object)
+    result = {}
+    for column in df.columns:
+        text = df[column].astype(str).to_numpy(dtype=object)
+        if df[column].dtype.kind in "iuf":
+            values = df[column].to_numpy(dtype=np.float64)
+            labelled = values <= 1
+            text[labelled] = text[labelled] + " " + names[np.searchsorted(heatmapBounds, values[labelled], side="right")]
+        result[column] = text
+    return DataFrame(result, index=df.index)
+
+# CSS for every cell of df, coloring its numbers by where they fall between vmin and vmax in cmap and picking a text
+# color that stays readable on it, the same as Styler.background_gradient(axis=None) does. Text cells get no style.
+@timed("heatmap colors")
+def heatmapColors(df: DataFrame, cmap: str = "RdYlGn", vmin: float = 0, vmax: float = 1) -> DataFrame:
+    import matplotlib
+    numeric = [column for column in df.columns if df[column].dtype.kind in "iuf"]
+    css = np.full(df.shape, "", dtype=object)
+    if numeric:
+        values = df[numeric].to_numpy(dtype=np.float64)
+        rgba = matplotlib.colormaps[cmap](matplotlib.colors.Normalize(vmin, vmax)(values))
+        linear = np.where(rgba[..., :3] <= 0.04045, rgba[..., :3] / 12.92, ((rgba[..., :3] + 0.055) / 1.055) ** 2.4)
+        dark = linear @ np.array([0.2126, 0.7152, 0.0722]) < 0.408
+        colors = np.round(rgba[..., :3] * 255).astype(np.int64) @ np.array([1 << 16, 1 << 8, 1])
+        styles = np.char.mod("background-color: #%06x;color: ", colors)
+        styles = np.char.add(styles, np.where(dark, "#f1f1f1;", "#000000;"))
+        css[:, [df.columns.get_loc(column) for column in numeric]] = styles.astype(object)
+    return DataFrame(css, index=df.index, columns=df.columns)
+
+# How many rows pagedTable shows at a time unless told otherwise.
+tablePageSize = 50
+
+# Show one page of df, with a page picker (keyed by key) when there is more than one. Only the visible rows are
+# styled (style takes those rows and returns what to show, e.g. a Styler) and sent to the browser. With table=True
+# the page is drawn with st.table, otherwise with st.dataframe.
+def pagedTable(df: DataFrame, key: str, pageSize: int = None, style = None, table: bool = False):
+    import streamlit as st
+    if pageSize is None:
+        pageSize = tablePageSize
+    pages = max(1, -(-len(df.index) // pageSize))
+    page = 1
+    if pages > 1:
+        page = st.number_input("Page (of %d)" % pages, min_value=1, max_value=pages, value=1, step=1, key=key)
+    rows = df.iloc[(page - 1) * pageSize:page * pageSize]
+    if pages > 1:
+        st.caption("Rows %d to %d of %d" % ((page - 1) * pageSize + 1, (page - 1) * pageSize + len(rows.index), len(df.index)))
+    shown = style(rows) if style is not None else rows
+    if table:
+        st.table(shown)
+    else:
+        st.dataframe(shown, use_container_width=True)
+
+# Columns used by the K-score on page 4.
+kscoreColumns = {
+    "degrees":["PCIP11", "PCIP26", "PCIP27", "PCIP14", "PCIP22", "PCIP40", "PCIP51"], # CS, bio, math, eng, law, sci, med
+    "diversity":["UGDS_WHITE", "UGDS_BLACK", "UGDS_ASIAN", "UGDS_AIAN", "UGDS_NHPI"],
+    "hispanic":"UGDS_HISP",
+    "satAvg":"SAT_AVG",
+    "satMath":"SATMT75",
+    "satRead":"SATVR75",
+    "cost":"COSTT4_A",
+    "completion":"C100_4_POOLED_SUPP",
+    "offers":["CIP11BACHL", "CIP14BACHL", "CIP26BACHL", "CIP27BACHL", "CIP40BACHL"], # CS, eng, bio, math, sci bachelor's
+    "admissionRate":"ADM_RATE"
+}
+
+# Page 4 only scores selective schools that offer every one of the "offers" bachelor's degrees.
+kscoreMaxAdmissionRate = 0.12
+
+# The schools in df that page 4 scores.
+def kscoreCandidates(df: DataFrame) -> DataFrame:
+    keep = (df[kscoreColumns["admissionRate"]] <= kscoreMaxAdmissionRate)
+    for column in kscoreColumns["offers"]:
+        keep &= (df[column] > 0.0)
+    return df.loc[keep]
+
+# K-score profiles. Every profile computes the same components, each as a column-wise expression:
+#     High-Paying Degrees        sum of (PCIPxx * 100) % 10 over the degree columns
+#     Diversity                  diversity / |alternating sum of the race shares - hispanic share / 10|
+#     SAT Scores                 (SAT_AVG + satMultiplier * (SATMT75 + SATVR75)) % satModulus
+#     Affordability              affordability / cost of attendance
+#     Completion Rate (4 Years)  completion * 4-year completion rate
+# K_SCORE is the sum of the components and Academics is degrees + SAT + completion. A new profile is just another
+# entry here.
+kscoreProfiles = {
+    "normal":{"diversity":3, "satMultiplier":4, "satModulus":60, "affordability":1_000_000, "completion":40},
+    "controversial":{"diversity":25, "satMultiplier":2, "satModulus":200, "affordability":4_000_000, "completion":40}
+}
+
+# Convert a column to floats the way float() would, with 0.0 for anything float() can't parse (e.g.
+# "PrivacySuppressed"). Text is parsed with float() itself, value by value: pandas' own parser is faster but does not
+# always round to the nearest float, and the K-score must come out exactly as it did.
+def tofloat(series: pd.Series) -> pd.Series:
+    if series.dtype != object:
+        return series.astype(float)
+    def parse(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    return series.map(parse).astype(float)
+
+# Score every school in df with a K-score profile (a name from kscoreProfiles, or a profile dict). Returns a copy of
+# df with the completion rate converted to numbers and a column for the K-score and each of its components.
+@timed("kscore")
+def kscore(df: DataFrame, profile = "normal") -> DataFrame:
+    if isinstance(profile, str):
+        profile = kscoreProfiles[profile]
+    columns = kscoreColumns
+    df = df.copy()
+    df[columns["completion"]] = tofloat(df[columns["completion"]])
+
+    degrees = np.zeros(len(df.index))
+    for deg in columns["degrees"]:  # calc degree coverage
+        degrees += (df[deg].to_numpy(dtype=float) * 100) % 10
+
+    diversity = np.zeros(len(df.index))
+    for race in columns["diversity"]:  # calc racial spread
+        diversity = -diversity + df[race].to_numpy(dtype=float)
+    diversity = np.abs(diversity) - (1/10) * df[columns["hispanic"]].to_numpy(dtype=float)
+    with np.errstate(divide="ignore"):
+        diversity = (1/np.abs(diversity)) * profile["diversity"]
+
+    satAvg = df[columns["satAvg"]].to_numpy(dtype=float)
+    satBoth = df[columns["satMath"]].to_numpy(dtype=float) + df[columns["satRead"]].to_numpy(dtype=float)
+    sats = (satAvg + profile["satMultiplier"] * satBoth) % profile["satModulus"]
+    affordability = profile["affordability"] / df[columns["cost"]].to_numpy(dtype=float)
+    completion = df[columns["completion"]].to_numpy(dtype=float) * profile["completion"]
+
+    df["K_SCORE"] = degrees + sats + affordability + completion + diversity
+    df["High-Paying Degrees"] = degrees
+    df["SAT Scores"] = sats
+    df["Affordability"] = affordability
+    df["Completion Rate (4 Years)"] = completion
+    df["Academics"] = degrees + sats + completion
+    df["Diversity"] = diversity
+    return df
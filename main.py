@@ -4,11 +4,18 @@
 # School Ranking Project
 
 import streamlit as st
+import lib
 
 
 def dashboard():
     st.write("# College Ranking Dashboard")
     st.sidebar.success("Select a activity above.")
+
+    # The data is loaded once per server process and shared by every session. Reload it after the data or the cache
+    # has been updated on disk.
+    if st.sidebar.button("Reload data"):
+        lib.reload()
+        st.sidebar.info("Data reloaded.")
     st.markdown(
         """
         ### Purpose  
@@ -21,13 +28,34 @@ def dashboard():
         """
     )
 
+    # How closely each of our rankings follows US News, precomputed for every year, param and degree filter. Only a
+    # table already in the cache is shown straight away; computing it loads every year, so that waits for the button.
+    with st.expander("Agreement with US News' rankings"):
+        st.write(
+            "Over the schools both rankings include: Spearman's rho, Kendall's tau, the share of the top " +
+            str(lib.agreementTopN) + " in common, and the mean difference in rank. \"weighted\" is the multi-variable "
+            "ranking with every parameter weighted equally."
+        )
+        with lib.span("agreement table"):
+            agreement = lib.getAgreement(compute=False)
+            if agreement is None and st.button("Compute the agreement table"):
+                agreement = lib.getAgreement()
+            if agreement is None:
+                st.info("The agreement table has not been computed since the data last changed. Computing it loads "
+                        "every year's data and takes a while.")
+            else:
+                st.dataframe(agreement, use_container_width=True)
+
 def main():
     print("Let's do some data science!")
+    # Set RANKING_PROFILE=1 to see where the time goes, see lib.span.
+    lib.startrun("College Ranking Dashboard")
     st.set_page_config(
         layout="wide", 
         initial_sidebar_state="expanded", 
         page_title="College Ranking Dashboard"
     )
     dashboard()
+    lib.profilePanel()
 
 main()
@@ -22,6 +22,40 @@ paramsColumns = lib.paramsColumns
 highestDegNice = lib.highestDegNice
 lowerIsBetter = lib.lowerIsBetter
 
+# The scatter plot of the selected param for the schools in df. Switches to WebGL for large N, see lib.scatterTrace.
+def scatterFigure(df, selParamColName, strNiceCol):
+    scatter_fig = go.Figure(
+        data=[
+            lib.scatterTrace(
+                x=df["INSTNM"],
+                y=df[selParamColName],
+                mode="markers",
+                name=strNiceCol,
+                marker=dict(color="blue",size=10)
+            )
+        ]
+    )
+
+    if lowerIsBetter[selParamColName]:
+        scatter_fig.add_annotation(x=-1, y=df[selParamColName].max(), text="Worse", showarrow=False)
+        scatter_fig.add_annotation(x=-1, y=df[selParamColName].min(), text="Better", showarrow=False)
+    else:
+        scatter_fig.add_annotation(x=-1, y=df[selParamColName].min(), text="Worse", showarrow=False)
+        scatter_fig.add_annotation(x=-1, y=df[selParamColName].max(), text="Better", showarrow=False)
+
+    scatter_fig.update_xaxes(
+        tickangle=90,
+    )
+    scatter_fig.update_yaxes(
+        autorange="reversed"
+    )
+
+    scatter_fig.update_layout(
+        xaxis_title="INSTNM",
+        yaxis_title=selParamColName        
+    )
+    return scatter_fig
+
 def dashboard():
 
     dframes = lib.dframes
@@ -70,110 +104,30 @@ def dashboard():
             strNiceCol = key
             break
 
-    # Show scatter plot.
-    scatter_fig = go.Figure(
-        data=[
-            go.Scatter(
-                x=df["INSTNM"],
-                y=df[selParamColName],
-                mode="markers",
-                name=strNiceCol,
-                marker=dict(color="blue",size=10)
-            )
-        ]
-    )
-
-    if lowerIsBetter[selParamColName]:
-        scatter_fig.add_annotation(x=-1, y=df[selParamColName].max(), text="Worse", showarrow=False)
-        scatter_fig.add_annotation(x=-1, y=df[selParamColName].min(), text="Better", showarrow=False)
-    else:
-        scatter_fig.add_annotation(x=-1, y=df[selParamColName].min(), text="Worse", showarrow=False)
-        scatter_fig.add_annotation(x=-1, y=df[selParamColName].max(), text="Better", showarrow=False)
+    # Show scatter plot. The figure is only built again when what it shows changes.
+    scatter_fig = lib.chartFigure("scatter", (selYear, selParamColName, selMaxDeg, selN, hideOutsiders),
+                                  lambda: scatterFigure(df, selParamColName, strNiceCol))
 
-    scatter_fig.update_xaxes(
-        tickangle=90,
-    )
-    scatter_fig.update_yaxes(
-        autorange="reversed"
-    )
-
-    scatter_fig.update_layout(
-        xaxis_title="INSTNM",
-        yaxis_title=selParamColName        
-    )
-
-    st.plotly_chart(scatter_fig, use_container_width=True)
+    with lib.span("plotly scatter"):
+        st.plotly_chart(scatter_fig, use_container_width=True)
 
     # Show table of top N schools, based on our rankings:
     ourTableDF = pd.DataFrame({
         "Our Ranking":df["Our Ranking"],
-        "US News Ranking":[""]*df["INSTNM"].count(),
+        "US News Ranking":pd.NA,
         "University Name":df["INSTNM"].tolist(),
         "UNITID":df["UNITID"].to_list()
     })
 
     # Put the US News rankings into the table.
-    for value in USNewsDF.iterrows():
-        try:            
-            usnewsrank = int(USNewsDF.query("UNITID=="+str(value[1]["UNITID"]))["US News Ranking"].to_list()[0])
-            ourTableDF.loc[ourTableDF["UNITID"] == value[1]["UNITID"], "US News Ranking"] = usnewsrank
-        except Exception as e: 
-            #print(e)
-            ourTableDF.loc[ourTableDF["UNITID"] == value[1]["UNITID"], "US News Ranking"] = ""
+    ourTableDF = lib.joinUSNews(ourTableDF, selYear)
 
     # We want a dumbbell plot to show the disparity between our ranking and US News' ranking.
-    dumbbell_schools = ourTableDF["University Name"]
-    dumbbell_data = {"line_x": [], "line_y": [], "Our Ranking": [], "US News Ranking": [], "schools": []}
-    for school in dumbbell_schools:
-        dumbbell_data["Our Ranking"].extend(ourTableDF.loc[ourTableDF["University Name"] == school]["Our Ranking"])
-        dumbbell_data["US News Ranking"].extend(ourTableDF.loc[ourTableDF["University Name"] == school]["US News Ranking"])
-        dumbbell_data["schools"] += [school]
-        dumbbell_data["line_x"].extend([
-            ourTableDF.query("`University Name` == \"" + str(school) + "\"")["Our Ranking"].to_list()[0],
-            ourTableDF.query("`University Name` == \"" + str(school) + "\"")["US News Ranking"].to_list()[0],
-            None
-        ])
-        dumbbell_data["line_y"].extend([school, school, None])
-
-    dumbbell_fig = go.Figure(
-        data=[
-            go.Scatter(
-                x=dumbbell_data["line_x"],
-                y=dumbbell_data["line_y"],
-                mode="lines",
-                showlegend=False,
-                marker=dict(color="black")
-            ),
-            go.Scatter(
-                x=dumbbell_data["Our Ranking"],
-                y=dumbbell_data["schools"],
-                mode="markers",
-                name="Our Ranking",
-                marker=dict(
-                    color="blue",
-                    size=10
-                )
-            ),
-            go.Scatter(
-                x=dumbbell_data["US News Ranking"],
-                y=dumbbell_data["schools"],
-                mode="markers",
-                name="US News Ranking",
-                marker=dict(
-                    color="goldenrod",
-                    size=10
-                )
-            )            
-        ]
-    )
-
-    dumbbell_fig.update_layout(
-        title="Rankings Disparity",
-        height=1000,
-        legend_itemclick=False
-    )
+    dumbbell_fig = lib.chartFigure("dumbbell single", (selYear, selParamColName, selMaxDeg, selN, hideOutsiders),
+                                   lambda: lib.dumbbellFigure(ourTableDF))
 
-    st.plotly_chart(dumbbell_fig, use_container_width=True)
+    with lib.span("plotly dumbbell"):
+        st.plotly_chart(dumbbell_fig, use_container_width=True)
 
     # Don't show index in displayed table.
     hide_table_row_index = """
@@ -184,16 +138,21 @@ def dashboard():
                 """
     st.markdown(hide_table_row_index, unsafe_allow_html=True)
 
-    st.table(ourTableDF)
+    with lib.span("st.table"):
+        lib.pagedTable(ourTableDF, "table page", table=True)
 
 def main():
     print("Economic Mobility Single Variable")
+    # Set RANKING_PROFILE=1 to see where the time goes, see lib.span.
+    lib.startrun("Economic Mobility Single Variable")
     lib.loadschema()
     st.set_page_config(
         layout="wide", 
         initial_sidebar_state="expanded",
         page_title="Economic Mobility Single Variable"
     )
-    dashboard()
+    with lib.span("dashboard"):
+        dashboard()
+    lib.profilePanel()
 
 main()
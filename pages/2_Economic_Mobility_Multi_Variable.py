@@ -22,58 +22,16 @@ paramsColumns = lib.paramsColumns
 highestDegNice = lib.highestDegNice
 lowerIsBetter = lib.lowerIsBetter
 
+# Rank every school by the weighted parameters, then keep the top n. If n = 0, do not truncate the list.
 def getTopNDF(n: int, param: dict, year: int, maxDeg: int, hideOutsiders: bool) -> DataFrame:
+    return lib.getWeightedTopNDF(n, param, year, maxDeg, hideOutsiders)
 
-    global dframes
-    global paramsColumns
-    global lowerIsBetter
-
-    weightsTotal = 0.000001 # Don't divide by 0 on initial run.
-    for key in param.keys():
-        weightsTotal += param[key]
-
-    df = dframes[year]
-    df = df[ (df["HIGHDEG"] >= maxDeg) ]
-
-    # Normalize data using min-max feature scaling.
-    for column in paramsColumns:
-        df[column] = (df[column] - df[column].min()) / (df[column].max() - df[column].min())
-
-    # If higher is better, subract 1 from normalized values to reverse the scale.
-    for column in param.keys():
-        if not lowerIsBetter[column]: 
-            df[column] = 1.0 - df[column]
-
-    ourRankDF = pd.DataFrame({
-        "INSTNM":df["INSTNM"],
-        "UNITID":df["UNITID"],
-        #"Our Ranking":[0]*df["INSTNM"].count(),
-        "aggregateScore":[0.0]*df["INSTNM"].count()
-    })
-    
-    # Add the normalized columns to the output DataFrame.
-    for column in param.keys():
-        ourRankDF[column] = df[column]
-
-    for school in df["UNITID"]:
-        aggScoreNum = 0.0
-        for key in param.keys():
-            aggScoreNum += param[key] * df.query("UNITID==" + str(school))[key]
-        ourRankDF.loc[ourRankDF.eval("UNITID==" + str(school)), "aggregateScore"] = aggScoreNum / weightsTotal
-
-    ourRankDF = ourRankDF.sort_values("aggregateScore", 0, ascending=True)
-
-    ourRankings = np.arange(start=1, stop = df["INSTNM"].count() + 1, step=1).tolist()
-    ourRankDF["Our Ranking"] = ourRankings
-    #print(ourRankDF["Our Ranking"])
-
-    if hideOutsiders:
-        USNewsDF = dframes["usnews" + str(year)]
-        ourRankDF = ourRankDF[ (ourRankDF["UNITID"].isin(USNewsDF["UNITID"])) ]
-
-    if n != 0:
-        ourRankDF = ourRankDF.head(n)
-    return ourRankDF
+def parallelCoordinatesFigure(df, namesAndWeights):
+    parallel_coordinates_df = df.drop(columns=["UNITID", "aggregateScore"])
+    #parallel_coordinates_fig = px.parallel_coordinates(parallel_coordinates_df, color="Our Ranking", labels=namesAndWeights.keys())
+    parallel_coordinates_fig = px.parallel_coordinates(parallel_coordinates_df, labels=namesAndWeights.keys())
+    parallel_coordinates_fig.update_layout(margin=dict(l=70, r=70, t=50, b=50))
+    return parallel_coordinates_fig
 
 def dashboard():
 
@@ -131,81 +89,27 @@ def dashboard():
     # Show table of top N schools, based on our rankings:
     ourTableDF = pd.DataFrame({
         "Our Ranking":df["Our Ranking"].to_list(),
-        "US News Ranking":[""]*df["INSTNM"].count(),
+        "US News Ranking":pd.NA,
         "University Name":df["INSTNM"].tolist(),
         "UNITID":df["UNITID"].to_list()
     })
 
-    parallel_coordinates_df = df.drop(columns=["UNITID", "aggregateScore"])
+    # Everything the charts are drawn from. A chart is only built again when this changes, see lib.chartFigure.
+    chartKey = (selYear, tuple(namesAndWeights.items()), selMaxDeg, selN, hideOutsiders)
 
-    # Let's draw a parallel coordinates graph.
-    #parallel_coordinates_fig = px.parallel_coordinates(parallel_coordinates_df, color="Our Ranking", labels=namesAndWeights.keys())
-    parallel_coordinates_fig = px.parallel_coordinates(parallel_coordinates_df, labels=namesAndWeights.keys())
-    parallel_coordinates_fig.update_layout(margin=dict(l=70, r=70, t=50, b=50))
-    st.plotly_chart(parallel_coordinates_fig, use_container_width=True)
+    # Let's draw a parallel coordinates graph. Parallel coordinates are already drawn with WebGL.
+    parallel_coordinates_fig = lib.chartFigure("parallel coordinates", chartKey, lambda: parallelCoordinatesFigure(df, namesAndWeights))
+    with lib.span("plotly parallel coordinates"):
+        st.plotly_chart(parallel_coordinates_fig, use_container_width=True)
 
     # Put the US News rankings into the table.
-    for value in USNewsDF.iterrows():
-        try:            
-            usnewsrank = int(USNewsDF.query("UNITID=="+str(value[1]["UNITID"]))["US News Ranking"].to_list()[0])
-            ourTableDF.loc[ourTableDF["UNITID"] == value[1]["UNITID"], "US News Ranking"] = usnewsrank
-        except Exception as e: 
-            #print(e)
-            ourTableDF.loc[ourTableDF["UNITID"] == value[1]["UNITID"], "US News Ranking"] = ""
+    ourTableDF = lib.joinUSNews(ourTableDF, selYear)
 
     # We want a dumbbell plot to show the disparity between our ranking and US News' ranking.
-    dumbbell_schools = ourTableDF["University Name"]
-    dumbbell_data = {"line_x": [], "line_y": [], "Our Ranking": [], "US News Ranking": [], "schools": []}
-    for school in dumbbell_schools:
-        dumbbell_data["Our Ranking"].extend(ourTableDF.loc[ourTableDF["University Name"] == school]["Our Ranking"])
-        dumbbell_data["US News Ranking"].extend(ourTableDF.loc[ourTableDF["University Name"] == school]["US News Ranking"])
-        dumbbell_data["schools"] += [school]
-        dumbbell_data["line_x"].extend([
-            ourTableDF.query("`University Name` == \"" + str(school) + "\"")["Our Ranking"].to_list()[0],
-            ourTableDF.query("`University Name` == \"" + str(school) + "\"")["US News Ranking"].to_list()[0],
-            None
-        ])
-        dumbbell_data["line_y"].extend([school, school, None])
-
-    dumbbell_fig = go.Figure(
-        data=[
-            go.Scatter(
-                x=dumbbell_data["line_x"],
-                y=dumbbell_data["line_y"],
-                mode="lines",
-                showlegend=False,
-                marker=dict(color="black")
-            ),
-            go.Scatter(
-                x=dumbbell_data["Our Ranking"],
-                y=dumbbell_data["schools"],
-                mode="markers",
-                name="Our Ranking",
-                marker=dict(
-                    color="blue",
-                    size=10
-                )
-            ),
-            go.Scatter(
-                x=dumbbell_data["US News Ranking"],
-                y=dumbbell_data["schools"],
-                mode="markers",
-                name="US News Ranking",
-                marker=dict(
-                    color="goldenrod",
-                    size=10
-                )
-            )            
-        ]
-    )
-
-    dumbbell_fig.update_layout(
-        title="Rankings Disparity",
-        height=1000,
-        legend_itemclick=False
-    )
+    dumbbell_fig = lib.chartFigure("dumbbell weighted", chartKey, lambda: lib.dumbbellFigure(ourTableDF))
 
-    st.plotly_chart(dumbbell_fig, use_container_width=True)
+    with lib.span("plotly dumbbell"):
+        st.plotly_chart(dumbbell_fig, use_container_width=True)
 
     # Don't show index in displayed table.
     hide_table_row_index = """
@@ -216,16 +120,21 @@ def dashboard():
                 """
     st.markdown(hide_table_row_index, unsafe_allow_html=True)
 
-    st.table(ourTableDF)
+    with lib.span("st.table"):
+        lib.pagedTable(ourTableDF, "table page", table=True)
 
 def main():
     print("Economic Mobility Single Variable")
+    # Set RANKING_PROFILE=1 to see where the time goes, see lib.span.
+    lib.startrun("Economic Mobility Multi Variable")
     lib.loadschema()
     st.set_page_config(
         layout="wide", 
         initial_sidebar_state="expanded",
         page_title="Economic Mobility Multi Variable"
     )
-    dashboard()
+    with lib.span("dashboard"):
+        dashboard()
+    lib.profilePanel()
 
 main()
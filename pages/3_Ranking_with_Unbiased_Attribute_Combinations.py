@@ -1,48 +1,17 @@
 import plotly.express as px
 from pandas import DataFrame
 import pandas as pd
-import os
 import numpy as np
 import streamlit as st
 import matplotlib as plt
+import lib
 
-# Filesystem variables:
-scardpath = "./Clean College Scorecard Data/"
-usnewspath = "./usnews/"
-cachepath = "./nikhilcache/"
-
-# Data and where to find it:
-datastore = {
-    "scard":{
-        2009:scardpath+"MERGED2009_10_PP.csv",
-        2010:scardpath+"MERGED2010_11_PP.csv",
-        2011:scardpath+"MERGED2011_12_PP.csv",
-        2012:scardpath+"MERGED2012_13_PP.csv",
-        2013:scardpath+"MERGED2013_14_PP.csv",
-        2014:scardpath+"MERGED2014_15_PP.csv",
-        2015:scardpath+"MERGED2015_16_PP.csv",
-        2016:scardpath+"MERGED2016_17_PP.csv",
-        2017:scardpath+"MERGED2017_18_PP.csv",
-        2018:scardpath+"MERGED2018_19_PP.csv"
-    },
-    "usnews":usnewspath+"USnews_ranking_1984_2023.xlsx"
-    }
-
-yearStart = 2009
-yearEnd = 2018
-
-# Stores the data loaded from disk:
-dframes = {}
-
-#Function that iterates over a pandas dataframe and removes all rows that have
-#NaN/Null values in order to guarantee all calculations function correctly.
-
-def stripbadNikhil(colArr, df: DataFrame) -> DataFrame:
-    #Removes all null institutions from values specified in the usecols array
-    for s in colArr:
-        df = df[ (df[s].notnull()) ]
-
-    return df
+# The data comes from the shared store in lib, which serves this page's columns from the same cache as the
+# other pages.
+yearStart = lib.yearStart
+yearEnd = lib.yearEnd
+usecolsArr = lib.combinationColumns
+dframes = lib.dframes
 
 
 #Function that calculates the 'Combination Count', a value that is a composite
@@ -53,80 +22,46 @@ def stripbadNikhil(colArr, df: DataFrame) -> DataFrame:
 #in an unbiased attribute that can be used to rank the universities on the amount of attributes
 #that they fall in the top-k with. 
 
-def calcCombinationCount(df,k,warr):
-    weights = warr
+#The positions used come from lib.yearTopKPositions. They only depend on the data, so they are computed
+#once per year and kept with the year's table, leaving only a weighted sum to redo when k or the weights change.
+
+def combinationFeatures(df):
+    return [feature_name for feature_name in df.columns if feature_name not in ["UNITID","INSTNM","Combination Count"]]
+
+def calcCombinationCount(df,k,warr,positions=None):
+    if positions is None:
+      positions = lib.topKPositions(df, combinationFeatures(df))
     result = df.copy()
-    wi = 0
-    for feature_name in df.columns:
-      if(feature_name not in ["UNITID","INSTNM","Combination Count"]):
-        result = result.sort_values(by=[feature_name], ascending=False)
-        i = 0
-        for row in result.head(k).itertuples():
-          result.at[row.Index,"Combination Count"] += 1 * weights[wi]
-          i = i + 1
-        wi = wi + 1
-    return result
+    result["Combination Count"] = result["Combination Count"] + lib.combinationCount(positions, k, warr)
+    #Rows come back in the order the last attribute's sort left them in.
+    return result.iloc[np.argsort(positions[:, -1], kind="stable")]
 
 
 #Function that will normalized all entries for a column based on the average value of that column.
 #This is necessary in order to keep the visualization color coding for the heatmap consistent due to
 #the different ranges of each attribute. The values are then rounded to two decimal places for a
 #cleaner visualization. Normalization of values for certain attributes such as 'NPT42_PUB' and 'ADM_RATE'
-#are inverted since a high tuition and high admission rate is actually not good.
-
-
-def normalize(df):
-    result = df.copy()
-    for feature_name in df.columns:
-      if(feature_name not in ["UNITID","INSTNM"]):
-        max_value = df[feature_name].max()
-        min_value = df[feature_name].min()
-        normRound = round((df[feature_name] - min_value) / (max_value - min_value),2)
-        if(feature_name in ["NPT42_PUB", "ADM_RATE", "COSTT4_A", "TRANS_4"]):
-          result[feature_name] = round(1 - normRound,2)
-        else:
-          result[feature_name] = normRound
-    return result
+#are inverted since a high tuition and high admission rate is actually not good. The rows are then sorted
+#by the normalized Combination Count. Both are done by lib.sortCombination, which the batch runner's
+#combination ranking uses too, so the two always agree on the order.
 
 
 #Utilizes the normalized values in each cell and assigns a color gradient and label
 #for each number type value. For instance, if the normalized value is < .125 then it is
 #in the bottom 12.5 percentile and therefore is assigned the red color gradient with a
-#'Very Poor' label.
-
-
-def combo_percentile(v):
-    if isinstance(v,str):
-        return str(v)
-    elif v < .125:
-        return str(v) + " Very Poor"
-    elif v < .25:
-        return str(v) + " Poor"
-    elif v < .375:
-        return str(v) + " Subpar"
-    elif v < .5:
-        return str(v) + " Neutral"
-    elif v < .625:
-        return str(v) + " Neutral"
-    elif v < .75:
-        return str(v) + " Good"
-    elif v < .875:
-        return str(v) + " Great"
-    elif v <= 1:
-        return str(v) + " Excellent"
-    else:
-        return str(v)
-
-
-#Pandas dataframe make_pretty function that returns a styler object with the proper
-#stylizations. This is what converts the dataframe table to a heatmap visualization.
-#Utilizes the aforementioned functions as decision boundaries to format for color coding
-#and labeling. Also assigns a caption.
-
-def make_pretty(styler):
+#'Very Poor' label. The labels and colors come from lib.heatmapLabels and lib.heatmapColors,
+#which work out a whole page of cells at once.
+
+
+#Returns a styler object with the proper stylizations for the rows of the table being shown.
+#This is what converts the dataframe table to a heatmap visualization. The styler holds the
+#labelled text, colored by the numbers behind it. Also assigns a caption.
+
+def make_pretty(df):
+    colors = lib.heatmapColors(df, "RdYlGn", 0, 1)
+    styler = lib.heatmapLabels(df).style
     styler.set_caption("Universities Top-K Ranking Distribution with Attribute Combinations")
-    styler.format(combo_percentile)
-    styler.background_gradient(axis=None, vmin=0, vmax=1, cmap="RdYlGn")
+    styler.apply(lambda labels: colors, axis=None)
     return styler
 
 
@@ -135,45 +70,18 @@ def make_pretty(styler):
 #to select the top-k distinction that will be used to sort the universities. This will also
 #be implemented with a Streamlit input in the final version.
 
-# Make the cache directory if it does not exist.
-if not os.path.isdir(cachepath):
-    os.mkdir(cachepath)
-
-# Load College Scorecard data for each year.
-usecolsArr = ["UNITID", "INSTNM", "NPT42_PUB", "SAT_AVG", "ADM_RATE", "COSTT4_A", "PFTFAC", "TRANS_4", "ACTCM25", "RET_FT4", "PCTFLOAN"]
-year = yearStart
-while year <= yearEnd:
-    cachefile = cachepath + str(year) + ".csv"
-
-    if not os.path.exists(cachefile):
-        # Data is not cached, build our custom stripped tables from scratch.
-        df = pd.read_csv(filepath_or_buffer=datastore["scard"][year], usecols=usecolsArr)
-        df = stripbad(df)
-        df.to_csv(cachefile)
-        print("Loaded " + datastore["scard"][year])
-    # The data is cached, or we just created it. Load it now.
-    dframes[year] = pd.read_csv(cachefile)
-    print("[cache] Loaded " + cachefile)
-    year += 1
-
-# Load US News rankings data.
-year = yearStart
-df = pd.read_excel(datastore["usnews"])
-while year <= yearEnd:
-    cachefile = cachepath + "usnews" + str(year) + ".csv"
-    if not os.path.exists(cachefile):
-        # The ranking data has not been cached for the year in question.
-        newDF = pd.DataFrame({
-            "University Name":df["University Name"].to_list(),
-            "US News Ranking":df[year].to_list(),
-            "UNITID":df["UNITID"].to_list()
-        })
-        newDF.to_csv(cachefile)
-        print("Loaded " + datastore["usnews"] + " for " + str(year))
-    # The ranking data is cached, or we just created it. Load it now.
-    dframes["usnews" + str(year)] = pd.read_csv(cachefile)
-    print("[cache] Loaded " + cachefile)
-    year += 1
+#The table for a year with an empty Combination Count column next to the university name. Columns are in
+#the order of the raw data.
+
+def combinationFrame(year):
+    df = lib.getColumnSet(year, "combination").copy()
+    df.insert(2,"Combination Count",np.zeros(len(df.index)))
+    return df
+
+
+# Set RANKING_PROFILE=1 to see where the time goes, see lib.span.
+lib.startrun("Ranking with Unbiased Attribute Combinations")
+lib.loadschema()
 
 st.title("Ranking with Unbiased Attribute Combinations")
 st.sidebar.header("School Ranking Dashboard")
@@ -196,15 +104,14 @@ w9 = st.sidebar.slider("Percent Loan Weight", 0.1, 10.0, 1.0, 0.1)
 weightarr = [w1,w2,w3,w4,w5,w6,w7,w8,w9]
 #usecolsArr = ["UNITID","MN_EARN_WNE_INC1_P10","MN_EARN_WNE_INC2_P10","MN_EARN_WNE_INC3_P10","FEMALE_COMP_ORIG_YR3_RT","FEMALE_COMP_4YR_TRANS_YR3_RT","FEMALE_COMP_2YR_TRANS_YR3_RT","MALE_COMP_ORIG_YR3_RT","MALE_COMP_4YR_TRANS_YR3_RT","MALE_COMP_2YR_TRANS_YR3_RT","LO_INC_DEBT_MDN","MD_INC_DEBT_MDN","HI_INC_DEBT_MDN","COMPL_RPY_7YR_N","NONCOM_RPY_7YR_N","FEMALE_RPY_7YR_N","MALE_RPY_7YR_N","LO_INC_RPY_7YR_N","MD_INC_RPY_7YR_N","HI_INC_RPY_7YR_N","PELL_RPY_7YR_N","NOPELL_RPY_7YR_N","UGDS","NPT41_PUB","NPT42_PUB","NPT43_PUB","NPT44_PUB","NPT45_PUB","NPT41_PRIV","NPT42_PRIV","NPT43_PRIV","NPT44_PRIV","NPT45_PRIV","PCT_WHITE","PCT_BLACK","PCT_ASIAN","PCT_HISPANIC","PCT_BA","PCT_GRAD_PROF","PCT_BORN_US","SAT_AVG","ACTCM25","INSTNM"]
 #usecolsArr = ["UNITID", "INSTNM", "NPT42_PUB", "SAT_AVG", "ADM_RATE", "COSTT4_A", "PFTFAC", "TRANS_4"]
-df = pd.read_csv(datastore["scard"][selYear], usecols = usecolsArr)
-#df = dframes[selYear]
 #df["Combination Count"] = np.random.rand(len(df.index),1)
-df.insert(2,"Combination Count",np.zeros(len(df.index)))
-df = stripbadNikhil(usecolsArr,df)
-df = calcCombinationCount(df,k,weightarr)
-df = normalize(df)
-sorted_df = df.sort_values(by=['Combination Count'], ascending=False)
+df = combinationFrame(selYear)
+positions = lib.yearTopKPositions(selYear)
+df = calcCombinationCount(df,k,weightarr,positions)
+sorted_df = lib.sortCombination(df)
 sorted_df2 = sorted_df.rename({'UNITID': 'Unique ID', 'INSTM': 'University Name', 'NPT42_PUB': 'Average Tution', 'SAT_AVG': 'Average SAT Score', 'ACTCM25': 'Average ACT Score', 'RET_FT4': '4 Year Return', 'ADM_RATE': 'Admission Rate', 'COSTT4_A': 'Average 4-Year Cost', 'PFTFAC': 'Faculty-Student Ratio', 'TRANS_4': 'Transfer Rate'}, axis=1)
 #sorted_df.rename(columns={"UNITID":"Unique ID", "INSTNM":"University Name", "NPT42_PUB":"Avg. Tuition", "SAT_AVG":"Avg. SAT Score", "ADM_RATE": "Admission Rate", "COSTT4_A": "Average 4-Year Cost", "PFTFAC": "Faculty-Student Ratio", "TRANS_4": "Transfer Rate"})
-display_Nikhil = sorted_df2.head(100).style.pipe(make_pretty)
-st.dataframe(display_Nikhil)
+#Every school is shown, a page of 100 at a time. Only the page being shown is styled.
+with lib.span("st.dataframe heatmap"):
+    lib.pagedTable(sorted_df2, "heatmap page", 100, make_pretty)
+lib.profilePanel()
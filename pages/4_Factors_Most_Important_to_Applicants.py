@@ -1,6 +1,7 @@
 import plotly.express as px
 import pandas as pd
 import streamlit as st
+import lib
 
 # K-score:
 #     * affordability
@@ -14,7 +15,13 @@ import streamlit as st
 #          
 # https://edvoy.com/articles/highest-paying-majors-usa/
 
-full_dataset = pd.read_csv('./tyresedata/rankings.csv', low_memory=False)
+# Set RANKING_PROFILE=1 to see where the time goes, see lib.span.
+lib.startrun("Factors Most Important to Applicants")
+
+# Loaded once per server process and shared between sessions. work_set below is a filtered copy, so it is safe to
+# modify.
+with lib.span("load K-score data"):
+    full_dataset = lib.getdataset('tyresedata', lambda: pd.read_csv('./tyresedata/rankings.csv', low_memory=False))
 # output = full_dataset[full_dataset['COSTT4_A'] > 100_000]
 # print(output)
 
@@ -47,85 +54,20 @@ COST = 'COSTT4_A'
 COMPLETION = 'C100_4_POOLED_SUPP'
 DIV_GROUPS = ['UGDS_WHITE', 'UGDS_BLACK', 'UGDS_ASIAN', 'UGDS_AIAN', 'UGDS_NHPI']
 
-work_set = full_dataset.loc[
-    (full_dataset[HAS_CS] > 0.0) & (full_dataset[HAS_ENG] > 0.0) & (full_dataset[HAS_BIO] > 0.0) &
-    (full_dataset[HAS_MATH] > 0.0) & (full_dataset[HAS_SCI] > 0.0) &
-    (full_dataset[ADM_RATE] <= 0.12)]
-
-for idx, row in work_set.iterrows():
-    try:
-        work_set.at[idx, COMPLETION] = float(work_set.at[idx, COMPLETION])
-    except:
-        work_set.at[idx, COMPLETION] = 0.0
-
-
-work_set['K_SCORE'] = 0
-work_set['High-Paying Degrees'] = 0
-work_set['SAT Scores'] = 0
-work_set['Affordability'] = 0
-work_set['Completion Rate (4 Years)'] = 0
-work_set['Academics'] = 0
-work_set['Diversity'] = 0
+# Only selective schools offering CS, engineering, biology, math and science degrees are scored, see
+# lib.kscoreCandidates.
+work_set = lib.kscoreCandidates(full_dataset)
 
 
+# The K-score and its components are computed column-wise by lib.kscore, using the profiles in
+# lib.kscoreProfiles.
 def rank_normal():
-    for idx, row in work_set.iterrows():
-        k = 0
-        degrees = 0
-        diversity = 0
-
-        for deg in P_DEGS:  # calc degree coverage
-            degrees += (work_set.at[idx, deg] * 100) % 10
-
-
-        for race in DIV_GROUPS:  # calc racial spread
-            diversity = -diversity + work_set.at[idx, race]
-
-        diversity = abs(diversity) - (1/10) * work_set.at[idx, 'UGDS_HISP']
-        diversity = (1/abs(diversity)) * 3
-
-        sats = (work_set.at[idx, SAT_AVG] + 4*(work_set.at[idx, SAT_MATH] + work_set.at[idx, SAT_READ])) % 60
-        affordability = 1_000_000 / (work_set.loc[idx, COST])
-        completion = work_set.loc[idx, COMPLETION] * 40
-
-        k += degrees + sats + affordability + completion + diversity
-
-        work_set.loc[idx, 'K_SCORE'] = k
-        work_set.loc[idx, 'High-Paying Degrees'] = degrees
-        work_set.loc[idx, 'SAT Scores'] = sats
-        work_set.loc[idx, 'Affordability'] = affordability
-        work_set.loc[idx, 'Completion Rate (4 Years)'] = completion
-        work_set.loc[idx, 'Academics'] = degrees + sats + completion
-        work_set.loc[idx, 'Diversity'] = diversity
+    global work_set
+    work_set = lib.kscore(work_set, "normal")
 
 def rank_controversial():
-    for idx, row in work_set.iterrows():
-        k = 0
-        degrees = 0
-        diversity = 0
-
-        for deg in P_DEGS:  # calc degree coverage
-            degrees += (work_set.at[idx, deg] * 100) % 10
-
-        for race in DIV_GROUPS:  # calc racial spread
-            diversity = -diversity + work_set.at[idx, race]
-
-        diversity = abs(diversity) - (1/10) * work_set.at[idx, 'UGDS_HISP']
-        diversity = (1/abs(diversity)) * 25
-
-        sats = (work_set.at[idx, SAT_AVG] + 2*(work_set.at[idx, SAT_MATH] + work_set.at[idx, SAT_READ])) % 200
-        affordability = 4_000_000 / (work_set.loc[idx, COST])
-        completion = work_set.loc[idx, COMPLETION] * 40
-
-        k += degrees + sats + affordability + completion + diversity
-
-        work_set.loc[idx, 'K_SCORE'] = k
-        work_set.loc[idx, 'High-Paying Degrees'] = degrees
-        work_set.loc[idx, 'SAT Scores'] = sats
-        work_set.loc[idx, 'Affordability'] = affordability
-        work_set.loc[idx, 'Completion Rate (4 Years)'] = completion
-        work_set.loc[idx, 'Academics'] = degrees + sats + completion
-        work_set.loc[idx, 'Diversity'] = diversity
+    global work_set
+    work_set = lib.kscore(work_set, "controversial")
 
 
 
@@ -133,8 +75,8 @@ rank_normal()
 
 
 
-def dashboard():
-    stacked_bar = px.bar(work_set.nlargest(10, 'K_SCORE'),
+def stackedBar():
+    return px.bar(work_set.nlargest(10, 'K_SCORE'),
                     x="INSTNM", y=["Academics", 'Affordability', 'Diversity'],
                     title="TOP 10 UNIVERSITIES 2019, by Factors Most Important to Applicants ",
                     labels={
@@ -143,13 +85,19 @@ def dashboard():
                         "SAT Scores": "SAT Scores Scores", "variable":"Factor (most to least important)"},
                     template="plotly_dark")
 
-    st.plotly_chart(stacked_bar, use_container_width=True)
+def dashboard():
+    # Built once per profile until the data is reloaded, see lib.chartFigure.
+    stacked_bar = lib.chartFigure("kscore stacked bar", ("normal",), stackedBar)
+
+    with lib.span("plotly stacked bar"):
+        st.plotly_chart(stacked_bar, use_container_width=True)
     
 
 
 def main():
     print("Ranking with Unbiased Attribute Combinations")
     dashboard()
+    lib.profilePanel()
 
 main()
 
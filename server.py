@@ -0,0 +1,244 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# A small local HTTP service that serves our rankings as JSON, for tools that need them without going through the
+# dashboard. The data is loaded once and shared by every request, and requests are served on their own threads.
+# Responses are memoized per endpoint and parameters until the data is reloaded. Run from the project directory:
+#     python server.py --port 8450
+# Endpoints (GET unless noted):
+#     /ranking?year=2018&param=NPT41_PUB&maxDeg=0&top=10&hide=0      single param ranking, see lib.getTopNDF
+#     /weighted?year=2018&weights=NPT41_PUB=1,NPT45_PUB=0.5&maxDeg=0   multi-variable ranking (top and hide as above)
+#     /compare?year=2018&param=NPT41_PUB&maxDeg=0                     our ranking next to US News, and how well they
+#                                                                      agree; param=weighted uses weights
+#     /stats                                                           request latency percentiles, memo hit rates and
+#                                                                      the loaded tables, see lib.YearTables
+#     POST /reload                                                     reload the data from disk and clear the memo
+
+import argparse
+import collections
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+import numpy as np
+import pandas as pd
+import lib
+from batch import parseweights
+
+memoSize = 512
+# How many of the latest requests of each endpoint the latency percentiles are taken over.
+latencyWindow = 10000
+
+memo = collections.OrderedDict()
+memolock = threading.Lock()
+# Bumped on reload, so a response computed from the old data is not memoized after the memo was cleared.
+generation = 0
+stats = {}
+statslock = threading.Lock()
+
+# Raised for a request the service can't answer, with the HTTP status to answer it with.
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+# The query parameter called name, converted with kind, or default if it is not given.
+def queryvalue(query: dict, name: str, kind = str, default = None):
+    if name not in query:
+        if default is None:
+            raise RequestError(400, "missing parameter " + name)
+        return default
+    try:
+        return kind(query[name][-1])
+    except ValueError as e:
+        raise RequestError(400, "bad value for " + name + ": " + str(e))
+
+def queryyear(query: dict) -> int:
+    year = queryvalue(query, "year", int, lib.yearEnd)
+    if year < lib.yearStart or year > lib.yearEnd:
+        raise RequestError(404, "no data for %d" % year)
+    return year
+
+def queryparam(query: dict, allowed: list) -> str:
+    param = queryvalue(query, "param")
+    if param not in allowed:
+        raise RequestError(400, "unknown param " + param + ", expected one of " + ", ".join(allowed))
+    return param
+
+def querytop(query: dict) -> int:
+    top = queryvalue(query, "top", int, 0)
+    if top < 0:
+        raise RequestError(400, "bad value for top: %d, expected 0 (all) or more" % top)
+    return top
+
+def querydegree(query: dict) -> int:
+    maxDeg = queryvalue(query, "maxDeg", int, 0)
+    if maxDeg not in lib.highestDegNice.values():
+        raise RequestError(400, "bad value for maxDeg: %d, expected one of %s" % (maxDeg, ", ".join(str(value) for value in lib.highestDegNice.values())))
+    return maxDeg
+
+def queryweights(query: dict) -> dict:
+    return queryvalue(query, "weights", parseweights, {column:0.5 for column in lib.paramsColumns})
+
+def queryflag(query: dict, name: str) -> bool:
+    return queryvalue(query, name, str, "0").lower() in ["1", "true", "yes"]
+
+def records(df: pd.DataFrame) -> list:
+    return json.loads(df.to_json(orient="records"))
+
+def ranking(query: dict) -> dict:
+    year = queryyear(query)
+    param = queryparam(query, lib.paramsColumns)
+    maxDeg = querydegree(query)
+    df = lib.getTopNDF(querytop(query), param, year, maxDeg, queryflag(query, "hide"))
+    df = lib.joinUSNews(df[["Our Ranking", "INSTNM", "UNITID", "HIGHDEG", param]], year)
+    return {"year":year, "param":param, "maxDeg":maxDeg, "rows":records(df)}
+
+def weighted(query: dict) -> dict:
+    year = queryyear(query)
+    weights = queryweights(query)
+    maxDeg = querydegree(query)
+    df = lib.getWeightedTopNDF(querytop(query), weights, year, maxDeg, queryflag(query, "hide"))
+    df = lib.joinUSNews(df, year)
+    return {"year":year, "weights":weights, "maxDeg":maxDeg, "rows":records(df)}
+
+def compare(query: dict) -> dict:
+    year = queryyear(query)
+    param = queryparam(query, lib.paramsColumns + ["weighted"])
+    maxDeg = querydegree(query)
+    result = {"year":year, "param":param, "maxDeg":maxDeg}
+    if param == "weighted":
+        result["weights"] = queryweights(query)
+        df = lib.getWeightedRankDF(result["weights"], year, maxDeg)
+    else:
+        df = lib.getTopNDF(0, param, year, maxDeg, False)
+
+    df = lib.joinUSNews(df[["Our Ranking", "INSTNM", "UNITID"]], year)
+    theirs = pd.array(df["US News Ranking"], dtype="Float64").to_numpy(dtype=float, na_value=np.nan)
+    result["agreement"] = lib.rankAgreement(df["Our Ranking"].to_numpy(dtype=float), theirs, lib.agreementTopN)
+    df = df[ (df["US News Ranking"].notnull()) ].copy()
+    df["Difference"] = df["US News Ranking"] - df["Our Ranking"]
+    result["rows"] = records(df)
+    return result
+
+endpoints = {"/ranking":ranking, "/weighted":weighted, "/compare":compare}
+
+# Answer a request from the memo, or compute and memoize it. Returns the response body and whether it was a hit.
+def respond(path: str, query: dict) -> tuple:
+    key = (path, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+    with memolock:
+        if key in memo:
+            memo.move_to_end(key)
+            return memo[key], True
+        started = generation
+
+    body = json.dumps(endpoints[path](query)).encode()
+    with memolock:
+        if started != generation:
+            return body, False
+        memo[key] = body
+        while len(memo) > memoSize:
+            memo.popitem(last=False)
+    return body, False
+
+def record(path: str, seconds: float, hit: bool = None):
+    with statslock:
+        if path not in stats:
+            stats[path] = {"requests":0, "errors":0, "hits":0, "misses":0, "latency":collections.deque(maxlen=latencyWindow)}
+        entry = stats[path]
+        entry["requests"] += 1
+        entry["latency"].append(seconds)
+        if hit is None:
+            entry["errors"] += 1
+        elif hit:
+            entry["hits"] += 1
+        else:
+            entry["misses"] += 1
+
+# Latency percentiles (in milliseconds) and memo hit rate for each endpoint.
+def statsreport() -> dict:
+    report = {"memo":{"entries":len(memo), "size":memoSize}, "tables":lib.dframes.stats(), "endpoints":{}}
+    with statslock:
+        for path in stats.keys():
+            entry = stats[path]
+            latency = np.array(entry["latency"]) * 1000.0
+            lookups = entry["hits"] + entry["misses"]
+            report["endpoints"][path] = {
+                "requests":entry["requests"],
+                "errors":entry["errors"],
+                "hits":entry["hits"],
+                "misses":entry["misses"],
+                "hit_rate":entry["hits"] / lookups if lookups else 0.0,
+                "latency_ms":{"p50":np.percentile(latency, 50), "p90":np.percentile(latency, 90),
+                              "p99":np.percentile(latency, 99), "max":latency.max()}
+            }
+    return report
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/stats":
+            self.send(200, json.dumps(statsreport()).encode())
+            return
+        if url.path not in endpoints:
+            self.send(404, json.dumps({"error":"unknown endpoint " + url.path}).encode())
+            return
+
+        try:
+            body, hit = respond(url.path, urllib.parse.parse_qs(url.query))
+        except RequestError as e:
+            record(url.path, time.perf_counter() - start)
+            self.send(e.status, json.dumps({"error":str(e)}).encode())
+            return
+        except Exception as e:
+            record(url.path, time.perf_counter() - start)
+            self.send(500, json.dumps({"error":repr(e)}).encode())
+            return
+        self.send(200, body)
+        record(url.path, time.perf_counter() - start, hit)
+
+    def do_POST(self):
+        global generation
+        if urllib.parse.urlsplit(self.path).path != "/reload":
+            self.send(404, json.dumps({"error":"unknown endpoint " + self.path}).encode())
+            return
+        report = lib.reload()
+        with memolock:
+            memo.clear()
+            generation += 1
+        self.send(200, json.dumps({"reloaded":len(report)}).encode())
+
+    def log_message(self, format, *args):
+        pass # One line per request is too much; /stats has the numbers.
+
+def serve(host: str = "127.0.0.1", port: int = 8450) -> http.server.ThreadingHTTPServer:
+    lib.loadschema()
+    return http.server.ThreadingHTTPServer((host, port), Handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve College Scorecard rankings as JSON.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1, this machine only)")
+    parser.add_argument("--port", type=int, default=8450, help="port to listen on (default 8450)")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port)
+    print("Serving rankings on http://%s:%d/" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
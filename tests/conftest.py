@@ -0,0 +1,78 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Shared fixtures for the tests. Every test runs on small generated data (see bench.makeData), never on the real data,
+# so neither the raw College Scorecard files nor a cache is needed. Run from the project directory:
+#     python -m pytest -q tests
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench
+import lib
+import reference
+
+# Schools a year in the generated data.
+testRows = 200
+
+# Generate data for rows schools a year into directory. Returns the paths, see bench.makeData.
+def makedata(directory: str, rows: int = testRows, seed: int = 0) -> dict:
+    saved = bench.baseRows
+    bench.baseRows = rows
+    try:
+        return bench.makeData(directory, 1, seed)
+    finally:
+        bench.baseRows = saved
+
+# The data every test shares, loaded into lib with its cache in the same directory. Afterwards lib is pointed back at
+# where it was, unloaded.
+@pytest.fixture(scope="session")
+def data(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("data"))
+    paths = makedata(directory)
+    saved = bench.useData(paths, directory)
+    yield {"paths":paths, "directory":directory}
+    lib.datastore = saved["datastore"]
+    lib.cachepath = saved["cachepath"]
+    lib.datasets.clear()
+    lib.dataloaders.clear()
+    lib.loaded = False
+
+# Data with as many schools as the real data, for page 3's "combination" set, which only keeps the schools with every
+# one of its columns (a couple of hundred a year here). Generated once; see wide for loading it.
+@pytest.fixture(scope="session")
+def widedata(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("wide"))
+    return {"paths":makedata(directory, bench.baseRows, seed=2), "directory":directory}
+
+# widedata loaded into lib for the tests of a module. Afterwards lib is loaded from the shared data again.
+@pytest.fixture(scope="module")
+def wide(data, widedata):
+    bench.useData(widedata["paths"], widedata["directory"])
+    yield widedata
+    bench.useData(data["paths"], data["directory"])
+
+# The tables the original code loaded from the shared data, see reference.load.
+@pytest.fixture(scope="session")
+def original(data):
+    return reference.load(data["paths"])
+
+# For tests that point lib at other data or change its settings: afterwards lib is loaded from the shared data again.
+@pytest.fixture
+def repoint(data):
+    yield
+    bench.useData(data["paths"], data["directory"])
+
+# Small data of its own for a test that changes the data or the cache, loaded into lib. Returns its paths and
+# directory, like data.
+@pytest.fixture
+def fresh(repoint, tmp_path):
+    directory = str(tmp_path)
+    paths = makedata(directory, 60, seed=1)
+    bench.useData(paths, directory)
+    return {"paths":paths, "directory":directory}
@@ -0,0 +1,278 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The original implementations of what lib now does faster, kept as they were (only taken out of the pages and given
+# their inputs as arguments) so the tests can check that the results have not changed.
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+import lib
+
+# The original stripbad: schools without HIGHDEG or any of the params are removed.
+def stripbad(df: DataFrame) -> DataFrame:
+    df = df[ (df["HIGHDEG"].notnull()) ]
+    for param in lib.paramsColumns:
+        df = df[ (df[param].notnull()) ]
+    return df
+
+# A year's table as the original loadschema loaded it: the raw file read whole, stripped, and written to and read
+# back from a CSV cache (which numbered the rows afresh). Suppressed values are read as blanks, as they are now.
+def scorecard(sourcefile: str) -> DataFrame:
+    df = pd.read_csv(filepath_or_buffer=sourcefile, usecols=lib.usecols, na_values=lib.nullValues)
+    return stripbad(df).reset_index(drop=True)
+
+# A table with the types the original code had: names as plain strings and every number as float64, so tables from
+# the compact store can be compared with the original ones value for value.
+def plain(df: DataFrame) -> DataFrame:
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) or df[column].dtype == object:
+            df[column] = df[column].astype(object)
+        else:
+            df[column] = df[column].astype(np.float64)
+    return df.reset_index(drop=True)
+
+# A year's US News table as the original loadschema loaded it, through a CSV cache.
+def usnews(workbook: DataFrame, year: int) -> DataFrame:
+    newDF = pd.DataFrame({
+        "University Name":workbook["University Name"].to_list(),
+        "US News Ranking":workbook[year].to_list(),
+        "UNITID":workbook["UNITID"].to_list()
+    })
+    return newDF.reset_index(drop=True)
+
+# The original dframes for the data at paths (see bench.makeData): every year's Scorecard and US News table.
+def load(paths: dict) -> dict:
+    dframes = {}
+    workbook = pd.read_excel(paths["usnews"])
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        dframes[year] = scorecard(paths["scard"][year])
+        dframes["usnews" + str(year)] = usnews(workbook, year)
+    return dframes
+
+# Page 2's original multi-variable ranking, one school at a time.
+def weightedTopNDF(dframes: dict, n: int, param: dict, year: int, maxDeg: int, hideOutsiders: bool) -> DataFrame:
+    weightsTotal = 0.000001 # Don't divide by 0 on initial run.
+    for key in param.keys():
+        weightsTotal += param[key]
+
+    df = dframes[year]
+    df = df[ (df["HIGHDEG"] >= maxDeg) ].copy()
+
+    # Normalize data using min-max feature scaling.
+    for column in lib.paramsColumns:
+        df[column] = (df[column] - df[column].min()) / (df[column].max() - df[column].min())
+
+    # If higher is better, subract 1 from normalized values to reverse the scale.
+    for column in param.keys():
+        if not lib.lowerIsBetter[column]:
+            df[column] = 1.0 - df[column]
+
+    ourRankDF = pd.DataFrame({
+        "INSTNM":df["INSTNM"],
+        "UNITID":df["UNITID"],
+        "aggregateScore":[0.0]*df["INSTNM"].count()
+    })
+
+    # Add the normalized columns to the output DataFrame.
+    for column in param.keys():
+        ourRankDF[column] = df[column]
+
+    for school in df["UNITID"]:
+        aggScoreNum = 0.0
+        for key in param.keys():
+            aggScoreNum += param[key] * df.query("UNITID==" + str(school))[key]
+        ourRankDF.loc[ourRankDF.eval("UNITID==" + str(school)), "aggregateScore"] = aggScoreNum / weightsTotal
+
+    ourRankDF = ourRankDF.sort_values("aggregateScore", axis=0, ascending=True)
+
+    ourRankings = np.arange(start=1, stop = df["INSTNM"].count() + 1, step=1).tolist()
+    ourRankDF["Our Ranking"] = ourRankings
+
+    if hideOutsiders:
+        USNewsDF = dframes["usnews" + str(year)]
+        ourRankDF = ourRankDF[ (ourRankDF["UNITID"].isin(USNewsDF["UNITID"])) ]
+
+    if n != 0:
+        ourRankDF = ourRankDF.head(n)
+    return ourRankDF
+
+# Pages 1 and 2's original US News join: every school US News ranked is looked up in the table one at a time.
+# Schools without a rank are left as "".
+def usnewsColumn(ourTableDF: DataFrame, USNewsDF: DataFrame) -> DataFrame:
+    ourTableDF = ourTableDF.copy()
+    ourTableDF["US News Ranking"] = [""]*ourTableDF["UNITID"].count()
+    for value in USNewsDF.iterrows():
+        try:
+            usnewsrank = int(USNewsDF.query("UNITID=="+str(value[1]["UNITID"]))["US News Ranking"].to_list()[0])
+            ourTableDF.loc[ourTableDF["UNITID"] == value[1]["UNITID"], "US News Ranking"] = usnewsrank
+        except Exception as e:
+            ourTableDF.loc[ourTableDF["UNITID"] == value[1]["UNITID"], "US News Ranking"] = ""
+    return ourTableDF
+
+# Pages 1 and 2's original dumbbell plot data, built one school at a time by name.
+def dumbbell(ourTableDF: DataFrame) -> dict:
+    dumbbell_schools = ourTableDF["University Name"]
+    dumbbell_data = {"line_x": [], "line_y": [], "Our Ranking": [], "US News Ranking": [], "schools": []}
+    for school in dumbbell_schools:
+        dumbbell_data["Our Ranking"].extend(ourTableDF.loc[ourTableDF["University Name"] == school]["Our Ranking"])
+        dumbbell_data["US News Ranking"].extend(ourTableDF.loc[ourTableDF["University Name"] == school]["US News Ranking"])
+        dumbbell_data["schools"] += [school]
+        dumbbell_data["line_x"].extend([
+            ourTableDF.query("`University Name` == \"" + str(school) + "\"")["Our Ranking"].to_list()[0],
+            ourTableDF.query("`University Name` == \"" + str(school) + "\"")["US News Ranking"].to_list()[0],
+            None
+        ])
+        dumbbell_data["line_y"].extend([school, school, None])
+    return dumbbell_data
+
+# Page 3's original stripbad: schools without every one of the given columns are removed.
+def stripbadNikhil(colArr, df: DataFrame) -> DataFrame:
+    for s in colArr:
+        df = df[ (df[s].notnull()) ]
+    return df
+
+# Page 3's table for a year, as it was read from the raw file, with an empty Combination Count.
+def combinationFrame(sourcefile: str) -> DataFrame:
+    df = pd.read_csv(sourcefile, usecols=lib.combinationColumns, na_values=lib.nullValues)
+    df.insert(2,"Combination Count",np.zeros(len(df.index)))
+    return stripbadNikhil(lib.combinationColumns, df)
+
+# Page 3's original Combination Count: the table is sorted by each feature in turn and the top k of each sort get the
+# feature's weight added.
+def calcCombinationCount(df,k,warr):
+    weights = warr
+    result = df.copy()
+    wi = 0
+    for feature_name in df.columns:
+      if(feature_name not in ["UNITID","INSTNM","Combination Count"]):
+        result = result.sort_values(by=[feature_name], ascending=False)
+        i = 0
+        for row in result.head(k).itertuples():
+          result.at[row.Index,"Combination Count"] += 1 * weights[wi]
+          i = i + 1
+        wi = wi + 1
+    return result
+
+# Page 3's original heatmap normalization.
+def normalize(df):
+    result = df.copy()
+    for feature_name in df.columns:
+      if(feature_name not in ["UNITID","INSTNM"]):
+        max_value = df[feature_name].max()
+        min_value = df[feature_name].min()
+        normRound = round((df[feature_name] - min_value) / (max_value - min_value),2)
+        if(feature_name in ["NPT42_PUB", "ADM_RATE", "COSTT4_A", "TRANS_4"]):
+          result[feature_name] = round(1 - normRound,2)
+        else:
+          result[feature_name] = normRound
+    return result
+
+# Page 3's original table, in the order it was shown.
+def combinationPage(sourcefile: str, k: int, warr: list) -> DataFrame:
+    df = calcCombinationCount(combinationFrame(sourcefile), k, warr)
+    df = normalize(df)
+    return df.sort_values(by=['Combination Count'], ascending=False)
+
+# Page 4's original K-score, one school at a time. profile is "normal" or "controversial".
+def kscorePage(full_dataset: DataFrame, profile: str) -> DataFrame:
+    P_DEGS = ['PCIP11', 'PCIP26', 'PCIP27', 'PCIP14', 'PCIP22', 'PCIP40', 'PCIP51']
+    SAT_MATH = 'SATMT75'
+    SAT_READ = 'SATVR75'
+    SAT_AVG = 'SAT_AVG'
+    COST = 'COSTT4_A'
+    COMPLETION = 'C100_4_POOLED_SUPP'
+    DIV_GROUPS = ['UGDS_WHITE', 'UGDS_BLACK', 'UGDS_ASIAN', 'UGDS_AIAN', 'UGDS_NHPI']
+    diversityWeight, satMultiplier, satModulus, affordabilityWeight = \
+        (3, 4, 60, 1_000_000) if profile == "normal" else (25, 2, 200, 4_000_000)
+
+    work_set = full_dataset.loc[
+        (full_dataset['CIP11BACHL'] > 0.0) & (full_dataset['CIP14BACHL'] > 0.0) & (full_dataset['CIP26BACHL'] > 0.0) &
+        (full_dataset['CIP27BACHL'] > 0.0) & (full_dataset['CIP40BACHL'] > 0.0) &
+        (full_dataset['ADM_RATE'] <= 0.12)].copy()
+
+    for idx, row in work_set.iterrows():
+        try:
+            work_set.at[idx, COMPLETION] = float(work_set.at[idx, COMPLETION])
+        except:
+            work_set.at[idx, COMPLETION] = 0.0
+
+    for column in ['K_SCORE', 'High-Paying Degrees', 'SAT Scores', 'Affordability', 'Completion Rate (4 Years)', 'Academics', 'Diversity']:
+        work_set[column] = 0
+
+    for idx, row in work_set.iterrows():
+        k = 0
+        degrees = 0
+        diversity = 0
+
+        for deg in P_DEGS:  # calc degree coverage
+            degrees += (work_set.at[idx, deg] * 100) % 10
+
+        for race in DIV_GROUPS:  # calc racial spread
+            diversity = -diversity + work_set.at[idx, race]
+
+        diversity = abs(diversity) - (1/10) * work_set.at[idx, 'UGDS_HISP']
+        diversity = (1/abs(diversity)) * diversityWeight
+
+        sats = (work_set.at[idx, SAT_AVG] + satMultiplier*(work_set.at[idx, SAT_MATH] + work_set.at[idx, SAT_READ])) % satModulus
+        affordability = affordabilityWeight / (work_set.loc[idx, COST])
+        completion = work_set.loc[idx, COMPLETION] * 40
+
+        k += degrees + sats + affordability + completion + diversity
+
+        work_set.loc[idx, 'K_SCORE'] = k
+        work_set.loc[idx, 'High-Paying Degrees'] = degrees
+        work_set.loc[idx, 'SAT Scores'] = sats
+        work_set.loc[idx, 'Affordability'] = affordability
+        work_set.loc[idx, 'Completion Rate (4 Years)'] = completion
+        work_set.loc[idx, 'Academics'] = degrees + sats + completion
+        work_set.loc[idx, 'Diversity'] = diversity
+    return work_set
+
+# The original lib.getTopNDF: the year's table sorted by param. If n = 0, do not truncate the list.
+def getTopNDF(dframes: dict, n: int, param: str, year: int, maxDeg: int, hideOutsiders: bool) -> DataFrame:
+    df = dframes[year]
+    df = df[ (df["HIGHDEG"] >= maxDeg) ]
+
+    if lib.lowerIsBetter[param]:
+        df = df.sort_values(param, axis=0)
+    else:
+        df = df.sort_values(by=param, axis=0, ascending=False)
+
+    ourRankings = np.arange(start=1, stop = df["INSTNM"].count() + 1, dtype=int).tolist()
+    df = df.copy()
+    df["Our Ranking"] = ourRankings
+
+    if hideOutsiders:
+        USNewsDF = dframes["usnews" + str(year)]
+        df = df[ (df["UNITID"].isin(USNewsDF["UNITID"])) ]
+
+    if n != 0:
+        df = df.head(n)
+    return df
+
+# Page 3's original heatmap label of one cell.
+def combo_percentile(v):
+    if isinstance(v,str):
+        return str(v)
+    elif v < .125:
+        return str(v) + " Very Poor"
+    elif v < .25:
+        return str(v) + " Poor"
+    elif v < .375:
+        return str(v) + " Subpar"
+    elif v < .5:
+        return str(v) + " Neutral"
+    elif v < .625:
+        return str(v) + " Neutral"
+    elif v < .75:
+        return str(v) + " Good"
+    elif v < .875:
+        return str(v) + " Great"
+    elif v <= 1:
+        return str(v) + " Excellent"
+    else:
+        return str(v)
@@ -0,0 +1,83 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Rank agreement with US News, against plain pairwise definitions and the original rankings and US News lookup.
+
+import numpy as np
+import pandas as pd
+import pytest
+import lib
+import reference
+
+def naivekendall(x: np.ndarray, y: np.ndarray) -> float:
+    n = len(x)
+    concordant = 0
+    xties = 0
+    yties = 0
+    pairs = 0
+    for i in range(n):
+        for j in range(i + 1, n):
+            dx = np.sign(x[i] - x[j])
+            dy = np.sign(y[i] - y[j])
+            concordant += dx * dy
+            xties += dx == 0
+            yties += dy == 0
+            pairs += 1
+    return concordant / np.sqrt(float(pairs - xties) * float(pairs - yties))
+
+def test_countinversions():
+    rng = np.random.default_rng(5)
+    for n in [0, 1, 2, 7, 64, 101]:
+        values = rng.integers(0, 12, n)
+        expected = sum(values[i] > values[j] for i in range(n) for j in range(i + 1, n))
+        assert lib.countinversions(values) == expected
+
+def test_kendall_matches_pairwise():
+    rng = np.random.default_rng(6)
+    for n in [9, 30, 80]:
+        x = rng.integers(0, 10, n).astype(float)
+        y = (x + rng.integers(-3, 4, n)).astype(float)
+        assert lib.kendalltau(x, y) == pytest.approx(naivekendall(x, y), abs=1e-12)
+
+# One row of the agreement table, from the original ranking and the original US News lookup.
+def expectedRow(original: dict, year: int, param: str, maxDeg: int) -> dict:
+    df = reference.getTopNDF(original, 0, param, year, maxDeg, False)
+    table = pd.DataFrame({"Our Ranking":df["Our Ranking"].to_numpy(), "UNITID":df["UNITID"].to_numpy()})
+    table = reference.usnewsColumn(table, original["usnews" + str(year)])
+    table = table[ (table["US News Ranking"] != "") ]
+    ours = table["Our Ranking"].rank(method="average").to_numpy()
+    theirs = table["US News Ranking"].astype(float).rank(method="average").to_numpy()
+    top = min(lib.agreementTopN, len(ours))
+    return {
+        "Schools":len(ours),
+        "Spearman":pd.Series(ours).corr(pd.Series(theirs)),
+        "Kendall":naivekendall(ours, theirs),
+        "Top 10 Overlap":((ours <= top) & (theirs <= top)).sum() / top,
+        "Mean Displacement":np.abs(ours - theirs).mean()
+    }
+
+def test_table_matches_original(original, data):
+    table = lib.agreementTable().set_index(["Year", "Param", "Max Degree"])
+    assert len(table.index) == (lib.yearEnd - lib.yearStart + 1) * len(lib.highestDegNice) * (len(lib.paramsColumns) + 1)
+    for year, param, maxDeg in [(2009, "NPT41_PUB", 0), (2014, "NPT43_PUB", 3), (2018, "NPT45_PUB", 1)]:
+        expected = expectedRow(original, year, param, maxDeg)
+        row = table.loc[(year, param, maxDeg)]
+        assert row["Schools"] == expected["Schools"]
+        for key in ["Spearman", "Kendall", "Top 10 Overlap", "Mean Displacement"]:
+            assert row[key] == pytest.approx(expected[key], abs=1e-12)
+
+# The home page only shows the table if it is already computed; asking for it must not load any year.
+def test_not_computed_on_load(fresh, monkeypatch):
+    lib.dframes.reset(lib.dframes.loaders)
+    misses = lib.dframes.counters["misses"]
+    assert lib.getAgreement(compute=False) is None
+    assert lib.dframes.counters["misses"] == misses
+
+    table = lib.getAgreement()
+    lib.datasets.clear()
+    pd.testing.assert_frame_equal(lib.getAgreement(compute=False), table)
+
+    monkeypatch.setattr(lib, "agreementTopN", 5)
+    assert lib.storedagreement() is None
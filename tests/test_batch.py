@@ -0,0 +1,82 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The headless batch runner, against the original code of each page.
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import batch
+import lib
+import reference
+
+combinationWeights = [0.1, 3.7, 1.0, 10.0, 0.5, 2.2, 7.1, 0.3, 4.4]
+
+# The batch combination ranking comes out in page 3's order, with the counts before normalizing.
+@pytest.mark.parametrize("weights", [[1.0]*9, combinationWeights])
+def test_combination_matches_page(wide, weights):
+    for year in [2012, 2018]:
+        for k in [10, 25, 80]:
+            sourcefile = wide["paths"]["scard"][year]
+            expected = reference.combinationPage(sourcefile, k, weights)
+            counts = reference.calcCombinationCount(reference.combinationFrame(sourcefile), k, weights)
+            result = lib.combinationRanking(year, k, weights)
+            assert result["UNITID"].tolist() == expected["UNITID"].tolist()
+            assert result["Combination Count"].tolist() == counts.loc[expected.index, "Combination Count"].tolist()
+            assert result["Our Ranking"].tolist() == list(range(1, len(expected.index) + 1))
+
+def test_run_matches_original(wide, tmp_path):
+    original = reference.load(wide["paths"])
+    weights = {"NPT45_PUB":1.0, "NPT42_PUB":0.2}
+    out = {}
+    for workers in [1, 2]:
+        out[workers] = str(tmp_path / str(workers))
+        assert batch.main(["--years", "2011,2018", "--methods", "single,weighted,combination,kscore", "--params", "NPT43_PUB",
+                           "--degrees", "0,3", "--weights", "NPT45_PUB=1,NPT42_PUB=0.2", "--top", "40", "--k", "20",
+                           "--combination-weights", ",".join(str(weight) for weight in combinationWeights),
+                           "--profiles", "normal,controversial", "--kscore-data", wide["paths"]["kscore"],
+                           "--out", out[workers], "--workers", str(workers)]) == 0
+
+    files = sorted(name for name in os.listdir(out[1]) if name != "index.csv")
+    assert len(files) == 2 * 2 + 2 * 2 + 2 + 2
+    assert sorted(pd.read_csv(os.path.join(out[1], "index.csv"))["file"]) == files
+    for name in files:
+        pd.testing.assert_frame_equal(pd.read_csv(os.path.join(out[2], name)), pd.read_csv(os.path.join(out[1], name)))
+
+    for year in [2011, 2018]:
+        for maxDeg in [0, 3]:
+            result = pd.read_csv(os.path.join(out[1], "single_%d_NPT43_PUB_deg%d.csv" % (year, maxDeg)))
+            expected = reference.getTopNDF(original, 40, "NPT43_PUB", year, maxDeg, False)
+            assert result["UNITID"].tolist() == expected["UNITID"].tolist()
+            assert result["Our Ranking"].tolist() == expected["Our Ranking"].tolist()
+            np.testing.assert_array_equal(result["NPT43_PUB"], expected["NPT43_PUB"])
+
+            result = pd.read_csv(os.path.join(out[1], "weighted_%d_w0_deg%d.csv" % (year, maxDeg)), float_precision="round_trip")
+            expected = reference.weightedTopNDF(original, 40, weights, year, maxDeg, False)
+            assert result["UNITID"].tolist() == expected["UNITID"].tolist()
+            np.testing.assert_array_equal(result["aggregateScore"], expected["aggregateScore"])
+
+        result = pd.read_csv(os.path.join(out[1], "combination_%d_k20.csv" % year))
+        expected = reference.combinationPage(wide["paths"]["scard"][year], 20, combinationWeights)
+        assert result["UNITID"].tolist() == expected["UNITID"].head(40).tolist()
+
+    full_dataset = pd.read_csv(wide["paths"]["kscore"], low_memory=False)
+    for profile in ["normal", "controversial"]:
+        result = pd.read_csv(os.path.join(out[1], "kscore_" + profile + ".csv"))
+        expected = reference.kscorePage(full_dataset, profile).nlargest(40, "K_SCORE")
+        assert result["UNITID"].tolist() == expected["UNITID"].tolist()
+
+# Settings the rankings can't be made with are refused up front, like the server does.
+@pytest.mark.parametrize("argv", [["--top", "-1"], ["--degrees", "0,9"], ["--k", "0"], ["--k", "10,-5"]])
+def test_bad_settings_refused(argv, capsys):
+    with pytest.raises(SystemExit):
+        batch.parseargs(argv)
+    assert "error:" in capsys.readouterr().err
+
+def test_no_temporary_files_left(data, tmp_path):
+    assert batch.main(["--years", "2014", "--params", "NPT41_PUB", "--out", str(tmp_path), "--workers", "1"]) == 0
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+    assert sorted(os.listdir(tmp_path)) == sorted(["index.csv", "single_2014_NPT41_PUB_deg0.csv", "weighted_2014_w0_deg0.csv"])
@@ -0,0 +1,51 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The benchmark suite: its generated data, the legacy loop it compares against, and a run of every benchmark.
+
+import filecmp
+import pandas as pd
+import bench
+import lib
+import reference
+from conftest import makedata
+
+def test_generated_data_is_repeatable(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    first = makedata(str(tmp_path / "a"), 50, seed=9)
+    second = makedata(str(tmp_path / "b"), 50, seed=9)
+    for year in first["scard"].keys():
+        assert filecmp.cmp(first["scard"][year], second["scard"][year], shallow=False)
+    assert filecmp.cmp(first["kscore"], second["kscore"], shallow=False)
+
+def test_generated_data_is_laid_out_like_real(data):
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        raw = pd.read_csv(data["paths"]["scard"][year], dtype=str, keep_default_na=False)
+        assert raw.columns.tolist() == bench.rawColumns
+        assert len(raw.index) == 200
+        assert (raw[lib.paramsColumns] == "PrivacySuppressed").any().any()
+        assert (raw[lib.paramsColumns] == "NULL").any().any()
+        assert (raw[lib.paramsColumns] == "").any().any()
+        # The original loader reads it.
+        assert len(reference.scorecard(data["paths"]["scard"][year]).index) > 0
+    workbook = pd.read_excel(data["paths"]["usnews"])
+    assert workbook.columns.tolist() == ["University Name", "UNITID"] + list(range(lib.yearStart, lib.yearEnd + 1))
+
+# The loop the benchmarks compare against is page 2's original.
+def test_legacy_loop_is_original(original):
+    weights = {"NPT42_PUB":0.7, "NPT44_PUB":0.1}
+    expected = reference.weightedTopNDF(original, 0, weights, 2014, 1, False)
+    pd.testing.assert_frame_equal(reference.plain(bench.legacyWeightedRankDF(original[2014], weights, 1)), reference.plain(expected))
+
+def test_every_benchmark_runs(fresh, monkeypatch):
+    monkeypatch.setattr(bench, "results", [])
+    for benchmark in bench.benchmarks:
+        benchmark(1, fresh["directory"])
+    names = [result["name"] for result in bench.results]
+    assert len(names) == len(set(names))
+    assert {"loadschema cold", "getTopNDF all", "weighted legacy loop", "joinUSNews 1 year", "topKPositions", "kscore normal"} <= set(names)
+    for result in bench.results:
+        assert result["best_ms"] >= 0 and result["median_ms"] >= result["best_ms"] and result["peak_kib"] >= 0
@@ -0,0 +1,49 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The table cache: Feather and CSV files, and the CSV export.
+
+import os
+import numpy as np
+import pandas as pd
+import bench
+import lib
+import reference
+
+def test_writecache_roundtrip(tmp_path):
+    df = pd.DataFrame({"UNITID":[3, 1, 2], "INSTNM":["c", "a", "b"], "NPT41_PUB":[1.5, np.nan, 3.0]}, index=[7, 8, 9])
+    for fmt in lib.cacheext.keys():
+        cachefile = lib.cachefilename("roundtrip", fmt, str(tmp_path) + os.sep)
+        lib.writecache(df, cachefile, fmt)
+        back = lib.readcache(cachefile, fmt)
+        assert "Unnamed: 0" not in back.columns
+        pd.testing.assert_frame_equal(back, df.reset_index(drop=True))
+        assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+# CSV caches written by the original loadschema kept their index as a first, unnamed column.
+def test_readcache_drops_old_index(tmp_path):
+    cachefile = str(tmp_path / "old.csv")
+    pd.DataFrame({"UNITID":[1, 2], "HIGHDEG":[3, 4]}).to_csv(cachefile)
+    assert list(lib.readcache(cachefile, "csv").columns) == ["UNITID", "HIGHDEG"]
+
+def test_cache_matches_original_loader(data):
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        cached = lib.readcache(lib.cachefilename(str(year)))
+        cached = lib.projectcolumns(cached, lib.usecols, lib.columnSets["mobility"]["required"])
+        expected = reference.scorecard(data["paths"]["scard"][year])
+        pd.testing.assert_frame_equal(cached, expected, check_dtype=False)
+
+# Exported CSVs hold every cached column, so they can stand in for the raw data.
+def test_exportcsv_seeds_cache(data, repoint, tmp_path):
+    directory = str(tmp_path) + os.sep
+    lib.exportcsv(directory)
+    expected = {year:lib.readcache(lib.cachefilename(str(year))) for year in range(lib.yearStart, lib.yearEnd + 1)}
+
+    lib.datastore = {"scard":{year:str(tmp_path / "missing.csv") for year in expected.keys()}, "usnews":data["paths"]["usnews"]}
+    lib.cachepath = directory
+    lib.loadschema(reload=True)
+    for year in expected.keys():
+        assert os.path.exists(lib.cachefilename(str(year)))
+        pd.testing.assert_frame_equal(lib.readcache(lib.cachefilename(str(year))), expected[year], check_dtype=False)
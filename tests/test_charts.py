@@ -0,0 +1,61 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# WebGL traces for large charts, thinning marker traces, and the memoized figures.
+
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+def test_webgl_above_threshold(monkeypatch):
+    monkeypatch.setattr(lib, "webglThreshold", 100)
+    assert type(lib.scatterTrace(np.arange(100), np.arange(100))).__name__ == "Scatter"
+    assert type(lib.scatterTrace(np.arange(101), np.arange(101))).__name__ == "Scattergl"
+
+def test_marker_traces_thinned(monkeypatch):
+    monkeypatch.setattr(lib, "chartMaxPoints", 10)
+    x = np.arange(95)
+    trace = lib.scatterTrace(x, x * 2, text=[str(i) for i in x], name="markers")
+    assert len(trace.x) == 10
+    assert trace.x[0] == 0 and trace.x[-1] == 94
+    np.testing.assert_array_equal(np.array(trace.y), np.array(trace.x) * 2)
+    assert list(trace.text) == [str(i) for i in trace.x]
+    assert trace.name == "markers"
+    # Lines with gaps in them keep every point.
+    assert len(lib.scatterTrace(x, x, decimate=False).x) == 95
+
+# The dumbbell figure draws what the original drew, one row per school.
+def test_dumbbell_figure_matches_original(original):
+    df = lib.getTopNDF(25, "NPT42_PUB", 2011, 0, False)
+    ourTableDF = pd.DataFrame({
+        "Our Ranking":df["Our Ranking"],
+        "US News Ranking":pd.NA,
+        "University Name":df["INSTNM"].tolist(),
+        "UNITID":df["UNITID"].to_list()
+    })
+    expected = reference.dumbbell(reference.usnewsColumn(ourTableDF, original["usnews2011"]))
+    figure = lib.dumbbellFigure(lib.joinUSNews(ourTableDF, 2011))
+    numbers = lambda values: np.array([np.nan if value is None or value == "" else float(value) for value in values])
+    np.testing.assert_array_equal(numbers(figure.data[0].x), numbers(expected["line_x"]))
+    np.testing.assert_array_equal(numbers(figure.data[1].x), numbers(expected["Our Ranking"]))
+    np.testing.assert_array_equal(numbers(figure.data[2].x), numbers(expected["US News Ranking"]))
+    assert list(figure.layout.yaxis.ticktext) == expected["schools"]
+    assert [trace.name for trace in figure.data[1:]] == ["Our Ranking", "US News Ranking"]
+
+def test_figures_memoized(data, monkeypatch):
+    monkeypatch.setattr(lib, "figureCacheSize", 2)
+    builds = []
+    def build(name):
+        builds.append(name)
+        return object()
+    first = lib.chartFigure("test", (1,), lambda: build("a"))
+    assert lib.chartFigure("test", (1,), lambda: build("a")) is first
+    lib.chartFigure("test", (2,), lambda: build("b"))
+    lib.chartFigure("test", (3,), lambda: build("c"))
+    lib.chartFigure("test", (1,), lambda: build("a"))
+    assert builds == ["a", "b", "c", "a"]
+    lib.loadschema(reload=True)
+    assert len(lib.figurecache) == 0
@@ -0,0 +1,37 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Page 3's Combination Count from the top-k positions, against the original sort-and-count loop.
+
+import numpy as np
+import pytest
+import lib
+import reference
+
+weightSets = [
+    [1.0]*9,
+    [0.1, 3.7, 1.0, 10.0, 0.5, 2.2, 7.1, 0.3, 4.4],
+    [2.5, 0.1, 0.1, 6.3, 9.9, 1.0, 0.7, 5.0, 0.2]
+]
+
+@pytest.mark.parametrize("weights", weightSets)
+def test_counts_match_original(wide, weights):
+    for year in [2009, 2018]:
+        df = reference.combinationFrame(wide["paths"]["scard"][year])
+        features = [column for column in df.columns if column not in ["UNITID", "INSTNM", "Combination Count"]]
+        positions = lib.topKPositions(df, features)
+        for k in [10, 37, 100]:
+            expected = reference.calcCombinationCount(df, k, weights)
+            counts = lib.combinationCount(positions, k, weights)
+            # The original left the rows in the order of the last feature's sort.
+            order = np.argsort(positions[:, -1], kind="stable")
+            assert df["UNITID"].to_numpy()[order].tolist() == expected["UNITID"].tolist()
+            np.testing.assert_array_equal(counts[order], expected["Combination Count"].to_numpy())
+
+def test_sweep_matches_single_k(wide):
+    positions = lib.yearTopKPositions(2014)
+    sweep = lib.combinationCountSweep(positions, weightSets[1], 10, 100)
+    for k in [10, 11, 55, 100]:
+        np.testing.assert_array_equal(sweep[:, k - 10], lib.combinationCount(positions, k, weightSets[1]))
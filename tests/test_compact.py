@@ -0,0 +1,62 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Compact in-memory types: the values, and every ranking made from them, are those of the float64 tables.
+
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+def test_compactframe_keeps_values():
+    df = pd.DataFrame({
+        "UNITID":[100654.0, 100663.0, 100690.0],
+        "INSTNM":["b", "a", np.nan],
+        "HIGHDEG":[4.0, np.nan, 2.0],
+        "SAT_AVG":[1045.0, np.nan, 1202.0],
+        "ADM_RATE":[0.8986, 0.9211, np.nan]
+    })
+    names = lib.namesdtype({2009:df})
+    result = lib.compactframe(df, names)
+    assert result["UNITID"].dtype == np.int32
+    assert result["HIGHDEG"].dtype == np.float32
+    assert result["SAT_AVG"].dtype == np.float32
+    assert result["ADM_RATE"].dtype == np.float64
+    assert isinstance(result["INSTNM"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(reference.plain(result), reference.plain(df))
+
+def test_loaded_tables_match_original(original):
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        table = lib.dframes[year]
+        assert table["UNITID"].dtype == np.int32
+        assert isinstance(table["INSTNM"].dtype, pd.CategoricalDtype)
+        pd.testing.assert_frame_equal(reference.plain(table), reference.plain(original[year]))
+        for name in lib.columnSets.keys():
+            projected = lib.getColumnSet(year, name)
+            wide = lib.projectcolumns(lib.readcache(lib.cachefilename(str(year))), lib.columnSets[name]["columns"], lib.columnSets[name]["required"])
+            pd.testing.assert_frame_equal(reference.plain(projected), reference.plain(wide))
+
+# The same rankings come out of the compact tables and the float64 ones.
+def test_rankings_match_wide_tables(data, repoint, monkeypatch):
+    def rankings():
+        return [
+            lib.getTopNDF(0, "NPT45_PUB", 2017, 2, False),
+            lib.getWeightedTopNDF(0, {"NPT41_PUB":0.3, "NPT44_PUB":0.6}, 2017, 0, True),
+            lib.combinationRanking(2017, 10, [0.1, 3.7, 1.0, 10.0, 0.5, 2.2, 7.1, 0.3, 4.4])
+        ]
+    compact = rankings()
+    monkeypatch.setattr(lib, "compactTables", False)
+    lib.loadschema(reload=True)
+    assert lib.dframes[2017]["UNITID"].dtype == np.int64
+    for result, expected in zip(rankings(), compact):
+        pd.testing.assert_frame_equal(reference.plain(result), reference.plain(expected))
+
+def test_memory_report(data):
+    lib.dframes[2018]
+    report = lib.memoryReport()
+    assert "2018" in report["Table"].tolist()
+    assert report["After"].sum() < report["Before"].sum()
+    stats = lib.dframes.stats()
+    assert stats["memory"] == {"bytes":int(report["After"].sum()), "as_read":int(report["Before"].sum())}
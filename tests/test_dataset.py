@@ -0,0 +1,89 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The shared dataset file: the tables mapped from it are those read from the cache, and it is rebuilt when it should be.
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import lib
+import reference
+
+def datasetentry(report: list) -> dict:
+    return [entry for entry in report if entry["name"] == "dataset"][0]
+
+def test_tables_match_original(fresh):
+    assert lib.dataset is not None
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        table = lib.dframes[year]
+        pd.testing.assert_frame_equal(reference.plain(table), reference.plain(reference.scorecard(fresh["paths"]["scard"][year])))
+        for name in lib.columnSets.keys():
+            wide = lib.projectcolumns(lib.readcache(lib.cachefilename(str(year))), lib.columnSets[name]["columns"], lib.columnSets[name]["required"])
+            pd.testing.assert_frame_equal(reference.plain(lib.getColumnSet(year, name)), reference.plain(wide))
+
+# Every table is the same with the dataset file as without it, types and all.
+def test_same_tables_without_dataset(fresh, monkeypatch):
+    shared = {year:lib.dframes[year] for year in range(lib.yearStart, lib.yearEnd + 1)}
+    ranked = lib.getWeightedTopNDF(0, {"NPT41_PUB":0.3, "NPT44_PUB":0.6}, 2016, 0, True)
+    monkeypatch.setattr(lib, "sharedDataset", False)
+    lib.loadschema(reload=True)
+    assert lib.dataset is None
+    for year in shared.keys():
+        pd.testing.assert_frame_equal(lib.dframes[year], shared[year])
+    pd.testing.assert_frame_equal(lib.getWeightedTopNDF(0, {"NPT41_PUB":0.3, "NPT44_PUB":0.6}, 2016, 0, True), ranked)
+
+def test_columns_are_readonly_views(fresh):
+    values = lib.datasettable("2012")["NPT41_PUB"].to_numpy()
+    assert not values.flags.writeable
+    assert values.base is not None
+    with pytest.raises(ValueError):
+        values[0] = 1.0
+
+def test_rebuilt_only_when_needed(fresh):
+    cachefile = lib.cachepath + lib.datasetname
+    assert [name for name in os.listdir(fresh["directory"]) if name.endswith(".tmp")] == []
+    assert datasetentry(lib.loadschema(reload=True))["action"] == "cached"
+
+    yearfile = lib.cachefilename("2014")
+    stat = os.stat(yearfile)
+    os.utime(yearfile, (stat.st_atime, stat.st_mtime + 10))
+    status = lib.builddataset()
+    assert (status["action"], status["reason"]) == ("rebuilt", "source changed")
+    assert lib.builddataset()["action"] == "cached"
+
+    with open(cachefile, "wb") as f:
+        f.write(b"not a dataset")
+    assert lib.builddataset()["reason"] == "not a dataset file"
+    os.remove(cachefile)
+    assert lib.builddataset()["reason"] == "cache file missing"
+    assert lib.builddataset()["action"] == "cached"
+
+def test_rebuilt_when_column_sets_change(fresh, monkeypatch):
+    sets = dict(lib.columnSets)
+    sets["test"] = {"columns":["UNITID", "NPT41_PUB"], "required":["NPT41_PUB"]}
+    monkeypatch.setattr(lib, "columnSets", sets)
+    status = lib.builddataset()
+    assert (status["action"], status["reason"]) == ("rebuilt", "columns changed")
+    monkeypatch.setattr(lib, "datasetVersion", lib.datasetVersion + 1)
+    assert lib.builddataset()["reason"] == "version changed"
+
+# Where the old file can't be replaced (a process on Windows has it mapped), every process reads its own tables.
+def test_falls_back_when_not_replaceable(fresh, monkeypatch, capsys):
+    expected = {year:reference.plain(lib.dframes[year]) for year in [2010, 2017]}
+    replace = os.replace
+    def refuse(source, target):
+        if target.endswith(lib.datasetname):
+            raise PermissionError(13, "Access is denied", target)
+        replace(source, target)
+    monkeypatch.setattr(os, "replace", refuse)
+    monkeypatch.setattr(lib, "datasetVersion", lib.datasetVersion + 1)
+    status = datasetentry(lib.loadschema(reload=True))
+    assert status["action"] == "failed" and "Access is denied" in status["reason"]
+    assert "dataset      failed, not used" in capsys.readouterr().out
+    assert lib.dataset is None
+    assert [name for name in os.listdir(fresh["directory"]) if name.endswith(".tmp")] == []
+    for year in expected.keys():
+        pd.testing.assert_frame_equal(reference.plain(lib.dframes[year]), expected[year])
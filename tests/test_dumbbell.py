@@ -0,0 +1,48 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The rank disparity (dumbbell) plot data, against the original loop over the schools by name.
+
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+# Numbers as floats, with NaN for gaps (None and "" in the original).
+def numbers(values) -> np.ndarray:
+    return np.array([np.nan if value is None or value is pd.NA or value == "" else float(value) for value in values])
+
+def test_matches_original(original):
+    for year, n in [(2010, 0), (2018, 30)]:
+        df = lib.getTopNDF(n, "NPT41_PUB", year, 0, False)
+        ourTableDF = pd.DataFrame({
+            "Our Ranking":df["Our Ranking"],
+            "US News Ranking":pd.NA,
+            "University Name":df["INSTNM"].tolist(),
+            "UNITID":df["UNITID"].to_list()
+        })
+        expected = reference.dumbbell(reference.usnewsColumn(ourTableDF, original["usnews" + str(year)]))
+        result = lib.dumbbellTraces(lib.joinUSNews(ourTableDF, year))
+
+        for key in ["line_x", "Our Ranking", "US News Ranking"]:
+            np.testing.assert_array_equal(numbers(result[key]), numbers(expected[key]))
+        # Rows are keyed by UNITID now and labelled with the names the original used as keys.
+        assert result["labels"].tolist() == expected["schools"]
+        assert result["schools"].tolist() == [str(unitid) for unitid in ourTableDF["UNITID"]]
+        assert result["line_y"][2::3].tolist() == expected["line_y"][2::3]
+        assert result["line_y"][0::3].tolist() == result["line_y"][1::3].tolist() == result["schools"].tolist()
+
+# The original mixed up schools that share a name; each gets its own row now.
+def test_shared_names_stay_apart():
+    table = pd.DataFrame({
+        "Our Ranking":[1, 2, 3],
+        "US News Ranking":pd.array([5, pd.NA, 7], dtype="Int64"),
+        "University Name":["Same College", "Other College", "Same College"],
+        "UNITID":[101, 102, 103]
+    })
+    result = lib.dumbbellTraces(table)
+    assert result["schools"].tolist() == ["101", "102", "103"]
+    np.testing.assert_array_equal(result["Our Ranking"], [1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(result["US News Ranking"], [5.0, np.nan, 7.0])
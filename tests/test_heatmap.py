@@ -0,0 +1,50 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Page 3's heatmap labels and colors, against the original Styler formatting and background gradient, and the paged
+# table.
+
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+weights = [0.1, 3.7, 1.0, 10.0, 0.5, 2.2, 7.1, 0.3, 4.4]
+
+def heatmap(year: int) -> pd.DataFrame:
+    df = lib.combinationRanking(year, 20, weights).drop(columns=["Our Ranking"])
+    df = lib.normalizeCombination(df)
+    return df
+
+def test_labels_match_original(wide):
+    df = heatmap(2016)
+    df.loc[df.index[0], "SAT_AVG"] = np.nan
+    df.loc[df.index[1], "PFTFAC"] = -0.5
+    df.loc[df.index[2], "RET_FT4"] = 1.0
+    expected = df.applymap(reference.combo_percentile)
+    pd.testing.assert_frame_equal(lib.heatmapLabels(df), expected)
+
+def test_colors_match_background_gradient(wide):
+    df = heatmap(2013).head(60)
+    styler = df.style.background_gradient(axis=None, vmin=0, vmax=1, cmap="RdYlGn")
+    styler._compute()
+    expected = pd.DataFrame("", index=df.index, columns=df.columns)
+    for (row, column), properties in styler.ctx.items():
+        expected.iloc[row, column] = "".join("%s: %s;" % (name, value) for name, value in properties)
+    pd.testing.assert_frame_equal(lib.heatmapColors(df, "RdYlGn", 0, 1), expected.astype(object))
+
+def pagedApp():
+    import pandas as pd
+    import lib
+    df = pd.DataFrame({"UNITID":range(120), "Value":[i / 120 for i in range(120)]})
+    lib.pagedTable(df, "test page", 50)
+
+def test_paged_table():
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_function(pagedApp).run()
+    assert app.number_input[0].value == 1
+    assert len(app.dataframe[0].value.index) == 50
+    app.number_input[0].set_value(3).run()
+    assert app.dataframe[0].value["UNITID"].tolist() == list(range(100, 120))
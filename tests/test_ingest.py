@@ -0,0 +1,42 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Ingesting the raw files in chunks, in parallel, against reading each file whole and stripping it per column set.
+
+import os
+import pandas as pd
+import lib
+import reference
+
+# A raw file read whole, keeping the schools that have every required column of at least one column set.
+def expected(sourcefile: str) -> pd.DataFrame:
+    df = pd.read_csv(sourcefile, usecols=lib.cachedcolumns(), na_values=lib.nullValues)
+    keep = set()
+    for required in lib.requiredsets():
+        keep |= set(reference.stripbadNikhil(required, df).index)
+    return df.loc[sorted(keep)].reset_index(drop=True)
+
+def test_chunks_match_whole_file(data, tmp_path, monkeypatch):
+    monkeypatch.setattr(lib, "ingestChunkRows", 17)
+    sourcefile = data["paths"]["scard"][2011]
+    cachefile = lib.cachefilename("2011", path=str(tmp_path) + os.sep)
+    stats = lib.ingestyear(2011, sourcefile, cachefile, lib.cachedcolumns(), lib.requiredsets())
+    result = lib.readcache(cachefile)
+    pd.testing.assert_frame_equal(result, expected(sourcefile), check_dtype=False)
+    assert stats["rows_in"] == len(pd.read_csv(sourcefile, usecols=["UNITID"]).index)
+    assert stats["rows_out"] == len(result.index)
+
+def test_workers_agree(data, tmp_path):
+    tables = {}
+    for workers in [1, 3]:
+        path = str(tmp_path / str(workers)) + os.sep
+        os.mkdir(path)
+        jobs = {year:(data["paths"]["scard"][year], lib.cachefilename(str(year), path=path)) for year in [2009, 2012, 2015, 2018]}
+        stats = lib.ingest(jobs, lib.cachedcolumns(), workers)
+        assert sorted(stats.keys()) == sorted(jobs.keys())
+        tables[workers] = {year:lib.readcache(jobs[year][1]) for year in jobs.keys()}
+    for year in tables[1].keys():
+        pd.testing.assert_frame_equal(tables[3][year], tables[1][year])
+        pd.testing.assert_frame_equal(tables[1][year], expected(data["paths"]["scard"][year]), check_dtype=False)
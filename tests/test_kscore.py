@@ -0,0 +1,37 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Page 4's K-score computed column-wise, against the original loop over the schools.
+
+import numpy as np
+import pandas as pd
+import pytest
+import lib
+import reference
+
+components = ["K_SCORE", "High-Paying Degrees", "SAT Scores", "Affordability", "Completion Rate (4 Years)", "Academics", "Diversity"]
+
+@pytest.mark.parametrize("profile", ["normal", "controversial"])
+def test_matches_original(widedata, profile):
+    full_dataset = pd.read_csv(widedata["paths"]["kscore"], low_memory=False)
+    expected = reference.kscorePage(full_dataset, profile)
+    result = lib.kscore(lib.kscoreCandidates(full_dataset), profile)
+    assert len(result.index) > 20
+    assert result.index.tolist() == expected.index.tolist()
+    pd.testing.assert_frame_equal(result[components + ["C100_4_POOLED_SUPP"]].astype(float),
+                                  expected[components + ["C100_4_POOLED_SUPP"]].astype(float))
+    assert result.nlargest(10, "K_SCORE")["INSTNM"].tolist() == expected.nlargest(10, "K_SCORE")["INSTNM"].tolist()
+
+# Text is parsed exactly as float() parses it, and anything it can't parse is 0.0.
+def test_tofloat_matches_float():
+    rng = np.random.default_rng(3)
+    values = ["%.17g" % value for value in rng.uniform(0.0, 1.0, 2000)] + ["0.1", "PrivacySuppressed", "NULL", None, "1e-320"]
+    def parse(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    expected = np.array([parse(value) for value in values])
+    np.testing.assert_array_equal(lib.tofloat(pd.Series(values, dtype=object)).to_numpy(), expected)
@@ -0,0 +1,98 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Lazy per-year loading with least recently used tables dropped over the memory budget.
+
+import random
+import threading
+import time
+import pandas as pd
+import lib
+import reference
+
+def test_nothing_loaded_up_front(data):
+    lib.loadschema(reload=True)
+    assert len(lib.dframes.tables) == 0
+    assert 2012 in lib.dframes and "usnews2012" in lib.dframes
+    assert len(list(lib.dframes.keys())) == 2 * (lib.yearEnd - lib.yearStart + 1)
+    assert len(lib.dframes.tables) == 0
+
+def test_memory_reported_on_load(data, capsys):
+    lib.dframes.reset(lib.dframes.loaders)
+    lib.dframes[2013]
+    assert "[memory] Scorecard tables take" in capsys.readouterr().out
+
+def test_least_recently_used_dropped(original, monkeypatch):
+    lib.dframes.reset(lib.dframes.loaders)
+    lib.dframes[2009]
+    # Room for two years, not three.
+    monkeypatch.setattr(lib, "tableBudget", int(2.5 * max(lib.dframes.size(2009), 1)))
+    lib.getNormalizedFeatures(2009, 0)
+    lib.yearTopKPositions(2009)
+    evictions = lib.dframes.counters["evictions"]
+
+    for year in [2010, 2011, 2010, 2012]:
+        lib.dframes[year]
+    loaded = [key for key in lib.dframes.tables.keys()]
+    assert 2009 not in loaded and 2011 not in loaded
+    assert loaded[-1] == 2012 and 2010 in loaded
+    assert lib.dframes.counters["evictions"] > evictions
+    assert sum(lib.dframes.size(key) for key in loaded) <= lib.tableBudget
+
+    # Everything worked out from a dropped year goes with it.
+    assert 2009 not in lib.scorecard and 2009 not in lib.topkindex
+    assert not [key for key in lib.rankindex.keys() if key[0] == 2009]
+    assert not [key for key in lib.projections.keys() if key[0] == 2009]
+    assert not [key for key in lib.normalizedcache.keys() if key[0] == 2009]
+
+    # A dropped year is read again when asked for, unchanged.
+    pd.testing.assert_frame_equal(reference.plain(lib.dframes[2009]), reference.plain(original[2009]))
+    result = lib.getTopNDF(0, "NPT41_PUB", 2009, 0, False)
+    pd.testing.assert_frame_equal(reference.plain(result), reference.plain(reference.getTopNDF(original, 0, "NPT41_PUB", 2009, 0, False)))
+
+# Sessions pulling column sets while others load years: nothing fails, and nothing is kept for a year that was dropped.
+def test_columns_while_loading(data, repoint, monkeypatch):
+    monkeypatch.setattr(lib, "sharedDataset", False)
+    lib.loadschema(reload=True)
+    lib.dframes[2009]
+    monkeypatch.setattr(lib, "tableBudget", int(2.5 * max(lib.dframes.size(2009), 1)))
+    columns = ["UNITID", "INSTNM", "NPT41_PUB", "SAT_AVG"]
+    expected = {year:lib.projectcolumns(lib.readcache(lib.cachefilename(str(year))), columns, ["SAT_AVG"])
+                for year in range(lib.yearStart, lib.yearEnd + 1)}
+    errors = []
+    stop = time.perf_counter() + 2.0
+    def pull(seed):
+        generator = random.Random(seed)
+        try:
+            while time.perf_counter() < stop:
+                year = generator.randint(lib.yearStart, lib.yearEnd)
+                result = lib.getColumns(year, columns, ["SAT_AVG"])
+                if len(result.index) != len(expected[year].index):
+                    errors.append("%d: %d rows" % (year, len(result.index)))
+        except Exception as e:
+            errors.append(repr(e))
+    def load(seed):
+        generator = random.Random(seed)
+        try:
+            while time.perf_counter() < stop:
+                lib.dframes[generator.randint(lib.yearStart, lib.yearEnd)]
+                lib.memoryReport()
+        except Exception as e:
+            errors.append(repr(e))
+    threads = [threading.Thread(target=pull, args=(seed,)) for seed in range(3)]
+    threads += [threading.Thread(target=load, args=(seed,)) for seed in range(3, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with lib.loadlock:
+        loaded = list(lib.dframes.tables.keys())
+        assert [key for key in lib.projections.keys() if key[0] not in loaded] == []
+        assert sum(lib.dframes.size(key) for key in loaded) <= lib.tableBudget
+    for key in list(lib.projections.keys()):
+        if key[1] == tuple(columns):
+            pd.testing.assert_frame_equal(reference.plain(lib.projections[key]), reference.plain(expected[key[0]]))
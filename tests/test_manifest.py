@@ -0,0 +1,50 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The cache manifest: only entries whose source, columns or filters changed are rebuilt.
+
+import os
+import pandas as pd
+import lib
+import reference
+
+# The Scorecard years rebuilt, with why. The shared dataset file is rebuilt whenever any year is.
+def rebuilt(report: list) -> dict:
+    return {entry["name"]:entry["reason"] for entry in report if entry["action"] == "rebuilt" and entry["name"].isdigit()}
+
+def test_unchanged_cache_is_not_rebuilt(fresh):
+    assert rebuilt(lib.loadschema(reload=True)) == {}
+
+def test_changed_source_rebuilds_only_its_year(fresh):
+    sourcefile = fresh["paths"]["scard"][2014]
+    raw = pd.read_csv(sourcefile, dtype=str, keep_default_na=False)
+    raw.loc[0, "NPT41_PUB"] = "1234"
+    raw.loc[1, "NPT41_PUB"] = "PrivacySuppressed"
+    raw.to_csv(sourcefile, index=False)
+
+    assert rebuilt(lib.loadschema(reload=True)) == {"2014":"source changed"}
+    cached = lib.projectcolumns(lib.readcache(lib.cachefilename("2014")), lib.usecols, lib.columnSets["mobility"]["required"])
+    pd.testing.assert_frame_equal(cached, reference.scorecard(sourcefile), check_dtype=False)
+
+# Touching a file without changing it is caught by the hash.
+def test_touched_source_is_not_rebuilt(fresh):
+    sourcefile = fresh["paths"]["scard"][2010]
+    os.utime(sourcefile, (0, 0))
+    assert rebuilt(lib.loadschema(reload=True)) == {}
+    assert lib.loadmanifest()["2010"]["source"]["mtime"] == 0
+
+def test_filter_version_rebuilds_every_year(fresh, monkeypatch):
+    monkeypatch.setattr(lib, "filterVersion", lib.filterVersion + 1)
+    assert rebuilt(lib.loadschema(reload=True)) == {str(year):"filter version changed" for year in range(lib.yearStart, lib.yearEnd + 1)}
+
+def test_missing_cache_file_is_rebuilt(fresh):
+    os.remove(lib.cachefilename("2016"))
+    assert rebuilt(lib.loadschema(reload=True)) == {"2016":"cache file missing"}
+
+def test_savemanifest_leaves_no_temporary_file(tmp_path):
+    path = str(tmp_path) + os.sep
+    lib.savemanifest({"2009":{"version":lib.filterVersion}}, path)
+    assert lib.loadmanifest(path) == {"2009":{"version":lib.filterVersion}}
+    assert os.listdir(tmp_path) == [lib.manifestname]
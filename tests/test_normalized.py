@@ -0,0 +1,48 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The normalized params cached per (year, maxDeg, direction), so a weight change is a single weighted sum.
+
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+weights = {"NPT44_PUB":0.8, "NPT41_PUB":0.35, "NPT42_PUB":0.6}
+
+def test_normalized_match_original(original):
+    for year in [2011, 2016]:
+        for maxDeg in [0, 2, 4]:
+            df = original[year]
+            df = df[ (df["HIGHDEG"] >= maxDeg) ]
+            features = lib.getNormalizedFeatures(year, maxDeg)
+            for j, column in enumerate(lib.paramsColumns):
+                expected = (df[column] - df[column].min()) / (df[column].max() - df[column].min())
+                np.testing.assert_array_equal(features["normalized"][:, j], expected.to_numpy())
+            assert features["schools"]["UNITID"].tolist() == df["UNITID"].tolist()
+
+# Params that are better when higher are flipped, as the original did for the weighted ones.
+def test_direction_matches_original(original, monkeypatch):
+    direction = dict(lib.lowerIsBetter, NPT41_PUB=False, NPT44_PUB=False)
+    monkeypatch.setattr(lib, "lowerIsBetter", direction)
+    for year in [2009, 2017]:
+        expected = reference.weightedTopNDF(original, 0, weights, year, 3, False)
+        pd.testing.assert_frame_equal(reference.plain(lib.getWeightedRankDF(weights, year, 3)), reference.plain(expected))
+        pd.testing.assert_frame_equal(reference.plain(lib.weightedRankDF(lib.dframes[year], weights, 3)), reference.plain(expected))
+
+def test_cache_is_bounded(data, monkeypatch):
+    monkeypatch.setattr(lib, "normalizedCacheSize", 3)
+    for year in range(lib.yearStart, lib.yearStart + 5):
+        lib.getNormalizedFeatures(year, 0)
+    keys = list(lib.normalizedcache.keys())
+    assert len(keys) == 3
+    assert [key[0] for key in keys] == [lib.yearStart + 2, lib.yearStart + 3, lib.yearStart + 4]
+    first = lib.getNormalizedFeatures(lib.yearStart + 2, 0)
+    assert lib.getNormalizedFeatures(lib.yearStart + 2, 0) is first
+
+def test_cache_cleared_on_reload(data):
+    first = lib.getNormalizedFeatures(2014, 1)
+    lib.loadschema(reload=True)
+    assert lib.getNormalizedFeatures(2014, 1) is not first
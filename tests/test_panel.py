@@ -0,0 +1,53 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The multi-year panel, against ranking every year separately with the original code and joining by UNITID.
+
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+# Every school's rank in every year by the original getTopNDF, as a UNITID x year table.
+def yearRanks(original: dict, param: str, maxDeg: int) -> pd.DataFrame:
+    columns = {}
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        df = reference.getTopNDF(original, 0, param, year, maxDeg, False)
+        columns[year] = pd.Series(df["Our Ranking"].to_numpy(dtype=float), index=df["UNITID"].to_numpy())
+    return pd.DataFrame(columns).sort_index()
+
+def values(df: pd.DataFrame, columns) -> np.ndarray:
+    return df[list(columns)].to_numpy(dtype=float, na_value=np.nan)
+
+def test_trajectories_match_original(original):
+    for param, maxDeg in [("NPT41_PUB", 0), ("NPT45_PUB", 3)]:
+        expected = yearRanks(original, param, maxDeg)
+        result = lib.rankTrajectories(param, maxDeg)
+        assert result["UNITID"].tolist() == expected.index.tolist()
+        np.testing.assert_array_equal(values(result, expected.columns), expected.to_numpy())
+
+        deltas = lib.rankDeltas(param, maxDeg).set_index("UNITID")
+        expectedDeltas = (expected.shift(1, axis=1) - expected).iloc[:, 1:].dropna(how="all")
+        np.testing.assert_array_equal(values(deltas.loc[expectedDeltas.index], expectedDeltas.columns), expectedDeltas.to_numpy())
+
+def test_usnews_trajectory_matches_original(original):
+    result = lib.rankTrajectories("usnews").set_index("UNITID")
+    for year in [2009, 2018]:
+        USNewsDF = original["usnews" + str(year)].dropna(subset=["US News Ranking"])
+        expected = USNewsDF[ (USNewsDF["UNITID"].isin(result.index)) ]
+        assert result.loc[expected["UNITID"], year].astype(int).tolist() == expected["US News Ranking"].astype(int).tolist()
+
+def test_aggregate_matches_mean_rank(original):
+    ranks = yearRanks(original, "NPT43_PUB", 0)
+    years = [2011, 2012, 2013, 2014]
+    ranks = ranks[years]
+    count = ranks.notnull().sum(axis=1)
+    expected = pd.DataFrame({"UNITID":ranks.index, "Mean Rank":ranks.mean(axis=1).to_numpy(), "Years Ranked":count.to_numpy()})
+    expected = expected[ (expected["Years Ranked"] >= 3) ].sort_values(["Mean Rank", "UNITID"])
+
+    result = lib.aggregateRanking("NPT43_PUB", 0, years, minYears=3)
+    assert result["UNITID"].tolist() == expected["UNITID"].tolist()
+    np.testing.assert_allclose(result["Mean Rank"], expected["Mean Rank"])
+    assert result["Our Ranking"].tolist() == list(range(1, len(expected.index) + 1))
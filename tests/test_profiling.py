@@ -0,0 +1,74 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Span timing: nested spans, page reruns, the log and the memory peaks. Timing must not change any result.
+
+import json
+import pandas as pd
+import pytest
+import lib
+import reference
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    monkeypatch.setattr(lib, "profiling", True)
+    monkeypatch.setattr(lib, "profileLog", str(tmp_path / "profile.jsonl"))
+    yield str(tmp_path / "profile.jsonl")
+    lib.spanlocal.__dict__.clear()
+
+def readlog(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_nested_spans(profiling):
+    lib.startrun("test page")
+    with lib.span("outer"):
+        with lib.span("inner"):
+            pass
+        with lib.span("second"):
+            pass
+    records = lib.endrun()
+    assert [record["path"] for record in records] == ["outer/inner", "outer/second", "outer"]
+    assert [record["depth"] for record in records] == [1, 1, 0]
+    assert all(record["page"] == "test page" and record["run"] == records[0]["run"] for record in records)
+    assert [record["path"] for record in readlog(profiling)] == ["outer/inner", "outer/second", "outer"]
+    assert lib.spanTable(records)["Stage"].tolist() == ["outer", "\u00a0\u00a0inner", "\u00a0\u00a0second"]
+
+# Outside a rerun, each finished top-level span is logged straight away.
+def test_spans_outside_run_are_logged(profiling):
+    @lib.timed()
+    def work():
+        return 3
+    assert work() == 3
+    assert [record["span"] for record in readlog(profiling)] == ["work"]
+
+def test_memory_peak(profiling, monkeypatch):
+    monkeypatch.setattr(lib, "profileMemory", True)
+    lib.startrun("memory")
+    with lib.span("allocate"):
+        block = bytearray(4 * 2**20)
+        del block
+    records = lib.endrun()
+    assert records[0]["peak_kib"] >= 4 * 1024
+    lib.tracemalloc.stop()
+
+def test_off_records_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(lib, "profiling", False)
+    monkeypatch.setattr(lib, "profileLog", str(tmp_path / "profile.jsonl"))
+    lib.startrun("off")
+    with lib.span("nothing"):
+        pass
+    assert lib.endrun() == []
+    assert not (tmp_path / "profile.jsonl").exists()
+
+def test_results_unchanged(profiling, original):
+    lib.startrun("results")
+    result = lib.getTopNDF(20, "NPT42_PUB", 2015, 1, True)
+    weighted = lib.getWeightedTopNDF(20, {"NPT41_PUB":0.4, "NPT43_PUB":0.9}, 2015, 1, False)
+    records = lib.endrun()
+    assert {"getTopNDF", "weighted score"} <= {record["span"] for record in records}
+    pd.testing.assert_frame_equal(reference.plain(result), reference.plain(reference.getTopNDF(original, 20, "NPT42_PUB", 2015, 1, True)))
+    expected = reference.weightedTopNDF(original, 20, {"NPT41_PUB":0.4, "NPT43_PUB":0.9}, 2015, 1, False)
+    pd.testing.assert_frame_equal(reference.plain(weighted), reference.plain(expected))
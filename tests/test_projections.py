@@ -0,0 +1,49 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Page 3's columns served from the shared cache instead of its own reads of the raw files.
+
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+weights = [0.1, 3.7, 1.0, 10.0, 0.5, 2.2, 7.1, 0.3, 4.4]
+
+# Page 3's table for a year the way the page builds it now.
+def page(year: int, k: int, weights: list) -> pd.DataFrame:
+    df = lib.getColumnSet(year, "combination").copy()
+    df.insert(2, "Combination Count", np.zeros(len(df.index)))
+    positions = lib.yearTopKPositions(year)
+    df["Combination Count"] = df["Combination Count"] + lib.combinationCount(positions, k, weights)
+    df = df.iloc[np.argsort(positions[:, -1], kind="stable")]
+    return lib.sortCombination(df)
+
+def test_combination_set_matches_raw(wide):
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        expected = reference.combinationFrame(wide["paths"]["scard"][year]).drop(columns=["Combination Count"])
+        pd.testing.assert_frame_equal(reference.plain(lib.getColumnSet(year, "combination")), reference.plain(expected))
+
+def test_page_matches_original(wide):
+    for year in [2010, 2017]:
+        for k in [10, 50]:
+            expected = reference.combinationPage(wide["paths"]["scard"][year], k, weights)
+            pd.testing.assert_frame_equal(reference.plain(page(year, k, weights)), reference.plain(expected))
+
+def test_projection_is_shared(wide):
+    first = lib.getColumnSet(2013, "combination")
+    assert lib.getColumnSet(2013, "combination") is first
+    assert lib.getColumns(2013, lib.combinationColumns) is first
+
+# Registering a set rebuilds the cache with its columns, and dropping it again rebuilds it without.
+def test_registered_columns(wide):
+    lib.registerColumns("test", ["UNITID", "INSTNM", "UGDS"], ["UGDS"])
+    try:
+        expected = pd.read_csv(wide["paths"]["scard"][2012], usecols=["UNITID", "INSTNM", "UGDS"], na_values=lib.nullValues)
+        expected = expected[ (expected["UGDS"].notnull()) ]
+        pd.testing.assert_frame_equal(reference.plain(lib.getColumnSet(2012, "test")), reference.plain(expected))
+    finally:
+        del lib.columnSets["test"]
+        lib.loadschema(reload=True)
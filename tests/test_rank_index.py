@@ -0,0 +1,50 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Single-param rankings sliced from the prebuilt rank orders, against the original sort.
+
+import numpy as np
+import pandas as pd
+import pytest
+import lib
+import reference
+
+@pytest.mark.parametrize("param", lib.paramsColumns)
+def test_matches_original(original, param):
+    for year in [2009, 2013, 2018]:
+        for maxDeg in lib.highestDegNice.values():
+            for hide in [False, True]:
+                for n in [0, 1, 15]:
+                    expected = reference.getTopNDF(original, n, param, year, maxDeg, hide)
+                    result = lib.getTopNDF(n, param, year, maxDeg, hide)
+                    pd.testing.assert_frame_equal(reference.plain(result), reference.plain(expected))
+
+# Ties keep the order the original sort gave them.
+def test_ties_match_sort(original):
+    for year in [2010, 2015]:
+        df = original[year].copy()
+        df["NPT45_PUB"] = np.round(df["NPT45_PUB"], -4)
+        expected = df.sort_values("NPT45_PUB", axis=0)
+        order = lib.rankOrder(df, "NPT45_PUB", 0, True)
+        assert df["UNITID"].to_numpy()[order].tolist() == expected["UNITID"].tolist()
+
+# A cached column without a prebuilt order: only the top n are picked out and sorted, from the schools that have it.
+def test_unindexed_top_n(data):
+    cached = lib.readcache(lib.cachefilename("2012"))
+    for maxDeg in [0, 3]:
+        df = cached[ (cached["HIGHDEG"] >= maxDeg) & (cached["SAT_AVG"].notnull()) ]
+        for lowerBetter in [True, False]:
+            expected = df.sort_values("SAT_AVG", ascending=lowerBetter)
+            for n in [1, 10, len(df.index) + 5]:
+                result = lib.getTopNDF(n, "SAT_AVG", 2012, maxDeg, False, lowerBetter)
+                assert result["SAT_AVG"].tolist() == expected["SAT_AVG"].tolist()[:n]
+                assert result["Our Ranking"].tolist() == list(range(1, min(n, len(df.index)) + 1))
+            result = lib.getTopNDF(0, "SAT_AVG", 2012, maxDeg, False, lowerBetter)
+            assert result["UNITID"].tolist() == expected["UNITID"].tolist()
+
+def test_other_direction(original):
+    expected = original[2016].sort_values("NPT42_PUB", ascending=False)
+    result = lib.getTopNDF(0, "NPT42_PUB", 2016, 0, False, lowerBetter=False)
+    assert result["UNITID"].tolist() == expected["UNITID"].tolist()
@@ -0,0 +1,47 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The weight sensitivity sweep, against running page 2's original ranking once per weight vector.
+
+import math
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+weights = {"NPT41_PUB":0.5, "NPT43_PUB":0.25, "NPT45_PUB":0.75}
+
+# The rank a school reaches in fraction q of its scenarios (nearest rank).
+def percentile(ranks: list, q: float) -> float:
+    ranks = sorted(ranks)
+    return float(ranks[max(math.ceil(q * len(ranks)), 1) - 1])
+
+def test_matches_original(original):
+    matrix = lib.perturbedWeights(weights, 6, 0.5, seed=4)
+    ranks = {}
+    for row in matrix:
+        expected = reference.weightedTopNDF(original, 0, dict(zip(weights.keys(), row)), 2017, 0, False)
+        for unitid, rank in zip(expected["UNITID"], expected["Our Ranking"]):
+            ranks.setdefault(unitid, []).append(rank)
+
+    result = lib.weightSensitivity(weights, 2017, 0, topN=10, weightMatrix=matrix, workers=1)
+    assert result["UNITID"].tolist() == reference.weightedTopNDF(original, 0, weights, 2017, 0, False)["UNITID"].tolist()
+    schoolRanks = [ranks[unitid] for unitid in result["UNITID"]]
+    assert result["Median Rank"].tolist() == [percentile(r, 0.5) for r in schoolRanks]
+    assert result["5th Percentile Rank"].tolist() == [percentile(r, 0.05) for r in schoolRanks]
+    assert result["95th Percentile Rank"].tolist() == [percentile(r, 0.95) for r in schoolRanks]
+    assert result["Top 10 Share"].tolist() == [sum(rank <= 10 for rank in r) / len(r) for r in schoolRanks]
+    assert result["Scenarios"].tolist() == [len(r) for r in schoolRanks]
+
+# Chunking doesn't change the result, and neither do worker processes, with or without bootstrap.
+def test_chunks_and_workers_agree(data, monkeypatch):
+    expected = lib.weightSensitivity(weights, 2013, 2, scenarios=40, seed=7, workers=1)
+    monkeypatch.setattr(lib, "sensitivityChunkSize", 8)
+    pd.testing.assert_frame_equal(lib.weightSensitivity(weights, 2013, 2, scenarios=40, seed=7, workers=2), expected)
+
+    expected = lib.weightSensitivity(weights, 2013, 2, scenarios=40, bootstrap=True, seed=7, workers=1)
+    result = lib.weightSensitivity(weights, 2013, 2, scenarios=40, bootstrap=True, seed=7, workers=2)
+    pd.testing.assert_frame_equal(result, expected)
+    assert (result["Scenarios"] < 40).any() and (result["Scenarios"] <= 40).all()
@@ -0,0 +1,97 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The JSON ranking service, against the original code, with concurrent requests and bad parameters.
+
+import json
+import threading
+import urllib.error
+import urllib.request
+import pandas as pd
+import pytest
+import lib
+import reference
+import server
+
+@pytest.fixture(scope="module")
+def url(data):
+    httpd = server.serve("127.0.0.1", 0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+def get(url: str) -> tuple:
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+# Ranks as ints, with None where there is none.
+def ranks(values) -> list:
+    return [None if value is None or value == "" else int(value) for value in values]
+
+def test_ranking_matches_original(url, original):
+    status, body = get(url + "/ranking?year=2016&param=NPT44_PUB&maxDeg=3&top=25&hide=1")
+    assert status == 200
+    expected = reference.getTopNDF(original, 25, "NPT44_PUB", 2016, 3, True)
+    expected = reference.usnewsColumn(expected, original["usnews2016"])
+    rows = pd.DataFrame(body["rows"])
+    assert rows["UNITID"].tolist() == expected["UNITID"].tolist()
+    assert rows["Our Ranking"].tolist() == expected["Our Ranking"].tolist()
+    assert ranks(row["US News Ranking"] for row in body["rows"]) == ranks(expected["US News Ranking"])
+
+def test_weighted_matches_original(url, original):
+    status, body = get(url + "/weighted?year=2010&weights=NPT41_PUB=1,NPT45_PUB=0.3&maxDeg=0&top=30")
+    assert status == 200
+    expected = reference.weightedTopNDF(original, 30, {"NPT41_PUB":1.0, "NPT45_PUB":0.3}, 2010, 0, False)
+    rows = pd.DataFrame(body["rows"])
+    assert rows["UNITID"].tolist() == expected["UNITID"].tolist()
+    assert rows["Our Ranking"].tolist() == expected["Our Ranking"].tolist()
+
+def test_compare_agrees_with_table(url, data):
+    status, body = get(url + "/compare?year=2015&param=NPT42_PUB&maxDeg=2")
+    assert status == 200
+    row = lib.agreementTable().set_index(["Year", "Param", "Max Degree"]).loc[(2015, "NPT42_PUB", 2)]
+    assert body["agreement"]["Schools"] == row["Schools"]
+    assert body["agreement"]["Spearman"] == pytest.approx(row["Spearman"])
+
+def test_concurrent_requests_share_one_result(url):
+    server.memo.clear()
+    query = url + "/ranking?year=2012&param=NPT41_PUB&top=5"
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get(query))) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 16
+    assert all(result == results[0] for result in results)
+    status, body = get(url + "/stats")
+    assert body["endpoints"]["/ranking"]["hits"] >= 1
+
+@pytest.mark.parametrize("query,status", [
+    ("/ranking?year=2018&param=NPT41_PUB&top=-1", 400),
+    ("/ranking?year=2018&param=NPT41_PUB&maxDeg=7", 400),
+    ("/ranking?year=2018&param=NPT41_PUB&maxDeg=-1", 400),
+    ("/ranking?year=2018&param=NPT41_PUB&top=ten", 400),
+    ("/ranking?year=2018&param=SAT_AVG", 400),
+    ("/ranking?year=1990&param=NPT41_PUB", 404),
+    ("/weighted?year=2018&weights=NPT41_PUB=1&top=-5", 400),
+    ("/compare?year=2018&param=NPT41_PUB&maxDeg=9", 400),
+    ("/nothing", 404)
+])
+def test_bad_requests(url, query, status):
+    assert get(url + query)[0] == status
+
+def test_reload_clears_memo(url):
+    get(url + "/ranking?year=2011&param=NPT41_PUB&top=3")
+    assert len(server.memo) > 0
+    request = urllib.request.Request(url + "/reload", method="POST")
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200
+    assert len(server.memo) == 0
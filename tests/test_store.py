@@ -0,0 +1,57 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The process-wide store: every table and data set is loaded once and shared, whoever asks for it.
+
+import threading
+import pandas as pd
+import lib
+import reference
+
+def test_tables_match_original_loader(data):
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        expected = reference.plain(reference.scorecard(data["paths"]["scard"][year]))
+        pd.testing.assert_frame_equal(reference.plain(lib.dframes[year]), expected)
+
+def test_table_is_loaded_once(data):
+    lib.dframes.reset(lib.dframes.loaders)
+    misses = lib.dframes.counters["misses"]
+    first = lib.dframes[2012]
+    assert lib.dframes[2012] is first
+    assert lib.dframes.counters["misses"] == misses + 1
+
+def test_loadschema_checks_the_cache_once(data):
+    report = lib.loadschema()
+    assert lib.loadschema() is report
+
+def test_dataset_is_loaded_once_across_threads(data):
+    calls = []
+    def loader():
+        calls.append(1)
+        return object()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(lib.getdataset("test store", loader))) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+    lib.reload()
+    assert len(calls) == 2
+    assert lib.getdataset("test store", loader) is not results[0]
+    del lib.datasets["test store"]
+    del lib.dataloaders["test store"]
+
+# Page 3's top-k positions are kept with the year's table and go when it does.
+def test_topk_positions_go_with_the_year(data):
+    lib.dframes[2011]
+    before = lib.dframes.size(2011)
+    positions = lib.yearTopKPositions(2011)
+    assert lib.yearTopKPositions(2011) is positions
+    assert lib.dframes.size(2011) == before + positions.nbytes
+    lib.dframes.drop(2011)
+    assert 2011 not in lib.topkindex
@@ -0,0 +1,43 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Attaching US News ranks by UNITID, against the original lookup of one school at a time.
+
+import pandas as pd
+import lib
+import reference
+
+# Ranks as ints, with None where there is none ("" in the original table, <NA> now).
+def ranks(values) -> list:
+    return [None if value is pd.NA or value == "" else int(value) for value in values]
+
+def table(year: int, n: int) -> pd.DataFrame:
+    df = lib.getTopNDF(n, "NPT43_PUB", year, 0, False)
+    return pd.DataFrame({
+        "Our Ranking":df["Our Ranking"],
+        "US News Ranking":pd.NA,
+        "University Name":df["INSTNM"].tolist(),
+        "UNITID":df["UNITID"].to_list()
+    })
+
+def test_matches_original(original):
+    for year in [2009, 2013, 2018]:
+        for n in [0, 40]:
+            ourTableDF = table(year, n)
+            expected = reference.usnewsColumn(ourTableDF, original["usnews" + str(year)])
+            result = lib.joinUSNews(ourTableDF, year)
+            assert ranks(result["US News Ranking"]) == ranks(expected["US News Ranking"])
+            assert result["UNITID"].tolist() == expected["UNITID"].tolist()
+
+def test_several_years(data):
+    ourTableDF = table(2015, 0)
+    result = lib.joinUSNews(ourTableDF, [2014, 2015])
+    for year in [2014, 2015]:
+        assert ranks(result["US News Ranking " + str(year)]) == ranks(lib.joinUSNews(ourTableDF, year)["US News Ranking"])
+
+def test_leaves_table_alone(data):
+    ourTableDF = table(2012, 10)
+    lib.joinUSNews(ourTableDF, 2012)
+    assert ourTableDF["US News Ranking"].isna().all()
@@ -0,0 +1,74 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# The US News workbook compiled into a year x UNITID rank matrix, against the original per-year tables.
+
+import os
+import numpy as np
+import pandas as pd
+import lib
+import reference
+
+def test_tables_match_original(original):
+    for year in range(lib.yearStart, lib.yearEnd + 1):
+        expected = original["usnews" + str(year)]
+        pd.testing.assert_frame_equal(lib.usnewstable(year), expected, check_dtype=False)
+        pd.testing.assert_frame_equal(reference.plain(lib.dframes["usnews" + str(year)]), reference.plain(expected))
+
+def test_rank_lookup_matches_original(original):
+    USNewsDF = original["usnews2014"]
+    for unitid in USNewsDF["UNITID"].head(30):
+        expected = USNewsDF.query("UNITID==" + str(unitid))["US News Ranking"].to_list()[0]
+        result = lib.usnewsRank(unitid, 2014)
+        assert (np.isnan(result) and np.isnan(expected)) or result == expected
+    assert np.isnan(lib.usnewsRank(1, 2014))
+    assert np.isnan(lib.usnewsRank(USNewsDF["UNITID"].iloc[0], 1950))
+
+def test_compile_edge_cases(tmp_path):
+    workbookfile = str(tmp_path / "workbook.xlsx")
+    pd.DataFrame({
+        "University Name":["Alpha", "Beta", "No Id", "Alpha Again", "Gamma"],
+        "UNITID":[101, 102, np.nan, 101, 103],
+        2010:[1, np.nan, 5, 9, 3],
+        2012:[2.5, 4, 6, 8, np.nan]
+    }).to_excel(workbookfile, index=False)
+    extrafile = str(tmp_path / "extra.xlsx")
+    pd.DataFrame({
+        "Rank Note":[1, 2, 3],
+        "School":["Beta", "Gamma", "Delta"],
+        2012:[11, 12, 13],
+        2013:[21, 22, 23]
+    }).to_excel(extrafile, index=False)
+
+    matrix = lib.compileusnews(workbookfile, extrafile)
+    assert matrix["years"].tolist() == [2010, 2011, 2012]
+    assert matrix["unitids"].tolist() == [101, 102, 101, 103]
+    assert matrix["names"].tolist() == ["Alpha", "Beta", "Alpha Again", "Gamma"]
+    np.testing.assert_array_equal(matrix["ranks"], np.array([
+        [1, np.nan, 2.5],
+        [np.nan, np.nan, 4],   # The extra workbook only fills blanks.
+        [9, np.nan, 8],
+        [3, np.nan, 12]
+    ], dtype=np.float32))
+    assert matrix["unmatched"] == 1
+
+    cachefile = str(tmp_path / lib.usnewsmatrixname)
+    lib.writeusnews(matrix, cachefile)
+    assert sorted(os.listdir(tmp_path)) == sorted(["workbook.xlsx", "extra.xlsx", lib.usnewsmatrixname])
+    with np.load(cachefile, allow_pickle=False) as data:
+        np.testing.assert_array_equal(data["ranks"], matrix["ranks"])
+
+# A UNITID listed twice is ranked by its first row, as the original lookup did.
+def test_first_row_wins(fresh):
+    workbook = pd.read_excel(fresh["paths"]["usnews"])
+    workbook.loc[0, 2015] = 7.0
+    duplicate = workbook.iloc[[0]].copy()
+    duplicate[2015] = 999.0
+    pd.concat([workbook, duplicate], ignore_index=True).to_excel(fresh["paths"]["usnews"], index=False)
+    report = lib.loadschema(reload=True)
+    assert [entry["reason"] for entry in report if entry["name"] == "usnews"] == ["source changed"]
+    unitid = int(workbook["UNITID"].iloc[0])
+    assert lib.usnewsRanks(2015)[unitid] == 7
+    assert lib.usnewsRank(unitid, 2015) == 7.0
@@ -0,0 +1,32 @@
+# Wesley Fegan
+# CS450
+
+# School Ranking Project
+
+# Page 2's multi-variable ranking, scored for every school at once, against the original per-school loop.
+
+import pandas as pd
+import pytest
+import lib
+import reference
+
+weightSets = [
+    {"NPT41_PUB":0.5, "NPT42_PUB":0.5, "NPT43_PUB":0.5, "NPT44_PUB":0.5, "NPT45_PUB":0.5},
+    {"NPT45_PUB":0.9, "NPT41_PUB":0.13, "NPT43_PUB":0.42},
+    {"NPT42_PUB":1.0},
+    {}
+]
+
+@pytest.mark.parametrize("weights", weightSets)
+@pytest.mark.parametrize("maxDeg", [0, 3])
+def test_matches_original(original, weights, maxDeg):
+    for year, n, hide in [(2009, 0, False), (2018, 25, True)]:
+        expected = reference.weightedTopNDF(original, n, weights, year, maxDeg, hide)
+        result = lib.getWeightedTopNDF(n, weights, year, maxDeg, hide)
+        pd.testing.assert_frame_equal(reference.plain(result), reference.plain(expected))
+
+# Changing the weights reuses the normalized params.
+def test_weights_reuse_normalized(data):
+    first = lib.getNormalizedFeatures(2015, 0)
+    lib.getWeightedRankDF(weightSets[1], 2015, 0)
+    assert lib.getNormalizedFeatures(2015, 0) is first